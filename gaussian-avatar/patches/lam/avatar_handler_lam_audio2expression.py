@@ -1,5 +1,4 @@
 import os
-import queue
 import sys
 import time
 from typing import Dict, Optional, cast, List
@@ -17,13 +16,62 @@ from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_engine_config_data import HandlerBaseConfigModel, ChatEngineConfigModel
 from chat_engine.data_models.runtime_data.data_bundle import DataBundleDefinition, DataBundleEntry, DataBundle
 from engine_utils.directory_info import DirectoryInfo
-from engine_utils.general_slicer import SliceContext, slice_data
+
+from .pipeline import InferenceExecutor
+from .slicing import AdaptiveSliceContext
 
 
 class AvatarLAMConfig(HandlerBaseConfigModel, BaseModel):
     model_name: str = "LAM_audio2exp"
     feature_extractor_model_name: str = "wav2vec2-base-960h"
     audio_sample_rate: int = Field(default=24000)
+    # cross-session micro-batching of forward passes (1 = off); once a slice is pending, the forward stage
+    # waits up to inference_batch_wait_ms for the other sessions' slices
+    inference_batch_size: int = Field(default=1)
+    inference_batch_wait_ms: float = Field(default=8.0)
+    # reuse wav2vec2 conv features of the overlapping window prefix. Approximate: features within ~3% of a full
+    # encode, expression within ~0.015 blendshape units (measured on stand-in weights, see feature_cache.py)
+    incremental_features: bool = Field(default=False)
+    # input slice lengths in seconds, restarting with every speech; the last one repeats.
+    # [1.0] is fixed one-second slicing, e.g. [0.3, 0.6, 1.0] gets the first motion out after 0.3 s
+    slice_schedule: List[float] = Field(default=[1.0])
+    # preallocated audio slice buffers per session, reused round-robin: a slice (also the avatar_audio of
+    # its bundle) stays valid for this many slices, at least inference_queue_size + 2
+    slice_ring_size: int = Field(default=16)
+    # run slices on a dedicated forward / post-processing / output pipeline instead of the handler thread;
+    # the forward stage batches up to inference_batch_size sessions
+    inference_executor: bool = Field(default=True)
+    # slices a session may have in the pipeline before handle() blocks
+    inference_queue_size: int = Field(default=4)
+    # stage histograms, per-session RTF and queue depth (engines/metrics.py):
+    # pulled from http://<host>:<metrics_port>/metrics (0 = off) and/or dumped as JSON every interval
+    metrics_port: int = Field(default=0)
+    metrics_dump_path: Optional[str] = Field(default=None)
+    metrics_dump_interval: float = Field(default=10.0)
+    # Unix socket of a shared model process (engines/model_server.py); when set, this handler loads no
+    # model and each session keeps its streaming context on the server. Batching then happens server-side:
+    # the local inference executor and its settings (inference_executor, inference_batch_*,
+    # inference_queue_size) are bypassed and slices are sent from handle() one at a time.
+    # A session whose connection breaks (server restart) reconnects with a fresh server-side context,
+    # retrying with exponential backoff up to model_server_reconnect_max_s; slices in between get no motion
+    model_server_socket: Optional[str] = Field(default=None)
+    model_server_connect_timeout: float = Field(default=60.0)
+    model_server_reconnect_max_s: float = Field(default=5.0)
+    # "cuda", "cpu" or None (CUDA when available). On CPU the model's linear layers run int8-quantized
+    # (cpu_quantize) with cpu_threads intra-op threads per process (0 = torch default). The int8 weights
+    # are per process; with cpu_quantize off every weight page of the mapped checkpoint is shared
+    device: Optional[str] = Field(default=None)
+    cpu_threads: int = Field(default=0)
+    cpu_quantize: bool = Field(default=True)
+    # also attach each slice's frames as a compact motion packet (engines/motion_codec.py, 8 or 16 bit)
+    # in the "arkit_face_packed" meta, for clients that decode it; the float32 arkit_face entry is unchanged
+    arkit_face_packed: bool = Field(default=False)
+    arkit_face_packed_bits: int = Field(default=8)
+    # LRU of post-processed frames for slices repeating from a speech start (greetings, fillers), in MiB;
+    # blinks are added per session on top. 0 = off
+    expression_cache_mb: float = Field(default=32.0)
+    # forward batch sizes to warm up at load; None = every size up to inference_batch_size
+    warmup_batch_sizes: Optional[List[int]] = Field(default=None)
 
 
 class AvatarLAMContext(HandlerContext):
@@ -31,14 +79,37 @@ class AvatarLAMContext(HandlerContext):
         super().__init__(session_id)
         self.config: Optional[AvatarLAMConfig] = None
         self.inference_context = None
-        self.input_slice_context: Optional[SliceContext] = None
+        self.input_slice_context: Optional[AdaptiveSliceContext] = None
         self.last_speech_id: Optional[str] = None
+        self.model_client = None  # ModelClient when the model runs in a shared model server
+        self.model_client_retry_at = 0.0  # monotonic time of the next reconnect attempt
+        self.model_client_backoff = 0.0  # seconds until the attempt after that
+        self.motion_encoder = None  # MotionEncoder when arkit_face_packed is on
+
+
+class LAMSliceJob:
+    __slots__ = ("context", "audio", "speech_id", "speech_end", "speech_text", "output_definition", "t_start",
+                 "compute")
+
+    def __init__(self, context: AvatarLAMContext, audio: np.ndarray, speech_id, speech_end: bool,
+                 speech_text: Optional[str], output_definition: DataBundleDefinition):
+        self.context = context
+        self.audio = audio
+        self.speech_id = speech_id
+        self.speech_end = speech_end
+        self.speech_text = speech_text
+        self.output_definition = output_definition
+        self.t_start = time.monotonic()
+        self.compute = 0.0  # seconds spent on this slice across stages, for the session RTF
 
 
 class HandlerAvatarLAM(HandlerBase):
     def __init__(self):
         super().__init__()
         self.infer = None
+        self.executor: Optional[InferenceExecutor] = None
+        self.metrics = None
+        self.model_server_socket: Optional[str] = None
         self.arkit_channels: List[str] = []
 
     def get_handler_info(self) -> HandlerBaseInfo:
@@ -56,6 +127,29 @@ class HandlerAvatarLAM(HandlerBase):
             default_config_parser,
             default_setup,
         )
+        from .LAM_Audio2Expression.engines.metrics import METRICS
+        self.metrics = METRICS
+        if handler_config.metrics_port:
+            METRICS.serve(handler_config.metrics_port)
+            logger.info(f"LAM metrics at http://0.0.0.0:{handler_config.metrics_port}/metrics")
+        if handler_config.metrics_dump_path:
+            METRICS.start_dump(handler_config.metrics_dump_path, handler_config.metrics_dump_interval)
+        arkit_channel_list_path = os.path.join(self.handler_root, "assets", "arkit_face_channels.txt")
+        self.arkit_channels.clear()
+        for line in open(arkit_channel_list_path, "r"):
+            self.arkit_channels.append(line.strip())
+
+        if handler_config.model_server_socket:
+            from .LAM_Audio2Expression.engines.model_server import ModelClient
+            # waits for the server to come up, the model stays (and is warmed up) there
+            client = ModelClient(handler_config.model_server_socket,
+                                 connect_timeout=handler_config.model_server_connect_timeout)
+            client.ping()
+            client.close()
+            self.model_server_socket = handler_config.model_server_socket
+            logger.info(f"LAM using shared model server at {self.model_server_socket}")
+            return
+
         from .LAM_Audio2Expression.engines.infer import INFER
         project_dir = DirectoryInfo.get_project_dir()
         model_path = os.path.join(project_dir, engine_config.model_root, handler_config.model_name)
@@ -73,6 +167,9 @@ class HandlerAvatarLAM(HandlerBase):
 
         cfg = default_config_parser(config_file, {
             "weight": weight_path,
+            "device": handler_config.device,
+            "cpu_threads": handler_config.cpu_threads,
+            "cpu_quantize": handler_config.cpu_quantize,
             "model": {
                 "backbone": {
                     "pretrained_encoder_path": wav2vec_path,
@@ -83,23 +180,33 @@ class HandlerAvatarLAM(HandlerBase):
         cfg = default_setup(cfg)
         self.infer = INFER.build(dict(type=cfg.infer.type, cfg=cfg))
         self.infer.model.eval()
-        # FP16 inference is handled via torch.amp.autocast in patched infer.py
-        logger.info("LAM model loaded (FP16 autocast enabled in inference)")
-        arkit_channel_list_path = os.path.join(self.handler_root, "assets", "arkit_face_channels.txt")
-        self.arkit_channels.clear()
-        for line in open(arkit_channel_list_path, "r"):
-            self.arkit_channels.append(line.strip())
+        if handler_config.inference_executor:
+            self.executor = InferenceExecutor(
+                self._forward_slices, self._postprocess_slice, self._output_slice,
+                max_batch_size=handler_config.inference_batch_size,
+                max_wait_ms=handler_config.inference_batch_wait_ms,
+                queue_size=handler_config.inference_queue_size,
+                on_error=lambda stage, job, e: logger.opt(exception=e).error(f"LAM {stage} stage failed: {e}"),
+            )
+        else:
+            self.infer.enable_batching(max_batch_size=handler_config.inference_batch_size,
+                                       max_wait_ms=handler_config.inference_batch_wait_ms)
+        self.infer.enable_incremental_features(handler_config.incremental_features)
+        cache = self.infer.enable_expression_cache(handler_config.expression_cache_mb)
+        if cache is not None:
+            METRICS.add_collector("expression_cache", cache.stats)
+        # FP16 autocast on CUDA, int8 dynamic quantization on CPU (engines/device.py)
+        logger.info(f"LAM model loaded on {self.infer.device}")
 
-        t_start = time.monotonic()
-        # warmup the model (use float32 input — model internally handles dtype)
-        context: Optional[Dict] = None
-        self.infer.infer_streaming_audio(
-            context=context,
-            audio=np.zeros([handler_config.audio_sample_rate], dtype=np.float32),
-            ssr=handler_config.audio_sample_rate,
-        )
-        dur_warmup = time.monotonic() - t_start
-        logger.info(f"LAM_Audio2Expression warmup finished in {dur_warmup * 1000} milliseconds.")
+        # warm up every slice the handler produces: the scheduled slices (initial, then continuations),
+        # a flush tail off the slice grid and the end-of-speech marker, then each forward batch size
+        sample_rate = handler_config.audio_sample_rate
+        slice_sizes = AdaptiveSliceContext(sample_rate, handler_config.slice_schedule).sizes
+        chunk_samples = slice_sizes + [slice_sizes[-1], slice_sizes[0] // 2 + 1, 50]
+        batch_sizes = handler_config.warmup_batch_sizes or range(1, max(handler_config.inference_batch_size, 1) + 1)
+        timings = self.infer.warmup(sample_rate, chunk_samples, batch_sizes)
+        logger.info(f"LAM_Audio2Expression warmup finished in {sum(t for _, t in timings) * 1000:.0f} milliseconds: "
+                    + ", ".join(f"{shape} {t * 1000:.1f} ms" for shape, t in timings))
 
     def create_context(self, session_context: SessionContext,
                        handler_config: Optional[HandlerBaseConfigModel] = None) -> HandlerContext:
@@ -108,10 +215,17 @@ class HandlerAvatarLAM(HandlerBase):
         context = AvatarLAMContext(session_context.session_info.session_id)
 
         context.config = handler_config
-        context.input_slice_context = SliceContext.create_numpy_slice_context(
-            slice_size=round(handler_config.audio_sample_rate * 1.0),
-            slice_axis=0,
+        context.input_slice_context = AdaptiveSliceContext(
+            sample_rate=handler_config.audio_sample_rate,
+            schedule=handler_config.slice_schedule,
+            # slices in the executor, plus the one being submitted and the one held back
+            ring_slices=max(handler_config.slice_ring_size, handler_config.inference_queue_size + 2),
         )
+        if handler_config.arkit_face_packed:
+            from .LAM_Audio2Expression.engines.motion_codec import MotionEncoder
+            context.motion_encoder = MotionEncoder(self.arkit_channels, bits=handler_config.arkit_face_packed_bits)
+        if self.model_server_socket is not None:
+            self._connect_model_server(context, handler_config.model_server_connect_timeout)
         return context
 
     def get_handler_detail(self, session_context: SessionContext, context: HandlerContext) -> HandlerDetail:
@@ -159,50 +273,145 @@ class HandlerAvatarLAM(HandlerBase):
         speech_text = inputs.data.get_meta("avatar_speech_text")
 
         audio = inputs.data.get_main_data()
-        audio_segments = queue.Queue()
-        for audio_segment in slice_data(context.input_slice_context, audio.squeeze()):
-            audio_segments.put_nowait(audio_segment)
-        if speech_end:
-            end_segment = context.input_slice_context.flush()
-            if end_segment is not None:
-                audio_segments.put_nowait(end_segment)
-        if audio_segments.empty() and speech_end:
-            audio_segments.put_nowait(np.zeros([50], dtype=np.float32))
-        while not audio_segments.empty():
-            t_start = time.monotonic()
-            audio_segment = audio_segments.get_nowait()
+        # slices are views of the session's slice ring, handed on to the model and the bundle without a copy
+        for audio_segment, need_flush in context.input_slice_context.slice_speech(audio.squeeze(), speech_end):
+            job = LAMSliceJob(context, audio_segment, speech_id, need_flush, speech_text, output_definition)
+            if self.model_server_socket is not None:
+                expression = self._infer_remote(context, audio_segment, need_flush)
+                job.compute = time.monotonic() - job.t_start
+                self._output_slice(job, expression)
+                continue
+            if self.executor is not None:
+                # blocks while the session already has inference_queue_size slices in flight
+                self.executor.submit(id(context), job)
+                self.metrics.set_queue_depth(context.session_id, self.executor.depth(id(context)))
+                continue
             result, context_update = self.infer.infer_streaming_audio(
                 audio=audio_segment,
                 ssr=context.config.audio_sample_rate,
                 context=context.inference_context,
+                speech_end=need_flush,
             )
-            context.inference_context = context_update
-            need_flush = speech_end and audio_segments.empty()
-            if need_flush:
-                context.inference_context = None
-            output = DataBundle(output_definition)
-            arkit_data = result.get("expression")
-            if arkit_data is None:
-                continue
+            job.compute = time.monotonic() - job.t_start
+            context.inference_context = None if need_flush else context_update
+            self._output_slice(job, result.get("expression"))
+
+    def _connect_model_server(self, context: AvatarLAMContext, connect_timeout: float = 0.0) -> bool:
+        """Opens the session's model server connection, backing off after failed attempts."""
+        from .LAM_Audio2Expression.engines.model_server import ModelClient
+        try:
+            context.model_client = ModelClient(self.model_server_socket, connect_timeout=connect_timeout)
+        except OSError as e:
+            context.model_client_backoff = min(max(context.model_client_backoff * 2, 0.2),
+                                               context.config.model_server_reconnect_max_s)
+            context.model_client_retry_at = time.monotonic() + context.model_client_backoff
+            logger.warning(f"LAM model server unreachable ({e}), retrying in {context.model_client_backoff:.1f} s")
+            return False
+        context.model_client_backoff = 0.0
+        return True
+
+    def _infer_remote(self, context: AvatarLAMContext, audio: np.ndarray, speech_end: bool) -> Optional[np.ndarray]:
+        """Runs one slice on the shared model server, reconnecting after the connection broke.
+
+        A new connection is a new session on the server, so the speech continues from a fresh
+        streaming context (its next window starts silence-padded).
+        """
+        if context.model_client is None:
+            if time.monotonic() < context.model_client_retry_at or not self._connect_model_server(context):
+                return None
+            logger.info(f"LAM reconnected to model server at {self.model_server_socket}")
+        try:
+            return context.model_client.infer(audio, context.config.audio_sample_rate, speech_end=speech_end)
+        except (EOFError, OSError) as e:
+            logger.error(f"Error: lost the LAM model server connection: {e}")
+            context.model_client.close()
+            context.model_client = None
+            self._connect_model_server(context)
+        except Exception as e:
+            logger.error(f"Error: model server failed to predict expression: {e}")
+        return None
+
+    def _forward_slices(self, jobs: List[LAMSliceJob]) -> List:
+        """Executor forward stage: one slice per session, stacked into one forward pass."""
+        t_start = time.monotonic()
+        steps = []
+        for job in jobs:
+            context = job.context
+            step = self.infer.prepare_streaming_audio(job.audio, context.config.audio_sample_rate,
+                                                      context.inference_context, job.speech_end)
+            # the next speech starts from a fresh inference context
+            context.inference_context = None if job.speech_end else step.context
+            steps.append(step)
+        try:
+            # slices served from the expression cache are left out of the batch
+            pred_exp = self.infer.forward_steps(steps)
+        except Exception as e:
+            logger.error(f"Error: failed to predict expression: {e}")
+            pred_exp = [None] * len(steps)
+        share = (time.monotonic() - t_start) / len(jobs)
+        for job in jobs:
+            job.compute += share
+        return list(zip(steps, pred_exp))
 
-            start_of_stream = speech_id != context.last_speech_id
-
-            output.set_main_data(arkit_data.astype(np.float32))
-            output.set_data("avatar_audio", audio_segment[np.newaxis, ...])
-            output.add_meta("speech_id", speech_id)
-            output.add_meta("avatar_speech_end", need_flush)
-            output.start_of_stream = start_of_stream
-            output.end_of_stream = need_flush
-            if speech_text is not None:
-                output.add_meta("avatar_speech_text", speech_text)
-            dur_inference = time.monotonic() - t_start
-            logger.info(f"Inference on {audio_segment.shape[-1] / context.config.audio_sample_rate:.2f} second audio "
-                        f"finished in {dur_inference * 1000} milliseconds. Got output: {str(output)}")
-            context.submit_data(output)
-
-            context.last_speech_id = speech_id
-            if need_flush:
-                context.last_speech_id = None
+    def _postprocess_slice(self, job: LAMSliceJob, forwarded) -> Optional[np.ndarray]:
+        """Executor post-processing stage: NumPy smoothing, blending and blinks of one slice."""
+        if forwarded is None:
+            return None
+        step, pred_exp = forwarded
+        t_start = time.monotonic()
+        result, _ = self.infer.finish_streaming_audio(step, pred_exp)
+        job.compute += time.monotonic() - t_start
+        return result.get("expression")
+
+    def _output_slice(self, job: LAMSliceJob, arkit_data: Optional[np.ndarray]):
+        """Executor output stage: builds and submits the DataBundle, in slice order per session."""
+        context = job.context
+        if arkit_data is None:
+            return
+
+        t_start = time.monotonic()
+        start_of_stream = job.speech_id != context.last_speech_id
+
+        output = DataBundle(job.output_definition)
+        # post-processing returns C-contiguous float32 frames and job.audio is a float32 view of the
+        # session's slice ring (its only copy of the audio): neither is copied again here
+        output.set_main_data(np.ascontiguousarray(arkit_data, dtype=np.float32))
+        output.set_data("avatar_audio", job.audio[np.newaxis, ...])
+        output.add_meta("speech_id", job.speech_id)
+        output.add_meta("avatar_speech_end", job.speech_end)
+        output.start_of_stream = start_of_stream
+        output.end_of_stream = job.speech_end
+        if job.speech_text is not None:
+            output.add_meta("avatar_speech_text", job.speech_text)
+        if context.motion_encoder is not None:
+            # each speech starts with a keyframe, so a client can join at any stream start
+            output.add_meta("arkit_face_packed", context.motion_encoder.encode(arkit_data, keyframe=start_of_stream))
+        dur_inference = time.monotonic() - job.t_start
+        # formatted only if INFO is enabled
+        logger.opt(lazy=True).info("Inference on {:.2f} second audio finished in {:.1f} milliseconds. Got output: {}",
+                                   lambda: job.audio.shape[-1] / context.config.audio_sample_rate,
+                                   lambda: dur_inference * 1000,
+                                   lambda: str(output))
+        context.submit_data(output)
+        dur_submit = time.monotonic() - t_start
+        self.metrics.observe("submit", dur_submit)
+        self.metrics.observe("slice_latency", dur_inference + dur_submit)
+        self.metrics.record_slice(context.session_id, job.audio.shape[-1] / context.config.audio_sample_rate,
+                                  job.compute + dur_submit)
+        if self.executor is not None:
+            # this slice still counts until the output stage returns
+            self.metrics.set_queue_depth(context.session_id, self.executor.depth(id(context)) - 1)
+
+        context.last_speech_id = job.speech_id
+        if job.speech_end:
+            context.last_speech_id = None
 
     def destroy_context(self, context: HandlerContext):
-        pass
+        if self.executor is not None:
+            self.executor.close_session(id(context))
+        if self.metrics is not None:
+            self.metrics.drop_session(context.session_id)
+        context = cast(AvatarLAMContext, context)
+        if context.model_client is not None:
+            context.model_client.close()
+            context.model_client = None
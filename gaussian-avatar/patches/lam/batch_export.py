@@ -0,0 +1,193 @@
+"""Batch audio -> blendshape JSON export for many files with one model load.
+
+Mounted next to ``infer.py`` (``engines/batch_export.py``). The helpers here
+only need numpy/librosa; the model side is
+:meth:`Audio2ExpressionInfer.export_batch`. Run inside the container from the
+LAM_Audio2Expression directory::
+
+    python -m engines.batch_export --input clips/ --output-dir exports/
+    python -m engines.batch_export --input manifest.txt --output-dir exports/ --workers 8
+
+A manifest is a text file with one audio path per line, optionally followed
+by a tab and the output JSON path, or a ``.jsonl`` file of
+``{"audio": ..., "output": ...}`` objects. Relative paths are resolved against
+the manifest's directory.
+
+Each finished file is appended to ``.export_index.jsonl`` in the output
+directory together with a key derived from the audio content and the export
+settings; files whose output exists with the same key are skipped.
+
+``--format lamm`` writes the compact motion format (motion_codec.py) instead
+of JSON; manifest outputs ending in ``.lamm`` are written that way regardless.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".m4a", ".aac", ".opus")
+INDEX_NAME = ".export_index.jsonl"
+
+
+class ExportJob(NamedTuple):
+    audio_path: str
+    output_path: str
+
+
+class DecodedClip(NamedTuple):
+    job: ExportJob
+    key: str
+    audio: Optional[np.ndarray]  # None when the output is up to date
+    decode_time: float
+
+
+def collect_jobs(source: str, output_dir: str, extension: str = ".json") -> List[ExportJob]:
+    """Lists the export jobs for an audio directory (recursive) or a manifest file.
+
+    ``extension`` names outputs that are not given explicitly (".json" or ".lamm").
+    """
+    if os.path.isdir(source):
+        jobs = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    rel = os.path.splitext(os.path.relpath(path, source))[0] + extension
+                    jobs.append(ExportJob(path, os.path.join(output_dir, rel)))
+        return sorted(jobs)
+
+    base = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if source.endswith(".jsonl"):
+                entry = json.loads(line)
+                audio, output = entry["audio"], entry.get("output")
+            else:
+                audio, _, output = line.partition("\t")
+                output = output.strip() or None
+            audio = os.path.join(base, audio)
+            if output is None:
+                output = os.path.join(output_dir, os.path.splitext(os.path.basename(audio))[0] + extension)
+            else:
+                output = os.path.join(base, output)
+            jobs.append(ExportJob(audio, output))
+    return jobs
+
+
+def settings_fingerprint(settings: Dict) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_index(output_dir: str) -> Dict[str, str]:
+    """Output path -> key of the last successful export (later lines win)."""
+    index = {}
+    path = os.path.join(output_dir, INDEX_NAME)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of an interrupted run
+                index[entry["output"]] = entry["key"]
+    return index
+
+
+def decode_clip(job: ExportJob, sample_rate: int, fingerprint: str, known_key: Optional[str]) -> DecodedClip:
+    """Process-pool worker: hashes the file and, unless up to date, decodes it.
+
+    The key covers the file bytes and the export settings, so changing the
+    weights or post-processing flags re-exports everything.
+    """
+    import librosa
+
+    start = time.time()
+    digest = hashlib.sha256(fingerprint.encode())
+    with open(job.audio_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    key = digest.hexdigest()
+    if key == known_key and os.path.exists(job.output_path):
+        return DecodedClip(job, key, None, time.time() - start)
+    audio, _ = librosa.load(job.audio_path, sr=sample_rate)
+    return DecodedClip(job, key, audio.astype(np.float32), time.time() - start)
+
+
+def equal_length_groups(clips: Iterable[DecodedClip], batch_size: int) -> List[List[DecodedClip]]:
+    """Groups clips of identical length (up to ``batch_size``) so they share one forward pass."""
+    groups: Dict[int, List[DecodedClip]] = {}
+    for clip in clips:
+        groups.setdefault(clip.audio.shape[0], []).append(clip)
+    batches = []
+    for same in groups.values():
+        for i in range(0, len(same), batch_size):
+            batches.append(same[i:i + batch_size])
+    return batches
+
+
+class ExportIndex:
+    """Append-only record of finished exports, flushed per file so an
+    interrupted run resumes where it stopped."""
+
+    def __init__(self, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        self._file = open(os.path.join(output_dir, INDEX_NAME), "a")
+
+    def add(self, output_path: str, key: str):
+        self._file.write(json.dumps({"output": output_path, "key": key}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def summarize(results: List[Dict]) -> Tuple[int, int, int]:
+    exported = sum(r["status"] == "exported" for r in results)
+    skipped = sum(r["status"] == "skipped" for r in results)
+    failed = sum(r["status"] == "failed" for r in results)
+    return exported, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export blendshape animation JSON for many audio files.")
+    parser.add_argument("--input", required=True, help="audio directory or manifest (.txt / .jsonl)")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config.py")
+    parser.add_argument("--weight", default="pretrained_models/lam_audio2exp.tar")
+    parser.add_argument("--device", default=None, help="cuda / cpu (default: CUDA when available)")
+    parser.add_argument("--cpu-threads", type=int, default=0, help="intra-op threads on CPU (0 = torch default)")
+    parser.add_argument("--workers", type=int, default=4, help="decode/resample processes")
+    parser.add_argument("--batch-size", type=int, default=8, help="max equal-length clips per forward pass")
+    parser.add_argument("--force", action="store_true", help="re-export even if up to date")
+    parser.add_argument("--id-idx", type=int, default=None, help="identity index (config default if unset)")
+    parser.add_argument("--format", choices=("json", "lamm"), default="json",
+                        help="export JSON or the compact .lamm motion format")
+    parser.add_argument("--motion-bits", type=int, choices=(8, 16), default=8, help=".lamm quantization")
+    args = parser.parse_args()
+
+    from .defaults import default_config_parser, default_setup
+    from .infer import INFER
+
+    options = {"weight": args.weight, "save_path": args.output_dir,
+               "device": args.device, "cpu_threads": args.cpu_threads, "motion_bits": args.motion_bits}
+    if args.id_idx is not None:
+        options["id_idx"] = args.id_idx
+    cfg = default_setup(default_config_parser(args.config_file, options))
+    infer = INFER.build(dict(type=cfg.infer.type, cfg=cfg))
+    results = infer.export_batch(collect_jobs(args.input, args.output_dir, "." + args.format), args.output_dir,
+                                 num_workers=args.workers, batch_size=args.batch_size, force=args.force)
+    _, _, failed = summarize(results)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
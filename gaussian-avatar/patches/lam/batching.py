@@ -0,0 +1,108 @@
+"""Cross-session micro-batching for LAM Audio2Expression.
+
+Mounted next to ``infer.py`` (``engines/batching.py``). Independent of torch:
+the forward function is injected, so the scheduler can be exercised on CPU
+with a stand-in model.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Hashable, List, Optional
+
+import numpy as np
+
+# forward(windows [B, num_samples], keys [B]) -> predictions [B, ...]
+BatchForward = Callable[[np.ndarray, List[Hashable]], np.ndarray]
+
+
+class _Request:
+    __slots__ = ("window", "key", "future")
+
+    def __init__(self, window: np.ndarray, key: Hashable):
+        self.window = window
+        self.key = key
+        self.future = Future()
+
+
+class MicroBatcher:
+    """Collects equal-length audio windows from concurrent sessions and runs
+    them through the model as one batch.
+
+    Callers block in :meth:`submit` until their row of the batch is ready.
+    A single worker thread owns the model: it takes the first pending window,
+    waits up to ``max_wait_ms`` for more (or until ``max_batch_size`` are
+    queued), stacks them and fans the prediction rows back out.
+    """
+
+    def __init__(self,
+                 forward: BatchForward,
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 8.0,
+                 name: str = "lam-batcher"):
+        self.forward = forward
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, window: np.ndarray, key: Hashable = None, timeout: Optional[float] = None) -> np.ndarray:
+        """Queues one window and returns its prediction row."""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        request = _Request(window, key)
+        self._requests.put(request)
+        return request.future.result(timeout=timeout)
+
+    def close(self):
+        self._closed = True
+        self._requests.put(None)
+        self._worker.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._requests.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            # windows should all be 64 frames long, but never stack mismatched shapes
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.window.shape, []).append(request)
+            for requests in groups.values():
+                self._run_batch(requests)
+
+    def _run_batch(self, requests: List[_Request]):
+        try:
+            if len(requests) == 1:
+                windows = requests[0].window[np.newaxis, ...]
+            else:
+                windows = np.stack([request.window for request in requests])
+            predictions = self.forward(windows, [request.key for request in requests])
+        except Exception as e:
+            # surfaced to every caller, which logs it like an unbatched failure
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        for row, request in enumerate(requests):
+            request.future.set_result(predictions[row])
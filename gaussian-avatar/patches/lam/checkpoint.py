@@ -0,0 +1,141 @@
+"""Fast, page-shared checkpoint loading for ``InferBase.build_model``.
+
+Mounted next to ``infer.py`` (``engines/checkpoint.py``).
+
+The released ``.tar`` checkpoint is converted once to a ``.safetensors`` file
+next to it (keys stored without the DDP ``module.`` prefix). Later loads
+memory-map that file: tensors are backed by the page cache, so worker
+processes share one copy of the weights instead of each holding a private
+one, and nothing is deserialized. When conversion is not possible (read-only
+model directory, safetensors missing) the original checkpoint is still
+memory-mapped through ``torch.load(mmap=True)``.
+
+Convert ahead of time with::
+
+    python -m engines.checkpoint pretrained_models/lam_audio2exp_streaming.tar
+"""
+
+import argparse
+import os
+from typing import Iterator, Mapping, Optional, Tuple
+
+import torch
+
+DDP_PREFIX = "module."
+
+
+class PrefixedStateDict(Mapping):
+    """Read-only view of a state dict with the ``module.`` prefix normalised.
+
+    Keys are rewritten on access rather than by building a second dict, so the
+    tensors (possibly memory-mapped) are never touched here.
+    """
+
+    def __init__(self, state: Mapping[str, torch.Tensor], ddp: bool):
+        self.state = state
+        self.ddp = ddp
+        self._source_prefixed = next(iter(state), "").startswith(DDP_PREFIX)
+
+    def _to_source(self, key: str) -> str:
+        if self.ddp:
+            key = key[len(DDP_PREFIX):]
+        return DDP_PREFIX + key if self._source_prefixed else key
+
+    def _from_source(self, key: str) -> str:
+        if self._source_prefixed:
+            key = key[len(DDP_PREFIX):]
+        return DDP_PREFIX + key if self.ddp else key
+
+    def __getitem__(self, key: str) -> torch.Tensor:
+        if self.ddp and not key.startswith(DDP_PREFIX):
+            raise KeyError(key)
+        return self.state[self._to_source(key)]
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._from_source(key) for key in self.state)
+
+    def __len__(self) -> int:
+        return len(self.state)
+
+
+def fast_weight_path(weight: str) -> str:
+    return weight if weight.endswith(".safetensors") else os.path.splitext(weight)[0] + ".safetensors"
+
+
+def _is_fresh(fast_path: str, weight: str) -> bool:
+    if not os.path.isfile(fast_path):
+        return False
+    return fast_path == weight or not os.path.isfile(weight) or os.path.getmtime(fast_path) >= os.path.getmtime(weight)
+
+
+def _load_torch_state(weight: str) -> Mapping[str, torch.Tensor]:
+    try:
+        checkpoint = torch.load(weight, map_location="cpu", mmap=True, weights_only=False)
+    except RuntimeError:
+        # legacy (non-zip) serialization cannot be memory-mapped
+        checkpoint = torch.load(weight, map_location="cpu", weights_only=False)
+    return checkpoint["state_dict"]
+
+
+def convert_checkpoint(weight: str, fast_path: Optional[str] = None) -> str:
+    """Writes the checkpoint's state dict as safetensors without the ``module.`` prefix."""
+    from safetensors.torch import save_file
+
+    fast_path = fast_path or fast_weight_path(weight)
+    tensors = {}
+    seen = set()
+    for key, value in PrefixedStateDict(_load_torch_state(weight), ddp=False).items():
+        # safetensors rejects tensors sharing storage (tied weights); give each its own
+        storage = value.untyped_storage().data_ptr()
+        tensors[key] = value.clone() if storage in seen else value.contiguous()
+        seen.add(storage)
+    tmp_path = f"{fast_path}.{os.getpid()}.tmp"
+    try:
+        save_file(tensors, tmp_path, metadata={"source": os.path.basename(weight)})
+        os.replace(tmp_path, fast_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return fast_path
+
+
+def load_state_dict(weight: str, ddp: bool = False, autoconvert: bool = True,
+                    logger=None) -> Tuple[Mapping[str, torch.Tensor], str]:
+    """Memory-maps the weights of ``weight`` and returns ``(state_dict, source_path)``.
+
+    Args:
+        weight: Checkpoint path (``.tar`` as released, or ``.safetensors``)
+        ddp: Whether the model is DDP-wrapped, i.e. expects ``module.`` keys
+        autoconvert: Convert to safetensors next to the checkpoint if not done yet
+        logger: Optional logger for conversion messages
+
+    Returns:
+        A state dict view suitable for ``load_state_dict`` and the file it maps
+    """
+    fast_path = fast_weight_path(weight)
+    if not _is_fresh(fast_path, weight) and autoconvert and weight != fast_path:
+        try:
+            convert_checkpoint(weight, fast_path)
+            if logger is not None:
+                logger.info(f"=> Converted weight to: {fast_path}")
+        except (ImportError, OSError) as e:
+            if logger is not None:
+                logger.warning(f"=> Could not convert weight to safetensors ({e}), memory-mapping {weight}")
+
+    if _is_fresh(fast_path, weight):
+        from safetensors.torch import load_file
+
+        return PrefixedStateDict(load_file(fast_path, device="cpu"), ddp), fast_path
+    return PrefixedStateDict(_load_torch_state(weight), ddp), weight
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a LAM checkpoint to memory-mappable safetensors.")
+    parser.add_argument("weight")
+    parser.add_argument("output", nargs="?", default=None)
+    args = parser.parse_args()
+    print(convert_checkpoint(args.weight, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Device selection and the CPU inference backend for LAM Audio2Expression.
+
+Mounted next to ``infer.py`` (``engines/device.py``). On GPU nodes nothing
+changes: the model runs on CUDA under FP16 autocast. On CPU-only nodes the
+model stays in float32 (CPU autocast to float16 is slower than float32), its
+``nn.Linear`` layers - the wav2vec2 transformer and the decoder, most of the
+compute - are swapped for int8 dynamically quantized ones, and the torch
+thread pools are sized per worker.
+
+Quantization replaces the linear layers in place, so the memory-mapped
+checkpoint pages (checkpoint.py) of the remaining float weights stay shared
+between worker processes. The int8 linear weights themselves are private to
+each process (about a quarter of their float32 size); set ``cpu_quantize:
+false`` to keep every weight page shared at float32 speed.
+"""
+
+import contextlib
+import warnings
+from typing import Optional
+
+import torch
+
+
+def resolve_device(name: Optional[str] = None) -> torch.device:
+    """Returns the inference device; ``None`` or ``"auto"`` picks CUDA when available."""
+    if name in (None, "", "auto"):
+        name = "cuda" if torch.cuda.is_available() else "cpu"
+    device = torch.device(name)
+    if device.type == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError(f"LAM device '{name}' requested but CUDA is not available")
+    return device
+
+
+def autocast(device: torch.device):
+    """Mixed-precision context for a forward pass on ``device`` (FP16 on CUDA, none on CPU)."""
+    if device.type == "cuda":
+        return torch.amp.autocast("cuda", dtype=torch.float16)
+    return contextlib.nullcontext()
+
+
+def configure_threads(intra_op: int = 0, inter_op: int = 0):
+    """Sizes torch's CPU thread pools (0 keeps the default).
+
+    With several sessions or worker processes per host, one to a few intra-op
+    threads per process usually beats every process spawning a thread per core.
+    """
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # only settable before the first parallel region ran
+            pass
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """int8 dynamic quantization of every ``nn.Linear`` (weights int8, activations quantized per call).
+
+    The wav2vec2 conv feature encoder stays float32, so the incremental
+    feature cache (feature_cache.py) works unchanged on top. ``model`` is
+    modified in place; copying it would duplicate every memory-mapped weight.
+
+    Raises:
+        RuntimeError: When this torch build no longer ships eager dynamic quantization.
+    """
+    quantization = getattr(torch.ao, "quantization", None)
+    if quantization is None or not hasattr(quantization, "quantize_dynamic"):
+        raise RuntimeError(f"torch {torch.__version__} has no torch.ao.quantization.quantize_dynamic")
+    with warnings.catch_warnings():
+        # torch.ao.quantization and the quantized tensor constructors it uses warn that they
+        # are deprecated in favour of torchao; the eager dynamic path is still the one that
+        # packs weights for the fbgemm/onednn int8 kernels, so the warnings are not actionable here
+        warnings.filterwarnings("ignore", message=r"torch\.ao\.quantization is deprecated", category=DeprecationWarning)
+        warnings.filterwarnings("ignore", message=r"torch\.quantize_per_tensor", category=UserWarning)
+        return quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
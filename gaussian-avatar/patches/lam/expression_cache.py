@@ -0,0 +1,85 @@
+"""Content-addressed cache of post-processed streaming expression frames.
+
+Mounted next to ``infer.py`` (``engines/expression_cache.py``); numpy only.
+
+Assistants repeat many identical TTS phrases. A streaming slice's output is
+determined by its audio and by everything the session saw since the start of
+the speech (the model window holds earlier audio, post-processing blends
+with earlier frames), so the key of a slice chains the previous slice's key
+with the new audio: ``key = H(previous key, sample rate, identity, audio)``,
+starting from an empty key at each speech start. Replaying a phrase from the
+start of a speech therefore hits slice after slice.
+
+Entries are the deterministic post-processed frames; random blinks are laid
+over them afterwards, per session, so cached replies still blink naturally.
+"""
+
+import hashlib
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+_KEY_HEADER = struct.Struct("<Ii")
+
+
+def chain_key(previous: bytes, audio: np.ndarray, sample_rate: int, id_idx: int) -> bytes:
+    """Key of a slice given the key of the session's previous slice (b"" at speech start)."""
+    digest = hashlib.blake2b(previous, digest_size=16)
+    digest.update(_KEY_HEADER.pack(int(sample_rate), int(id_idx)))
+    digest.update(np.ascontiguousarray(audio, dtype=np.float32).data)
+    return digest.digest()
+
+
+class ExpressionCache:
+    """Thread-safe LRU of frame arrays, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int = 64 << 20):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        """Returns the cached frames (read-only, shared between sessions) or None."""
+        with self._lock:
+            frames = self._entries.get(key)
+            if frames is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return frames
+
+    def put(self, key: bytes, frames: np.ndarray):
+        frames = np.array(frames, dtype=np.float32)  # own copy: the caller keeps mutating its buffers
+        frames.flags.writeable = False
+        if frames.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self._entries[key] = frames
+            self.bytes += frames.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
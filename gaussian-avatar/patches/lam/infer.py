@@ -19,14 +19,30 @@ import os
 import math
 import time
 import librosa
+import multiprocessing
 import numpy as np
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import torch
 import torch.utils.data
 import torch.nn.functional as F
 
 from .defaults import create_ddp_model
+from .batch_export import (ExportIndex, ExportJob, decode_clip, equal_length_groups, load_index,
+                           settings_fingerprint, summarize)
+from .batching import MicroBatcher
+from .checkpoint import load_state_dict
+from .device import autocast, configure_threads, quantize_dynamic_int8, resolve_device
+from .expression_cache import ExpressionCache, chain_key
+from .feature_cache import CacheRow, IncrementalFeatureEncoder, install_incremental_encoder
+from .metrics import METRICS
+from .motion_codec import MOTION_EXTENSION, MotionFileWriter, write_motion_file
+from .offline import BlendshapeJSONWriter, StreamingSavgol, WindowStitcher, iter_audio_windows
+from .separation import SEPARATORS, speech_check
+from .streaming import StreamingContext, StreamingStep, BlinkScheduler, SavgolKernel, VolumeMeter, MAX_FRAME_LENGTH, \
+    POSTPROCESS_CONTEXT_FRAMES
 import utils.comm as comm
 from models import build_model
 from utils.logger import get_root_logger
@@ -37,7 +53,7 @@ from utils.misc import (
 
 from models.utils import smooth_mouth_movements, apply_frame_blending, apply_savitzky_golay_smoothing, apply_random_brow_movement, \
     symmetrize_blendshapes, apply_random_eye_blinks, apply_random_eye_blinks_context, export_blendshape_animation, \
-    RETURN_CODE, DEFAULT_CONTEXT, ARKitBlendShape
+    RETURN_CODE, ARKitBlendShape
 
 INFER = Registry("infer")
 
@@ -51,6 +67,11 @@ class InferBase:
         self.logger.info("=> Loading config ...")
         self.cfg = cfg
         self.verbose = verbose
+        # "cuda" / "cpu" / unset (CUDA when available)
+        self.device = resolve_device(getattr(cfg, 'device', None))
+        if self.device.type == 'cpu':
+            configure_threads(getattr(cfg, 'cpu_threads', 0), getattr(cfg, 'cpu_interop_threads', 0))
+        self.logger.info(f"=> Inference device: {self.device}")
         if self.verbose:
             self.logger.info(f"Save path: {cfg.save_path}")
             self.logger.info(f"Config:\n{cfg.pretty_text}")
@@ -65,13 +86,28 @@ class InferBase:
         n_parameters = sum(p.numel() for p in model.parameters() if p.requires_grad)
         self.logger.info(f"Num params: {n_parameters}")
         model = create_ddp_model(
-            model.cuda(),
+            model.to(self.device),
             broadcast_buffers=False,
             find_unused_parameters=self.cfg.find_unused_parameters,
         )
-        if os.path.isfile(self.cfg.weight):
+        if os.path.isfile(self.cfg.weight) and getattr(self.cfg, 'weight_mmap', True):
             self.logger.info(f"Loading weight at: {self.cfg.weight}")
-            checkpoint = torch.load(self.cfg.weight)
+            # memory-mapped, converted to safetensors on first use; module. prefix rewritten per key on access
+            weight, source = load_state_dict(self.cfg.weight,
+                                             ddp=comm.get_world_size() > 1,
+                                             autoconvert=getattr(self.cfg, 'weight_autoconvert', True),
+                                             logger=self.logger)
+            # CPU models take the mapped tensors as-is so worker processes share their pages
+            assign = next(model.parameters()).device.type == 'cpu'
+            model.load_state_dict(weight, strict=True, assign=assign)
+            self.logger.info(
+                "=> Loaded weight '{}'".format(
+                    source
+                )
+            )
+        elif os.path.isfile(self.cfg.weight):
+            self.logger.info(f"Loading weight at: {self.cfg.weight}")
+            checkpoint = torch.load(self.cfg.weight, map_location='cpu')
             weight = OrderedDict()
             for key, value in checkpoint["state_dict"].items():
                 if key.startswith("module."):
@@ -89,6 +125,14 @@ class InferBase:
             )
         else:
             raise RuntimeError("=> No checkpoint found at '{}'".format(self.cfg.weight))
+        if self.device.type == 'cpu' and getattr(self.cfg, 'cpu_quantize', True):
+            # in place, so the non-linear weights keep sharing the mapped checkpoint pages;
+            # the int8 linear weights are private to this process
+            try:
+                model = quantize_dynamic_int8(model)
+                self.logger.info("=> Quantized linear layers to int8 for CPU inference")
+            except RuntimeError as e:
+                self.logger.warning(f"=> int8 quantization unavailable, running float32: {e}")
         return model
 
 
@@ -99,6 +143,107 @@ class InferBase:
 
 @INFER.register_module()
 class Audio2ExpressionInfer(InferBase):
+    batcher: Optional[MicroBatcher] = None
+    savgol = SavgolKernel(window_length=5)
+    feature_encoder: Optional[IncrementalFeatureEncoder] = None
+    expression_cache: Optional[ExpressionCache] = None
+    separator = None
+
+    def enable_incremental_features(self,
+                                    enabled: bool = True,
+                                    max_drift: float = 0.03,
+                                    reanchor_every: int = 8) -> bool:
+        """Reuses the wav2vec2 conv features of the overlapping window prefix between streaming chunks.
+
+        Args:
+            enabled: Whether streaming forward passes should use the per-session feature cache
+            max_drift: Relative first-layer GroupNorm statistics drift above which a window is re-encoded in full
+            reanchor_every: Windows after which a full encode is forced regardless of the drift
+
+        Returns:
+            True if the incremental encoder is active
+        """
+        if not enabled:
+            self.feature_encoder = None
+            return False
+        self.feature_encoder = install_incremental_encoder(self.model,
+                                                           max_drift=max_drift,
+                                                           reanchor_every=reanchor_every)
+        if self.feature_encoder is None:
+            self.logger.warning("No wav2vec2 feature encoder found, incremental features disabled")
+        return self.feature_encoder is not None
+
+    def enable_expression_cache(self, max_mb: float = 64.0) -> Optional[ExpressionCache]:
+        """Serves repeated streaming slices (same audio since the speech start) from an LRU cache.
+
+        Args:
+            max_mb: Memory bound of the cached frames in MiB (0 disables the cache)
+
+        Returns:
+            The cache, whose stats() report hits, misses and size
+        """
+        self.expression_cache = ExpressionCache(int(max_mb * 2 ** 20)) if max_mb > 0 else None
+        return self.expression_cache
+
+    def enable_batching(self, max_batch_size: int = 8, max_wait_ms: float = 8.0):
+        """Routes streaming forward passes of all sessions through one MicroBatcher.
+
+        Args:
+            max_batch_size: Maximum number of session windows per forward pass (1 disables batching)
+            max_wait_ms: How long the first queued window waits for others to join its batch
+        """
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = MicroBatcher(self._forward_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def _forward_batch(self, windows: np.ndarray, keys: List[tuple]) -> np.ndarray:
+        # batcher keys are (id_idx, context) pairs
+        return self.forward_windows(windows, [key[0] for key in keys], [key[1] for key in keys])
+
+    def forward_windows(self,
+                        windows: np.ndarray,
+                        id_idx: List[int],
+                        contexts: Optional[List[Optional[StreamingContext]]] = None) -> np.ndarray:
+        """Runs equal-length 16 kHz audio windows through the model in one pass.
+
+        Args:
+            windows: Audio windows [batch, num_samples]
+            id_idx: Identity index per row
+            contexts: Optional streaming context per row, used for the incremental feature cache
+
+        Returns:
+            Predicted expressions [batch, num_frames, num_parameters]
+        """
+        rows = None
+        if self.feature_encoder is not None and contexts is not None:
+            rows = [CacheRow(None, 0) if ctx is None else CacheRow(ctx.feature_cache, ctx.feature_shift)
+                    for ctx in contexts]
+        with torch.no_grad(), autocast(self.device):
+            input_dict = {}
+            input_dict['id_idx'] = F.one_hot(torch.tensor(id_idx),
+                                             self.cfg.model.backbone.num_identity_classes).to(self.device, non_blocking=True)
+            input_dict['input_audio_array'] = torch.from_numpy(windows).to(self.device, non_blocking=True)
+            if rows is not None:
+                self.feature_encoder.rows = rows
+            start = time.perf_counter()
+            try:
+                output_dict = self.model(input_dict)
+            finally:
+                if rows is not None:
+                    self.feature_encoder.rows = None
+            pred_exp = output_dict['pred_exp'].float().cpu().numpy()
+            # .cpu() synchronises, so this covers the whole GPU pass
+            METRICS.observe('forward', time.perf_counter() - start)
+            METRICS.observe_batch_size(windows.shape[0])
+        if rows is not None:
+            for ctx, row in zip(contexts, rows):
+                if ctx is not None:
+                    ctx.feature_cache = row.cache
+                    ctx.feature_shift = 0
+        return pred_exp
+
     def infer(self):
         logger = get_root_logger()
         logger.info(">>>>>>>>>>>>>>>> Start Inference >>>>>>>>>>>>>>>>")
@@ -107,19 +252,21 @@ class Audio2ExpressionInfer(InferBase):
 
         # process audio-input
         assert os.path.exists(self.cfg.audio_input)
-        if(self.cfg.ex_vol):
-            logger.info("Extract vocals ...")
-            vocal_path = self.extract_vocal_track(self.cfg.audio_input)
-            logger.info("=> Extract vocals at: {}".format(vocal_path if os.path.exists(vocal_path) else '... Failed'))
-            if(os.path.exists(vocal_path)):
-                self.cfg.audio_input = vocal_path
+
+        if(getattr(self.cfg, 'window_seconds', None)):
+            self.infer_windowed()
+            logger.info("<<<<<<<<<<<<<<<<< End Evaluation <<<<<<<<<<<<<<<<<")
+            return
 
         with torch.no_grad():
             input_dict = {}
             input_dict['id_idx'] = F.one_hot(torch.tensor(self.cfg.id_idx),
-                                             self.cfg.model.backbone.num_identity_classes).cuda(non_blocking=True)[None,...]
+                                             self.cfg.model.backbone.num_identity_classes).to(self.device, non_blocking=True)[None,...]
             speech_array, ssr = librosa.load(self.cfg.audio_input, sr=16000)
-            input_dict['input_audio_array'] = torch.FloatTensor(speech_array).cuda(non_blocking=True)[None,...]
+            if(self.cfg.ex_vol):
+                logger.info("Extract vocals ...")
+                speech_array = self.extract_vocals(speech_array, ssr)
+            input_dict['input_audio_array'] = torch.FloatTensor(speech_array).to(self.device, non_blocking=True)[None,...]
 
             end = time.time()
             output_dict = self.model(input_dict)
@@ -135,10 +282,25 @@ class Audio2ExpressionInfer(InferBase):
 
         out_exp = output_dict['pred_exp'].squeeze().cpu().numpy()
 
+        pred_exp = self.offline_postprocess(out_exp, speech_array, ssr)
+
+        if(self.cfg.save_json_path is not None):
+            self.write_animation(pred_exp, self.cfg.save_json_path)
+
+        logger.info("<<<<<<<<<<<<<<<<< End Evaluation <<<<<<<<<<<<<<<<<")
+
+    def write_animation(self, frames: np.ndarray, path: str):
+        """Writes an offline animation: compact motion packets for .lamm paths, export JSON otherwise."""
+        if path.endswith(MOTION_EXTENSION):
+            write_motion_file(path, frames, ARKitBlendShape, fps=self.cfg.fps,
+                              bits=getattr(self.cfg, 'motion_bits', 8))
+        else:
+            export_blendshape_animation(frames, path, ARKitBlendShape, fps=self.cfg.fps)
+
+    def offline_postprocess(self, out_exp: np.ndarray, speech_array: np.ndarray, ssr: int) -> np.ndarray:
+        """Post-processing of a whole-file prediction, as used by infer() and export_batch()."""
         frame_length = math.ceil(speech_array.shape[0] / ssr * 30)
-        volume = librosa.feature.rms(y=speech_array, frame_length=int(1 / 30 * ssr), hop_length=int(1 / 30 * ssr))[0]
-        if (volume.shape[0] > frame_length):
-            volume = volume[:frame_length]
+        volume = VolumeMeter(ssr)(speech_array, frame_length)
 
         if(self.cfg.movement_smooth):
             out_exp = smooth_mouth_movements(out_exp, 0, volume)
@@ -146,92 +308,433 @@ class Audio2ExpressionInfer(InferBase):
         if (self.cfg.brow_movement):
             out_exp = apply_random_brow_movement(out_exp, volume)
 
-        pred_exp = self.blendshape_postprocess(out_exp)
+        return self.blendshape_postprocess(out_exp)
+
+    def export_batch(self,
+                     jobs: List[ExportJob],
+                     output_dir: str,
+                     num_workers: int = 4,
+                     batch_size: int = 8,
+                     force: bool = False) -> List[Dict]:
+        """Exports one blendshape animation (JSON, or .lamm motion packets) per audio file with the loaded model.
+
+        Files are hashed, decoded and resampled on a process pool a few batches ahead
+        of the model. Clips of identical length share a forward pass. Outputs whose
+        content key (audio bytes + export settings) matches the export index are skipped.
 
+        Args:
+            jobs: (audio_path, output_path) pairs, see batch_export.collect_jobs
+            output_dir: Directory holding the export index
+            num_workers: Decode/resample processes
+            batch_size: Clips per model step
+            force: Re-export even if up to date
+
+        Returns:
+            One result dict per job (audio, output, status, decode_time, infer_time)
+        """
+        logger = get_root_logger()
+        self.model.eval()
+        sample_rate = 16000
+        fingerprint = settings_fingerprint({
+            'weight': self.cfg.weight,
+            'weight_mtime': os.path.getmtime(self.cfg.weight) if os.path.isfile(self.cfg.weight) else None,
+            'id_idx': self.cfg.id_idx,
+            'movement_smooth': self.cfg.movement_smooth,
+            'brow_movement': self.cfg.brow_movement,
+            'fps': self.cfg.fps,
+            'ex_vol': self.cfg.ex_vol,
+            'motion_bits': getattr(self.cfg, 'motion_bits', 8),
+        })
+        known = {} if force else load_index(output_dir)
+        index = ExportIndex(output_dir)
+        results = []
+        total = len(jobs)
+        start = time.time()
+
+        def report(result: Dict):
+            results.append(result)
+            logger.info("Export [{}/{}] {} {}: decode {:.2f}s infer {:.2f}s -> {}".format(
+                len(results), total, result['status'], result['audio'],
+                result['decode_time'], result['infer_time'], result['output']))
+
+        # spawn: the workers only decode audio and must not inherit the CUDA context
+        pool = ProcessPoolExecutor(max(1, num_workers), mp_context=multiprocessing.get_context('spawn'))
+        remaining = iter(jobs)
+        pending = deque()
+
+        def fill():
+            while len(pending) < 2 * batch_size:
+                job = next(remaining, None)
+                if job is None:
+                    return
+                pending.append((job, pool.submit(decode_clip, job, sample_rate, fingerprint,
+                                                 known.get(job.output_path))))
+
+        try:
+            fill()
+            while pending:
+                clips = []
+                while pending and len(clips) < batch_size:
+                    job, future = pending.popleft()
+                    try:
+                        clip = future.result()
+                    except Exception as e:
+                        logger.error(f'Error: failed to decode {job.audio_path}: {e}')
+                        report({'audio': job.audio_path, 'output': job.output_path, 'status': 'failed',
+                                'decode_time': 0.0, 'infer_time': 0.0})
+                        continue
+                    if clip.audio is None:
+                        report({'audio': clip.job.audio_path, 'output': clip.job.output_path, 'status': 'skipped',
+                                'decode_time': clip.decode_time, 'infer_time': 0.0})
+                        continue
+                    clips.append(clip)
+                # keep the pool decoding while the model runs
+                fill()
+                for group in equal_length_groups(clips, batch_size):
+                    for result in self._export_group(group, sample_rate):
+                        if result['status'] == 'exported':
+                            index.add(result['output'], result['key'])
+                        del result['key']
+                        report(result)
+        finally:
+            pool.shutdown(cancel_futures=True)
+            index.close()
+
+        exported, skipped, failed = summarize(results)
+        logger.info("Export finished in {:.1f}s: {} exported, {} up to date, {} failed".format(
+            time.time() - start, exported, skipped, failed))
+        return results
+
+    def _export_group(self, clips: List, sample_rate: int) -> List[Dict]:
+        end = time.time()
+        try:
+            with torch.no_grad():
+                input_dict = {}
+                input_dict['id_idx'] = F.one_hot(torch.tensor([self.cfg.id_idx] * len(clips)),
+                                                 self.cfg.model.backbone.num_identity_classes).to(self.device, non_blocking=True)
+                if(self.cfg.ex_vol):
+                    clips = [clip._replace(audio=self.extract_vocals(clip.audio, sample_rate)) for clip in clips]
+                input_dict['input_audio_array'] = torch.from_numpy(
+                    np.stack([clip.audio for clip in clips])).to(self.device, non_blocking=True)
+                pred_exp = self.model(input_dict)['pred_exp'].cpu().numpy()
+        except Exception as e:
+            self.logger.error(f'Error: failed to predict expression: {e}')
+            return [{'audio': clip.job.audio_path, 'output': clip.job.output_path, 'status': 'failed',
+                     'key': clip.key, 'decode_time': clip.decode_time, 'infer_time': 0.0} for clip in clips]
+        infer_time = (time.time() - end) / len(clips)
+
+        results = []
+        for clip, out_exp in zip(clips, pred_exp):
+            output_path = clip.job.output_path
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            self.write_animation(self.offline_postprocess(out_exp, clip.audio, sample_rate), output_path)
+            results.append({'audio': clip.job.audio_path, 'output': output_path, 'status': 'exported',
+                            'key': clip.key, 'decode_time': clip.decode_time, 'infer_time': infer_time})
+        return results
+
+    def infer_windowed(self):
+        """Offline inference over long files in overlapping windows.
+
+        The audio is decoded and resampled block by block, each window of
+        cfg.window_seconds is run through the model on its own and consecutive
+        predictions are crossfaded over cfg.window_overlap_seconds. Post-processing
+        runs on the stitched frames as they are finalized and the blendshape JSON is
+        written incrementally, so memory does not grow with the file length.
+        """
+        logger = get_root_logger()
+        batch_time = AverageMeter()
+        sample_rate = 16000
+        fps = 30
+        # whole multiples of 0.1 s keep window starts on both the sample and the frame grid
+        grid = sample_rate // 10
+        window_frames = max(round(self.cfg.window_seconds * 10), 1) * 3
+        overlap_frames = min(round(getattr(self.cfg, 'window_overlap_seconds', 2.0) * 10) * 3, window_frames // 2)
+        window_samples = window_frames // 3 * grid
+        step_samples = (window_frames - overlap_frames) // 3 * grid
+
+        id_idx = F.one_hot(torch.tensor(self.cfg.id_idx),
+                           self.cfg.model.backbone.num_identity_classes).to(self.device, non_blocking=True)[None, ...]
+        stitcher = WindowStitcher(overlap_frames)
+        smoother = StreamingSavgol(window_length=5)
+        blinks = BlinkScheduler((ARKitBlendShape.index('eyeBlinkLeft'), ARKitBlendShape.index('eyeBlinkRight')))
+        writer = None
         if(self.cfg.save_json_path is not None):
-            export_blendshape_animation(pred_exp,
-                                        self.cfg.save_json_path,
-                                        ARKitBlendShape,
-                                        fps=self.cfg.fps)
+            if self.cfg.save_json_path.endswith(MOTION_EXTENSION):
+                writer = MotionFileWriter(self.cfg.save_json_path, ARKitBlendShape, fps=self.cfg.fps,
+                                          bits=getattr(self.cfg, 'motion_bits', 8))
+            else:
+                writer = BlendshapeJSONWriter(self.cfg.save_json_path, ARKitBlendShape, fps=self.cfg.fps)
+        tail = np.zeros((0, len(ARKitBlendShape) + 1), dtype=np.float32)
+
+        def emit(frames: np.ndarray):
+            if frames.shape[0] and writer is not None:
+                writer.write(blinks(symmetrize_blendshapes(frames)))
+
+        def commit(stitched: np.ndarray):
+            # stitched frames carry their volume in the last column
+            nonlocal tail
+            if not stitched.shape[0]:
+                return
+            out_exp, volume = stitched[:, :-1], stitched[:, -1]
+            if(self.cfg.movement_smooth):
+                out_exp = smooth_mouth_movements(np.concatenate([tail[:, :-1], out_exp]), tail.shape[0],
+                                                 np.concatenate([tail[:, -1], volume]))[tail.shape[0]:]
+            if (self.cfg.brow_movement):
+                out_exp = apply_random_brow_movement(out_exp, volume)
+            tail = np.concatenate([tail, np.column_stack([out_exp, volume])])[-POSTPROCESS_CONTEXT_FRAMES:]
+            emit(smoother.push(out_exp))
+
+        try:
+            for index, window in enumerate(iter_audio_windows(self.cfg.audio_input, sample_rate,
+                                                              window_samples, step_samples)):
+                if(self.cfg.ex_vol):
+                    window = self.extract_vocals(window, sample_rate)
+                num_frames = math.ceil(window.shape[0] / sample_rate * fps)
+                end = time.time()
+                with torch.no_grad():
+                    output_dict = self.model({'id_idx': id_idx,
+                                              'input_audio_array': torch.from_numpy(window).to(self.device, non_blocking=True)[None, ...]})
+                out_exp = output_dict['pred_exp'][0, :num_frames].float().cpu().numpy()
+                batch_time.update(time.time() - end)
+                volume = VolumeMeter(sample_rate, fps)(window, out_exp.shape[0])
+                commit(stitcher.push(np.column_stack([out_exp, volume])))
+                logger.info("Infer: [{}] window {} Running Time: {batch_time.val:.3f} ({batch_time.avg:.3f})".format(
+                    self.cfg.audio_input, index, batch_time=batch_time))
+            commit(stitcher.finish())
+            emit(smoother.finish())
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def warmup(self,
+               sample_rate: int,
+               chunk_samples: Optional[Sequence[int]] = None,
+               batch_sizes: Sequence[int] = (1,)) -> List[Tuple[str, float]]:
+        """Runs every streaming path once so the first session does not pay for first-use costs.
+
+        Streams chunk_samples through one session, in order (the first one takes the silence-padded
+        initial path), then runs a forward pass per batch size, since each batch shape may trigger
+        its own kernel selection. Stage metrics and the expression cache are bypassed meanwhile.
 
-        logger.info("<<<<<<<<<<<<<<<<< End Evaluation <<<<<<<<<<<<<<<<<")
+        Args:
+            sample_rate: Sample rate of the handler's input audio
+            chunk_samples: Slice lengths in the order the handler produces them; defaults to two
+                1 s slices, an off-grid flush tail and the 50-sample end-of-speech marker
+            batch_sizes: Forward batch sizes the runtime can produce
+
+        Returns:
+            (shape, seconds) per warmup call
+        """
+        if chunk_samples is None:
+            chunk_samples = [sample_rate, sample_rate, sample_rate * 3 // 20 + 1, 50]
+        timings = []
+        metrics_enabled, METRICS.enabled = METRICS.enabled, False
+        expression_cache, self.expression_cache = self.expression_cache, None
+        try:
+            context = None
+            for i, n in enumerate(chunk_samples):
+                start = time.perf_counter()
+                _, context = self.infer_streaming_audio(audio=np.zeros([n], dtype=np.float32),
+                                                        ssr=sample_rate, context=context)
+                timings.append((f"{'initial' if i == 0 else 'stream'} {n / sample_rate:.3f}s",
+                                time.perf_counter() - start))
+            window = np.zeros([1, context.window_samples], dtype=np.float32)
+            for batch_size in batch_sizes:
+                start = time.perf_counter()
+                self.forward_windows(np.repeat(window, batch_size, axis=0), [self.cfg.id_idx] * batch_size)
+                timings.append((f"batch {batch_size}", time.perf_counter() - start))
+        finally:
+            METRICS.enabled = metrics_enabled
+            self.expression_cache = expression_cache
+        return timings
 
     def infer_streaming_audio(self,
                            audio: np.ndarray,
                            ssr: float,
-                           context: dict):
+                           context: Optional[StreamingContext],
+                           speech_end: bool = False):
+        step = self.prepare_streaming_audio(audio, ssr, context, speech_end)
+
+        try:
+            if (step.cached is not None):
+                pred_exp = None
+            elif (self.batcher is not None):
+                pred_exp = self.batcher.submit(step.window, (self.cfg.id_idx, step.context))
+            else:
+                pred_exp = self.forward_windows(step.window[np.newaxis, ...], [self.cfg.id_idx], [step.context])[0]
+        except Exception as e:
+            self.logger.error(f'Error: failed to predict expression: {e}')
+            pred_exp = None
+
+        return self.finish_streaming_audio(step, pred_exp)
+
+    def new_streaming_context(self) -> StreamingContext:
+        return StreamingContext(audio_sr=self.cfg.audio_sr,
+                                max_frame_length=MAX_FRAME_LENGTH,
+                                num_channels=len(ARKitBlendShape),
+                                blink_channels=(ARKitBlendShape.index('eyeBlinkLeft'),
+                                                ARKitBlendShape.index('eyeBlinkRight')))
+
+    def snapshot_context(self, context: Optional[StreamingContext], compact: bool = False) -> bytes:
+        """Serialises a streaming session so it can be resumed elsewhere with restore_context.
 
-        if (context is None):
-            context = DEFAULT_CONTEXT.copy()
-        max_frame_length = 64
+        Args:
+            context: The session's context as returned by infer_streaming_audio (None: no state yet)
+            compact: Leave out the model's 2.1 s audio window. The default snapshot (~75 KiB, int16
+                window) continues the session exactly; a compact one is ~8 KiB but lossy and only
+                restores with allow_lossy=True
+
+        Returns:
+            Fixed-size snapshot, see StreamingContext.to_bytes
+        """
+        if context is None:
+            context = self.new_streaming_context()
+        return context.to_bytes(compact=compact)
+
+    def restore_context(self, data: bytes, allow_lossy: bool = False) -> StreamingContext:
+        """Rebuilds a streaming context from snapshot_context output.
 
-        frame_length = math.ceil(audio.shape[0] / ssr * 30)
-        output_context = DEFAULT_CONTEXT.copy()
+        Args:
+            data: The snapshot
+            allow_lossy: Accept a compact snapshot, whose next window starts silence-padded so
+                its expression differs from an uninterrupted session
 
-        volume = librosa.feature.rms(y=audio, frame_length=min(int(1 / 30 * ssr), len(audio)), hop_length=int(1 / 30 * ssr))[0]
-        if (volume.shape[0] > frame_length):
-            volume = volume[:frame_length]
+        Raises:
+            ValueError: If the snapshot does not match this model's streaming configuration, or
+                is compact and allow_lossy is not set
+        """
+        context = self.new_streaming_context()
+        context.load_bytes(data, allow_lossy=allow_lossy)
+        if allow_lossy and context.audio.size == 0 and not context.is_initial_input:
+            self.logger.warning("restored a compact LAM context snapshot, the next window is silence-padded")
+        return context
+
+    def prepare_streaming_audio(self,
+                                audio: np.ndarray,
+                                ssr: float,
+                                context: Optional[StreamingContext],
+                                speech_end: bool = False) -> StreamingStep:
+        """Input stage of infer_streaming_audio: resampling, volume and the model input window.
+
+        The returned window is a view into the session's audio ring; it must be consumed
+        (forwarded or copied, e.g. by np.stack) before the next chunk of the session is prepared.
+        On the speech_end chunk the resampler's held-back samples are flushed into the window.
+        """
+        if (context is None):
+            context = self.new_streaming_context()
+        max_frame_length = context.max_frame_length
 
         # resample audio
         if (ssr != self.cfg.audio_sr):
-            in_audio = librosa.resample(audio.astype(np.float32), orig_sr=ssr, target_sr=self.cfg.audio_sr)
+            with METRICS.timer('resample'):
+                in_audio = context.resample(audio, int(ssr), final=speech_end)
         else:
-            in_audio = audio.copy()
+            in_audio = audio
 
         start_frame = int(max_frame_length - in_audio.shape[0] / self.cfg.audio_sr * 30)
 
-        if (context['is_initial_input'] or (context['previous_audio'] is None)):
-            blank_audio_length = self.cfg.audio_sr * max_frame_length // 30 - in_audio.shape[0]
-            blank_audio = np.zeros(blank_audio_length, dtype=np.float32)
+        # one volume value per output expression frame, partial frames carried across chunks
+        volume = context.measure_volume(audio, int(ssr), max_frame_length - start_frame)
 
-            # pre-append
-            input_audio = np.concatenate([blank_audio, in_audio])
-            output_context['previous_audio'] = input_audio
+        key = cached = None
+        if self.expression_cache is not None:
+            if context.is_initial_input:
+                context.cache_chain = b""
+            key = context.cache_chain = chain_key(context.cache_chain, audio, ssr, self.cfg.id_idx)
+            cached = self.expression_cache.get(key)
 
-        else:
-            clip_pre_audio_length = self.cfg.audio_sr * max_frame_length // 30 - in_audio.shape[0]
-            clip_pre_audio = context['previous_audio'][-clip_pre_audio_length:]
-            input_audio = np.concatenate([clip_pre_audio, in_audio])
-            output_context['previous_audio'] = input_audio
+        # blank-padded on the initial input, previous audio tail afterwards
+        window = context.push_audio(in_audio)
+        if cached is not None:
+            # this window is not encoded, so the incremental features no longer line up with it
+            context.feature_cache = None
+        return StreamingStep(context, window, start_frame, volume, key, cached)
 
-        with torch.no_grad(), torch.amp.autocast('cuda', dtype=torch.float16):
-            try:
-                input_dict = {}
-                input_dict['id_idx'] = F.one_hot(torch.tensor(self.cfg.id_idx),
-                                                 self.cfg.model.backbone.num_identity_classes).cuda(non_blocking=True)[
-                    None, ...]
-                input_dict['input_audio_array'] = torch.FloatTensor(input_audio).cuda(non_blocking=True)[None, ...]
-                output_dict = self.model(input_dict)
-                out_exp = output_dict['pred_exp'].float().squeeze().cpu().numpy()[start_frame:, :]
-            except Exception as e:
-                self.logger.error(f'Error: failed to predict expression: {e}')
-                return {"code": RETURN_CODE['SUCCESS'],
-                        "expression": None,
-                        "headpose": None}, output_context
+    def forward_steps(self, steps: List[StreamingStep]) -> List[Optional[np.ndarray]]:
+        """Runs the prepared steps that were not served from the expression cache as one batch.
 
+        Returns:
+            Model output per step, None for cached steps
+        """
+        pending = [i for i, step in enumerate(steps) if step.cached is None]
+        pred_exp: List[Optional[np.ndarray]] = [None] * len(steps)
+        if pending:
+            outputs = self.forward_windows(np.stack([steps[i].window for i in pending]),
+                                           [self.cfg.id_idx] * len(pending),
+                                           [steps[i].context for i in pending])
+            for i, output in zip(pending, outputs):
+                pred_exp[i] = output
+        return pred_exp
+
+    def finish_streaming_audio(self, step: StreamingStep, pred_exp: Optional[np.ndarray]):
+        """Output stage of infer_streaming_audio: post-processing of the predicted window.
 
-        # post-process
-        if (context['previous_expression'] is None):
-            out_exp = self.apply_expression_postprocessing(out_exp, audio_volume=volume)
-        else:
-            previous_length = context['previous_expression'].shape[0]
-            out_exp = self.apply_expression_postprocessing(expression_params = np.concatenate([context['previous_expression'], out_exp], axis=0),
-                                                           audio_volume=np.concatenate([context['previous_volume'], volume], axis=0),
-                                                           processed_frames=previous_length)[previous_length:, :]
-
-        if (context['previous_expression'] is not None):
-            output_context['previous_expression'] = np.concatenate([context['previous_expression'], out_exp], axis=0)[
-                                                -max_frame_length:, :]
-            output_context['previous_volume'] = np.concatenate([context['previous_volume'], volume], axis=0)[-max_frame_length:]
+        Args:
+            step: The prepared chunk
+            pred_exp: Model output for step.window, or None if the forward pass failed
+
+        Returns:
+            (result dict, context) as returned by infer_streaming_audio
+        """
+        context = step.context
+        if step.cached is not None:
+            out_exp = step.cached
+        elif pred_exp is None:
+            return {"code": RETURN_CODE['SUCCESS'],
+                    "expression": None,
+                    "headpose": None}, context
         else:
-            output_context['previous_expression'] = out_exp.copy()
-            output_context['previous_volume'] = volume.copy()
+            out_exp = pred_exp[step.start_frame:, :]
 
-        output_context['first_input_flag'] = False
+            # post-process
+            with METRICS.timer('postprocess'):
+                out_exp = self.apply_streaming_postprocessing(out_exp, step.volume, context)
+            if step.key is not None:
+                self.expression_cache.put(step.key, out_exp)
+
+        # the history keeps the deterministic frames; random blinks go on top of a copy
+        context.push_expression(out_exp, step.volume)
+        out_exp = context.blinks(out_exp.copy())
 
         return {"code": RETURN_CODE['SUCCESS'],
                 "expression": out_exp,
-                "headpose": None}, output_context
+                "headpose": None}, context
+
+    def apply_streaming_postprocessing(
+            self,
+            expression_params: np.ndarray,
+            audio_volume: np.ndarray,
+            context: StreamingContext
+    ) -> np.ndarray:
+        """Streaming counterpart of apply_expression_postprocessing for one new chunk.
+
+        Mouth smoothing and frame blending see the same input as on the full-window path:
+        the processed history (POSTPROCESS_CONTEXT_FRAMES, the whole 64-frame ring) followed
+        by the new frames. Savitzky-Golay smoothing is evaluated for the new frames only.
+        The result is deterministic (and cacheable); finish_streaming_audio adds the
+        session's random blinks afterwards.
+
+        Args:
+            expression_params: Raw output from animation model for the new frames [num_frames, num_parameters]
+            audio_volume: Volume of the new frames
+            context: Session streaming context holding the processed history
+
+        Returns:
+            Processed expression parameters for the new frames, as a C-contiguous float32 array
+        """
+        tail_expression, tail_volume = context.postprocess_tail()
+        processed_frames = tail_expression.shape[0]
+        if processed_frames:
+            expression_params = np.concatenate([tail_expression, expression_params], axis=0)
+            audio_volume = np.concatenate([tail_volume, audio_volume], axis=0)
+
+        # Pipeline execution order matters - maintain sequence
+        expression_params = smooth_mouth_movements(expression_params, processed_frames, audio_volume)
+        expression_params = apply_frame_blending(expression_params, processed_frames)
+        expression_params = self.savgol(expression_params, start=processed_frames)
+        expression_params = symmetrize_blendshapes(expression_params)
+        return np.ascontiguousarray(expression_params, dtype=np.float32)
+
     def apply_expression_postprocessing(
             self,
             expression_params: np.ndarray,
@@ -257,23 +760,33 @@ class Audio2ExpressionInfer(InferBase):
 
         return expression_params
 
-    def extract_vocal_track(
+    def extract_vocals(
             self,
-            input_audio_path: str
-    ) -> str:
-        """Isolates vocal track from audio file using source separation.
+            audio: np.ndarray,
+            sample_rate: int
+    ) -> np.ndarray:
+        """Isolates the vocal track of an in-memory clip using source separation.
+
+        Clips that speech_check finds to be clean speech are returned unchanged
+        (disable with cfg.ex_vol_skip_clean = False). The separator named by
+        cfg.vocal_separator is built on first use and kept for later calls.
 
         Args:
-            input_audio_path: Path to input audio file containing vocals+accompaniment
+            audio: Mono audio containing vocals+accompaniment
+            sample_rate: Sample rate of audio
 
         Returns:
-            Path to isolated vocal track in WAV format
+            Isolated vocal track, same length and sample rate as the input
         """
-        separation_command = f'spleeter separate -p spleeter:2stems -o {self.cfg.save_path} {input_audio_path}'
-        os.system(separation_command)
-
-        base_name = os.path.splitext(os.path.basename(input_audio_path))[0]
-        return os.path.join(self.cfg.save_path, base_name, 'vocals.wav')
+        if getattr(self.cfg, 'ex_vol_skip_clean', True):
+            check = speech_check(audio, sample_rate)
+            if check.clean:
+                self.logger.info("=> Clean speech (pause ratio {:.2f}, floor flatness {:.2f}), "
+                                 "skipping separation".format(check.pause_ratio, check.floor_flatness))
+                return audio
+        if self.separator is None:
+            self.separator = SEPARATORS.build(dict(type=getattr(self.cfg, 'vocal_separator', 'SpleeterSeparator')))
+        return self.separator(audio, sample_rate)
 
     def blendshape_postprocess(self,
                                bs_array: np.ndarray
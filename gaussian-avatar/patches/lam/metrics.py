@@ -0,0 +1,252 @@
+"""In-process latency / throughput metrics for the LAM avatar pipeline.
+
+Mounted next to ``infer.py`` (``engines/metrics.py``); the handler imports the
+same module through ``.LAM_Audio2Expression.engines.metrics``, so there is one
+``METRICS`` registry per process. Pure Python (no torch, no numpy) so it works
+on CPU-only CI and stays cheap enough to leave on: an observation is a bisect
+over ~20 fixed buckets under a lock.
+
+Exposed pull-style over HTTP (Prometheus text on ``/metrics``, JSON on
+``/metrics.json``) and/or as a JSON file rewritten periodically.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, List, Optional, Sequence
+
+# 0.1 ms .. ~6.5 s, doubling
+DEFAULT_BUCKETS = tuple(0.0001 * 2 ** i for i in range(17))
+# rows per forward pass
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative on export, like a Prometheus histogram)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing the ``q`` quantile (0 if empty)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99),
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+
+class SessionMetrics:
+    __slots__ = ("audio_seconds", "compute_seconds", "slices", "queue_depth")
+
+    def __init__(self):
+        self.audio_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.slices = 0
+        self.queue_depth = 0
+
+    @property
+    def rtf(self) -> float:
+        """Compute time per second of audio (below 1 keeps up with real time)."""
+        return self.compute_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+    def snapshot(self) -> Dict:
+        return {"audio_seconds": self.audio_seconds, "compute_seconds": self.compute_seconds,
+                "slices": self.slices, "rtf": self.rtf, "queue_depth": self.queue_depth}
+
+
+class MetricsRegistry:
+    """Stage duration histograms, the forward batch size histogram, and
+    per-session real-time factor and queue depth."""
+
+    def __init__(self, prefix: str = "lam"):
+        self.prefix = prefix
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._batch_sizes = Histogram(BATCH_BUCKETS)
+        self._sessions: Dict[Hashable, SessionMetrics] = {}
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._dump_stop: Optional[threading.Event] = None
+
+    def observe(self, stage: str, seconds: float, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Records a duration of ``stage`` in seconds."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(buckets)
+            histogram.observe(seconds)
+
+    def observe_batch_size(self, rows: int):
+        """Records the number of rows of one forward pass."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._batch_sizes.observe(rows)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_slice(self, session: Hashable, audio_seconds: float, compute_seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            metrics = self._sessions.setdefault(session, SessionMetrics())
+            metrics.audio_seconds += audio_seconds
+            metrics.compute_seconds += compute_seconds
+            metrics.slices += 1
+
+    def set_queue_depth(self, session: Hashable, depth: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._sessions.setdefault(session, SessionMetrics()).queue_depth = depth
+
+    def add_collector(self, name: str, collect: Callable[[], Dict]):
+        """Adds ``collect()`` (a flat dict, e.g. cache stats) to every snapshot; numbers are exported as gauges."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def drop_session(self, session: Hashable):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._batch_sizes = Histogram(BATCH_BUCKETS)
+            self._sessions.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            snapshot = {
+                "time": time.time(),
+                "stages": {name: h.snapshot() for name, h in self._histograms.items()},
+                "forward_batch_size": self._batch_sizes.snapshot(),
+                "sessions": {str(s): m.snapshot() for s, m in self._sessions.items()},
+            }
+            collectors = list(self._collectors.items())
+        # collectors take their own locks, so they run outside ours
+        for name, collect in collectors:
+            snapshot[name] = collect()
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        p = self.prefix
+        lines: List[str] = []
+        with self._lock:
+            lines.append(f"# TYPE {p}_stage_seconds histogram")
+            for name, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, n in zip([repr(b) for b in h.buckets] + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            h = self._batch_sizes
+            lines.append(f"# TYPE {p}_forward_batch_size histogram")
+            cumulative = 0
+            for bound, n in zip([repr(b) for b in h.buckets] + ["+Inf"], h.counts):
+                cumulative += n
+                lines.append(f'{p}_forward_batch_size_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{p}_forward_batch_size_sum {h.sum}")
+            lines.append(f"{p}_forward_batch_size_count {h.count}")
+            for metric, kind, attr in (("session_rtf", "gauge", "rtf"),
+                                       ("session_queue_depth", "gauge", "queue_depth"),
+                                       ("session_audio_seconds_total", "counter", "audio_seconds"),
+                                       ("session_slices_total", "counter", "slices")):
+                lines.append(f"# TYPE {p}_{metric} {kind}")
+                for session, m in self._sessions.items():
+                    lines.append(f'{p}_{metric}{{session="{session}"}} {getattr(m, attr)}')
+            collectors = list(self._collectors.items())
+        for name, collect in collectors:
+            for key, value in collect().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {p}_{name}_{key} gauge")
+                    lines.append(f"{p}_{name}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Starts the pull endpoint in a daemon thread (idempotent)."""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = registry.render_prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="lam-metrics", daemon=True).start()
+        return self._server
+
+    def start_dump(self, path: str, interval: float = 10.0):
+        """Rewrites ``path`` with a JSON snapshot every ``interval`` seconds (atomic replace)."""
+        if self._dump_stop is not None:
+            return
+        self._dump_stop = stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                tmp = f"{path}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp, path)
+
+        threading.Thread(target=run, name="lam-metrics-dump", daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._dump_stop is not None:
+            self._dump_stop.set()
+            self._dump_stop = None
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,250 @@
+"""Shared LAM Audio2Expression model process for several handler processes.
+
+Mounted next to ``infer.py`` (``engines/model_server.py``). One process owns
+the model and serves streaming inference over a Unix socket; handler
+processes started with ``model_server_socket`` connect instead of loading
+their own copy of the wav2vec2 + LAM weights.
+
+Each connection is one avatar session. The server keeps the session's
+``StreamingContext`` (audio/expression history, feature cache, blink state)
+for as long as the connection is open, so a request carries only the new
+audio slice and the response only the new expression frames. Requests of all
+connections go through the model's ``MicroBatcher``, which batches sessions
+of every handler process into shared forward passes.
+
+Frames are raw float32 behind a fixed header (no pickling), so the socket
+file's permissions are the only access control needed.
+
+Run inside the container, from the LAM_Audio2Expression directory:
+
+    python -m engines.model_server --socket /tmp/lam_a2e.sock --batch-size 8
+"""
+
+import argparse
+import os
+import struct
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Optional
+
+import numpy as np
+
+from .metrics import METRICS
+
+OP_INFER = 1
+OP_PING = 2
+FLAG_SPEECH_END = 1
+
+STATUS_OK = 0
+STATUS_NO_OUTPUT = 1  # forward pass failed, the slice has no expression
+STATUS_ERROR = 2
+
+# op, flags, sample rate | audio float32[...]
+_REQUEST = struct.Struct("<BBI")
+# status, frames, channels | expression float32[frames, channels] (or an utf-8 error message)
+_RESPONSE = struct.Struct("<BII")
+
+
+class ModelServer:
+    """Serves ``infer.infer_streaming_audio`` to clients on a Unix socket.
+
+    Args:
+        infer: A loaded Audio2ExpressionInfer (batching should be enabled so concurrent sessions share passes)
+        path: Socket path; a stale socket file is replaced
+        max_sessions: Connections beyond this many are refused (0 = unlimited)
+    """
+
+    def __init__(self, infer, path: str, max_sessions: int = 0, logger=None):
+        self.infer = infer
+        self.path = path
+        self.max_sessions = max_sessions
+        self.logger = logger
+        if os.path.exists(path):
+            os.unlink(path)
+        self._listener = Listener(path, family="AF_UNIX")
+        os.chmod(path, 0o660)
+        self._lock = threading.Lock()
+        self._sessions = 0
+        self._next_id = 0
+        self._closed = False
+
+    @property
+    def sessions(self) -> int:
+        with self._lock:
+            return self._sessions
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            with self._lock:
+                if self.max_sessions and self._sessions >= self.max_sessions:
+                    conn.close()
+                    continue
+                self._sessions += 1
+                self._next_id += 1
+                session = f"remote-{self._next_id}"
+            threading.Thread(target=self._serve_session, args=(conn, session),
+                             name=f"lam-{session}", daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        self._listener.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _serve_session(self, conn: Connection, session: str):
+        context = None
+        try:
+            while True:
+                try:
+                    message = conn.recv_bytes()
+                except (EOFError, OSError):
+                    return
+                op, flags, sample_rate = _REQUEST.unpack_from(message)
+                if op == OP_PING:
+                    conn.send_bytes(_RESPONSE.pack(STATUS_OK, 0, 0))
+                    continue
+                t_start = time.perf_counter()
+                audio = np.frombuffer(message, dtype=np.float32, offset=_REQUEST.size)
+                try:
+                    result, context = self.infer.infer_streaming_audio(audio=audio, ssr=sample_rate, context=context,
+                                                                       speech_end=bool(flags & FLAG_SPEECH_END))
+                except Exception as e:
+                    if self.logger is not None:
+                        self.logger.error(f"{session}: inference failed: {e}")
+                    conn.send_bytes(_RESPONSE.pack(STATUS_ERROR, 0, 0) + str(e).encode())
+                    context = None
+                    continue
+                if flags & FLAG_SPEECH_END:
+                    context = None
+                expression = result.get("expression")
+                if expression is None:
+                    conn.send_bytes(_RESPONSE.pack(STATUS_NO_OUTPUT, 0, 0))
+                    continue
+                expression = np.ascontiguousarray(expression, dtype=np.float32)
+                conn.send_bytes(_RESPONSE.pack(STATUS_OK, *expression.shape) + expression.tobytes())
+                METRICS.record_slice(session, audio.shape[0] / sample_rate, time.perf_counter() - t_start)
+        finally:
+            conn.close()
+            METRICS.drop_session(session)
+            with self._lock:
+                self._sessions -= 1
+
+
+class ModelClient:
+    """One session's connection to a :class:`ModelServer`.
+
+    Args:
+        path: Server socket path
+        connect_timeout: Seconds to keep retrying while the server is starting
+    """
+
+    def __init__(self, path: str, connect_timeout: float = 0.0):
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                self._conn = Client(path, family="AF_UNIX")
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+
+    def ping(self):
+        self._conn.send_bytes(_REQUEST.pack(OP_PING, 0, 0))
+        self._receive()
+
+    def infer(self, audio: np.ndarray, sample_rate: int, speech_end: bool = False) -> Optional[np.ndarray]:
+        """Sends one audio slice of the session and returns its expression frames.
+
+        The server drops the session's streaming history after a ``speech_end`` slice.
+
+        Returns:
+            Expression frames [num_frames, 52], or None if the server's forward pass failed
+        """
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        header = _REQUEST.pack(OP_INFER, FLAG_SPEECH_END if speech_end else 0, int(sample_rate))
+        self._conn.send_bytes(header + audio.tobytes())
+        return self._receive()
+
+    def close(self):
+        self._conn.close()
+
+    def _receive(self) -> Optional[np.ndarray]:
+        try:
+            message = self._conn.recv_bytes()
+        except EOFError:
+            raise ConnectionError("LAM model server closed the connection") from None
+        status, frames, channels = _RESPONSE.unpack_from(message)
+        if status == STATUS_ERROR:
+            raise RuntimeError(f"LAM model server: {message[_RESPONSE.size:].decode(errors='replace')}")
+        if status == STATUS_NO_OUTPUT:
+            return None
+        return np.frombuffer(message, dtype=np.float32, offset=_RESPONSE.size).reshape(frames, channels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve LAM Audio2Expression to handler processes on a Unix socket.")
+    parser.add_argument("--socket", default="/tmp/lam_a2e.sock")
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config_streaming.py")
+    parser.add_argument("--weight", default="/app/models/LAM_audio2exp/pretrained_models/lam_audio2exp_streaming.tar")
+    parser.add_argument("--wav2vec-path", default="/app/models/wav2vec2-base-960h")
+    parser.add_argument("--wav2vec-config", default="configs/wav2vec2_config.json")
+    parser.add_argument("--device", default=None, help="cuda / cpu (default: CUDA when available)")
+    parser.add_argument("--cpu-threads", type=int, default=0, help="intra-op threads on CPU (0 = torch default)")
+    parser.add_argument("--batch-size", type=int, default=8, help="max sessions per forward pass")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0)
+    parser.add_argument("--incremental-features", action="store_true")
+    parser.add_argument("--expression-cache-mb", type=float, default=32.0, help="repeated-slice cache (0 = off)")
+    parser.add_argument("--max-sessions", type=int, default=0, help="refuse connections beyond this (0 = unlimited)")
+    parser.add_argument("--sample-rate", type=int, default=24000, help="warmup sample rate (the TTS output rate)")
+    parser.add_argument("--metrics-port", type=int, default=0)
+    args = parser.parse_args()
+
+    from .defaults import default_config_parser, default_setup
+    from .infer import INFER
+    from utils.logger import get_root_logger
+
+    cfg = default_setup(default_config_parser(args.config_file, {
+        "weight": args.weight,
+        "device": args.device,
+        "cpu_threads": args.cpu_threads,
+        "model": {
+            "backbone": {
+                "pretrained_encoder_path": args.wav2vec_path,
+                "wav2vec2_config_path": args.wav2vec_config,
+            }
+        }
+    }))
+    logger = get_root_logger()
+    infer = INFER.build(dict(type=cfg.infer.type, cfg=cfg))
+    infer.model.eval()
+    infer.enable_batching(max_batch_size=args.batch_size, max_wait_ms=args.batch_wait_ms)
+    infer.enable_incremental_features(args.incremental_features)
+    cache = infer.enable_expression_cache(args.expression_cache_mb)
+    if cache is not None:
+        METRICS.add_collector("expression_cache", cache.stats)
+    timings = infer.warmup(args.sample_rate, batch_sizes=range(1, args.batch_size + 1))
+    logger.info(f"Warmup finished in {sum(t for _, t in timings) * 1000:.0f} milliseconds: "
+                + ", ".join(f"{shape} {t * 1000:.0f} ms" for shape, t in timings))
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+
+    server = ModelServer(infer, args.socket, max_sessions=args.max_sessions, logger=logger)
+    logger.info(f"LAM model server listening on {args.socket} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Compact blendshape motion format for streaming bundles and offline export.
+
+Mounted next to ``infer.py`` (``engines/motion_codec.py``); numpy only.
+
+Weights are quantized to 8 or 16 bits over [0, 1] and sent as frame-to-frame
+deltas in the narrowest integer type that holds them (a 1 s slice of smooth
+motion at 8 bits is almost always int8). Per packet, channels that are zero
+throughout are dropped, and ``*Right`` channels that equal their ``*Left``
+partner after quantization (``symmetrize_blendshapes`` makes many pairs
+identical) are sent as "mirror" bits instead of data. The masks are decided
+per packet, so the format needs no prior knowledge of which channels the
+post-processing symmetrizes or silences.
+
+Packet (little-endian)::
+
+    u8   flags        bit 0 keyframe, bit 1 16-bit quantization, bits 2-3 delta width (int8/16/32)
+    u8   channels
+    u16  frames
+    u8[] coded mask   ceil(channels / 8), numpy bit order "little"
+    u8[] mirror mask  same size; mirrored channels copy their Left partner
+    int  deltas       [frames, coded channels]
+
+The first delta of a packet is relative to the previous packet's last frame,
+or to zero on a keyframe, so a decoder joining a stream starts at a keyframe.
+
+File (``.lamm``): ``LAMM``, u8 version, u8 bits, u16 fps, u16 names length,
+the names as a JSON list, then ``u32 length + packet`` records.
+"""
+
+import json
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MOTION_EXTENSION = ".lamm"
+MOTION_MAGIC = b"LAMM"
+MOTION_VERSION = 1
+
+_FLAG_KEYFRAME = 1
+_FLAG_16BIT = 2
+_DELTA_TYPES = (np.int8, np.int16, np.int32)
+_PACKET = struct.Struct("<BBH")
+_FILE = struct.Struct("<4sBBHH")
+_RECORD = struct.Struct("<I")
+
+
+def mirror_partners(names: Sequence[str]) -> np.ndarray:
+    """Index of each ``*Right`` channel's ``*Left`` partner, -1 for every other channel."""
+    index = {name: i for i, name in enumerate(names)}
+    return np.array([index.get(name[:-5] + "Left", -1) if name.endswith("Right") else -1 for name in names],
+                    dtype=np.int64)
+
+
+class MotionEncoder:
+    """Stateful encoder for one stream of [frames, channels] weights."""
+
+    def __init__(self, names: Sequence[str], bits: int = 8):
+        if bits not in (8, 16):
+            raise ValueError(f"motion quantization must be 8 or 16 bits, not {bits}")
+        self.names = list(names)
+        self.bits = bits
+        self.levels = (1 << bits) - 1
+        partners = mirror_partners(self.names)
+        self._right = np.flatnonzero(partners >= 0)
+        self._left = partners[self._right]
+        self._mask_bytes = (len(self.names) + 7) // 8
+        self._prev: Optional[np.ndarray] = None
+
+    def reset(self):
+        self._prev = None
+
+    def encode(self, frames: np.ndarray, keyframe: bool = False) -> bytes:
+        """Encodes the next frames of the stream; ``keyframe`` (implied for the first packet) resets the deltas."""
+        num_frames, channels = frames.shape
+        if channels != len(self.names):
+            raise ValueError(f"expected {len(self.names)} channels, got {channels}")
+        keyframe = keyframe or self._prev is None
+        prev = np.zeros(channels, dtype=np.int32) if keyframe else self._prev
+        q = np.rint(np.clip(frames, 0.0, 1.0) * self.levels).astype(np.int32)
+
+        zero = ~q.any(axis=0)
+        mirror = np.zeros(channels, dtype=bool)
+        mirror[self._right] = (q[:, self._right] == q[:, self._left]).all(axis=0)
+        mirror &= ~zero
+        coded = ~(zero | mirror)
+
+        if num_frames:
+            values = q[:, coded]
+            deltas = np.diff(values, axis=0, prepend=prev[coded][np.newaxis, :])
+            self._prev = q[-1]
+        else:
+            deltas = np.zeros((0, int(coded.sum())), dtype=np.int32)
+            self._prev = prev
+        peak = int(np.abs(deltas).max()) if deltas.size else 0
+        width = 0 if peak <= 127 else 1 if peak <= 32767 else 2
+        flags = (_FLAG_KEYFRAME if keyframe else 0) | (_FLAG_16BIT if self.bits == 16 else 0) | (width << 2)
+        return b"".join((
+            _PACKET.pack(flags, channels, num_frames),
+            np.packbits(coded, bitorder="little").tobytes(),
+            np.packbits(mirror, bitorder="little").tobytes(),
+            deltas.astype(_DELTA_TYPES[width]).tobytes(),
+        ))
+
+
+class MotionDecoder:
+    """Stateful decoder matching :class:`MotionEncoder`; returns float32 weights."""
+
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        self._partners = mirror_partners(self.names)
+        self._prev: Optional[np.ndarray] = None
+
+    def reset(self):
+        self._prev = None
+
+    def decode(self, packet: bytes) -> np.ndarray:
+        flags, channels, num_frames = _PACKET.unpack_from(packet)
+        if channels != len(self.names):
+            raise ValueError(f"packet has {channels} channels, decoder expects {len(self.names)}")
+        keyframe = bool(flags & _FLAG_KEYFRAME)
+        if not keyframe and self._prev is None:
+            raise ValueError("motion stream must start with a keyframe")
+        levels = 65535 if flags & _FLAG_16BIT else 255
+        mask_bytes = (channels + 7) // 8
+        offset = _PACKET.size
+        masks = np.frombuffer(packet, dtype=np.uint8, count=2 * mask_bytes, offset=offset)
+        coded = np.unpackbits(masks[:mask_bytes], count=channels, bitorder="little").astype(bool)
+        mirror = np.unpackbits(masks[mask_bytes:], count=channels, bitorder="little").astype(bool)
+        deltas = np.frombuffer(packet, dtype=_DELTA_TYPES[(flags >> 2) & 3], offset=offset + 2 * mask_bytes)
+        deltas = deltas.reshape(num_frames, int(coded.sum()))
+
+        prev = np.zeros(channels, dtype=np.int32) if keyframe else self._prev
+        q = np.zeros((num_frames, channels), dtype=np.int32)
+        q[:, coded] = np.cumsum(deltas, axis=0, dtype=np.int32) + prev[coded]
+        q[:, mirror] = q[:, self._partners[mirror]]
+        if num_frames:
+            self._prev = q[-1]
+        elif keyframe:
+            self._prev = prev
+        return q.astype(np.float32) / levels
+
+
+class MotionFileWriter:
+    """Writes a ``.lamm`` file packet by packet (same interface as offline.BlendshapeJSONWriter)."""
+
+    def __init__(self, path: str, blendshape_names: Sequence[str], fps: int = 30, bits: int = 8):
+        self.path = path
+        self.fps = fps
+        self.frame_count = 0
+        self._encoder = MotionEncoder(blendshape_names, bits)
+        names = json.dumps(list(blendshape_names)).encode()
+        self._file = open(path, "wb")
+        self._file.write(_FILE.pack(MOTION_MAGIC, MOTION_VERSION, bits, fps, len(names)) + names)
+
+    def write(self, frames: np.ndarray):
+        if not frames.shape[0]:
+            return
+        packet = self._encoder.encode(frames)
+        self._file.write(_RECORD.pack(len(packet)) + packet)
+        self.frame_count += frames.shape[0]
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_motion_file(path: str, frames: np.ndarray, blendshape_names: Sequence[str], fps: int = 30,
+                      bits: int = 8):
+    with MotionFileWriter(path, blendshape_names, fps, bits) as writer:
+        writer.write(frames)
+
+
+def read_motion_file(path: str) -> Tuple[List[str], int, np.ndarray]:
+    """Returns (names, fps, frames [num_frames, channels] float32) of a ``.lamm`` file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, _, fps, names_length = _FILE.unpack_from(data)
+    if magic != MOTION_MAGIC or version != MOTION_VERSION:
+        raise ValueError(f"{path} is not a LAM motion file")
+    offset = _FILE.size
+    names = json.loads(data[offset:offset + names_length])
+    offset += names_length
+    decoder = MotionDecoder(names)
+    chunks = [np.zeros((0, len(names)), dtype=np.float32)]
+    while offset < len(data):
+        (length,) = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        chunks.append(decoder.decode(data[offset:offset + length]))
+        offset += length
+    return names, fps, np.concatenate(chunks)
@@ -0,0 +1,153 @@
+"""Bounded-memory helpers for offline (whole-file) Audio2Expression runs.
+
+Mounted next to ``infer.py`` (``engines/offline.py``). Like ``streaming.py``
+this module has no torch / upstream imports.
+"""
+
+import itertools
+import json
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import soundfile as sf
+
+from .streaming import EXPRESSION_FPS, SavgolKernel, StreamResampler
+
+
+def iter_audio_windows(path: str,
+                       sample_rate: int,
+                       window_samples: int,
+                       step_samples: int,
+                       block_seconds: float = 5.0) -> Iterator[np.ndarray]:
+    """Yields overlapping mono windows of ``path`` resampled to ``sample_rate``.
+
+    The file is decoded block by block and resampled with a carried
+    :class:`StreamResampler`, so only about one window of audio is held in
+    memory. Consecutive windows start ``step_samples`` apart; the last one
+    may be shorter.
+    """
+    info = sf.info(path)
+    resampler = StreamResampler(info.samplerate, sample_rate) if info.samplerate != sample_rate else None
+    buffer = np.zeros(0, dtype=np.float32)
+    emitted = False
+    blocks = (block.mean(axis=1) for block in sf.blocks(path, blocksize=int(block_seconds * info.samplerate),
+                                                         dtype="float32", always_2d=True))
+    # after the last block, the resampler's flush emits the samples held back by its filter delay
+    for block in itertools.chain(blocks, [None]):
+        if block is None:
+            if resampler is None:
+                break
+            block = resampler.flush()
+        elif resampler is not None:
+            block = resampler(block)
+        buffer = np.concatenate([buffer, block])
+        while buffer.shape[0] >= window_samples:
+            yield buffer[:window_samples]
+            emitted = True
+            buffer = buffer[step_samples:]
+    # the remainder is only new audio if it extends past the previous window's overlap
+    if buffer.shape[0] > (window_samples - step_samples if emitted else 0):
+        yield buffer
+
+
+class WindowStitcher:
+    """Joins per-window predictions into one frame stream with linear crossfades.
+
+    ``push`` returns the frames that are final; the last ``overlap`` frames
+    of each window are held back until the next window (or :meth:`finish`).
+    """
+
+    def __init__(self, overlap: int):
+        self.overlap = overlap
+        self._tail: Optional[np.ndarray] = None
+        self._ramp = ((np.arange(overlap) + 1) / (overlap + 1)).astype(np.float32)[:, np.newaxis]
+
+    def push(self, frames: np.ndarray) -> np.ndarray:
+        if self._tail is not None:
+            n = min(self._tail.shape[0], frames.shape[0])
+            ramp = self._ramp[:n] if n == self.overlap else ((np.arange(n) + 1) / (n + 1))[:, np.newaxis]
+            frames = frames.copy()
+            frames[:n] = self._tail[:n] * (1 - ramp) + frames[:n] * ramp
+        keep = max(frames.shape[0] - self.overlap, 0)
+        self._tail = frames[keep:]
+        return frames[:keep]
+
+    def finish(self) -> np.ndarray:
+        tail, self._tail = self._tail, None
+        return tail if tail is not None else np.zeros((0, 0), dtype=np.float32)
+
+
+class StreamingSavgol:
+    """Savitzky-Golay smoothing over an unbounded frame stream.
+
+    Rows are emitted once their full window is available, so the output of
+    all ``push`` calls plus :meth:`finish` equals smoothing the concatenated
+    frames in one ``savgol_filter(mode='interp')`` call.
+    """
+
+    def __init__(self, window_length: int = 5, polyorder: int = 2):
+        self.kernel = SavgolKernel(window_length, polyorder)
+        self._buffer: Optional[np.ndarray] = None
+        self._emitted = 0  # rows of _buffer already emitted
+
+    def push(self, frames: np.ndarray) -> np.ndarray:
+        x = frames if self._buffer is None else np.concatenate([self._buffer, frames])
+        half = self.kernel.half
+        stop = x.shape[0] - half
+        if x.shape[0] < self.kernel.window_length or stop <= self._emitted:
+            self._buffer = x
+            return np.zeros((0,) + x.shape[1:], dtype=np.float32)
+        out = self.kernel(x, start=self._emitted)[:stop - self._emitted]
+        # keep the left context of the first unemitted row, and a full window for the right edge
+        drop = max(min(stop - half, x.shape[0] - self.kernel.window_length), 0)
+        self._buffer = x[drop:]
+        self._emitted = stop - drop
+        return out
+
+    def finish(self) -> np.ndarray:
+        if self._buffer is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        x, self._buffer = self._buffer, None
+        if x.shape[0] < self.kernel.window_length:
+            return x[self._emitted:].astype(np.float32)
+        return self.kernel(x, start=self._emitted)
+
+
+class BlendshapeJSONWriter:
+    """Writes the ``export_blendshape_animation`` JSON layout frame by frame.
+
+    The frame list is streamed to disk; ``metadata`` (which needs the final
+    frame count) is written after it, which JSON readers do not care about.
+    """
+
+    def __init__(self, path: str, blendshape_names: Sequence[str], fps: int = EXPRESSION_FPS):
+        self.path = path
+        self.names: List[str] = list(blendshape_names)
+        self.fps = fps
+        self.frame_count = 0
+        self._file = open(path, "w")
+        self._file.write('{\n  "names": ' + json.dumps(self.names) + ',\n  "frames": [')
+
+    def write(self, frames: np.ndarray):
+        parts = []
+        for weights in frames:
+            parts.append(('\n' if self.frame_count == 0 else ',\n') + json.dumps({
+                "weights": [float(w) for w in weights],
+                "time": self.frame_count / self.fps,
+                "rotation": [],
+            }))
+            self.frame_count += 1
+        self._file.write("".join(parts))
+
+    def close(self):
+        if self._file.closed:
+            return
+        metadata = {"fps": self.fps, "frame_count": self.frame_count, "blendshape_names": self.names}
+        self._file.write('\n  ],\n  "metadata": ' + json.dumps(metadata) + '\n}\n')
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,207 @@
+"""Pipelined per-session inference executor for HandlerAvatarLAM.
+
+Mounted next to the handler (``handlers/avatar/lam/pipeline.py``). Independent
+of torch and of the chat engine: the three stages are injected, so the
+scheduling can be exercised on CPU with stand-ins.
+
+    handler thread --submit--> [per-session queues]
+        --> forward thread   (one head job per session, batched across sessions)
+        --> postprocess thread
+        --> output thread    (builds and submits the DataBundle)
+
+Each stage is a single thread fed in FIFO order, and a session contributes at
+most one job per forward batch, so outputs of a session stay in submission
+order while different stages work on different slices at the same time.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# forward(jobs) -> one result per job; postprocess(job, result) -> processed; output(job, processed)
+ForwardStage = Callable[[List[Any]], List[Any]]
+PostprocessStage = Callable[[Any, Any], Any]
+OutputStage = Callable[[Any, Any], None]
+ErrorHandler = Callable[[str, Any, BaseException], None]
+
+
+class _Session:
+    __slots__ = ("pending", "outstanding", "closed")
+
+    def __init__(self):
+        self.pending = deque()  # submitted, not yet forwarded
+        self.outstanding = 0  # submitted, not yet through the output stage
+        self.closed = False
+
+
+def _print_error(stage: str, job: Any, error: BaseException):
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+
+class InferenceExecutor:
+    """Runs forward / post-processing / output stages for many sessions.
+
+    :meth:`submit` blocks while the session already has ``queue_size`` jobs
+    anywhere in the pipeline, which pushes back on the handler thread feeding
+    it instead of buffering unbounded audio.
+
+    Once a job is pending, the forward stage waits up to ``max_wait_ms`` for
+    the other open sessions to queue theirs (or until ``max_batch_size`` are
+    pending), so sessions whose slices arrive a few milliseconds apart still
+    share a forward pass. It does not wait when no other session is open.
+    """
+
+    def __init__(self,
+                 forward: ForwardStage,
+                 postprocess: PostprocessStage,
+                 output: OutputStage,
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 8.0,
+                 queue_size: int = 4,
+                 on_error: Optional[ErrorHandler] = None,
+                 name: str = "lam"):
+        self.forward = forward
+        self.postprocess = postprocess
+        self.output = output
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.queue_size = max(1, queue_size)
+        self.on_error = on_error or _print_error
+        self._sessions: Dict[Hashable, _Session] = {}
+        self._order: deque = deque()  # round-robin order of sessions for the forward stage
+        self._cond = threading.Condition()
+        self._closed = False
+        self._postprocess_queue: "queue.Queue" = queue.Queue()
+        self._output_queue: "queue.Queue" = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._run_forward, name=f"{name}-forward", daemon=True),
+            threading.Thread(target=self._run_postprocess, name=f"{name}-postprocess", daemon=True),
+            threading.Thread(target=self._run_output, name=f"{name}-output", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, session_id: Hashable, job: Any, timeout: Optional[float] = None) -> bool:
+        """Queues ``job`` for ``session_id``; returns False if it timed out waiting for space."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("InferenceExecutor is closed")
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session()
+                self._order.append(session_id)
+            if not self._cond.wait_for(lambda: session.outstanding < self.queue_size or session.closed,
+                                       timeout=timeout):
+                return False
+            if session.closed:
+                return False
+            session.pending.append(job)
+            session.outstanding += 1
+            self._cond.notify_all()
+            return True
+
+    def depth(self, session_id: Hashable) -> int:
+        """Jobs of ``session_id`` currently in the pipeline."""
+        with self._cond:
+            session = self._sessions.get(session_id)
+            return 0 if session is None else session.outstanding
+
+    def close_session(self, session_id: Hashable):
+        """Drops the session's queued jobs; jobs already past the forward stage are not output."""
+        with self._cond:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return
+            session.closed = True
+            session.outstanding -= len(session.pending)
+            session.pending.clear()
+            try:
+                self._order.remove(session_id)
+            except ValueError:
+                pass
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next_batch(self) -> Optional[List[tuple]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or any(s.pending for s in self._sessions.values()))
+            if self._closed:
+                return None
+            if self.max_batch_size > 1 and self.max_wait > 0:
+                def full():
+                    wanted = min(self.max_batch_size, len(self._sessions))
+                    return self._closed or sum(1 for s in self._sessions.values() if s.pending) >= wanted
+                deadline = time.monotonic() + self.max_wait
+                while not full():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return None
+            batch = []
+            # one head job per session, starting after the sessions served last time
+            for _ in range(len(self._order)):
+                session_id = self._order[0]
+                self._order.rotate(-1)
+                session = self._sessions[session_id]
+                if session.pending:
+                    batch.append((session, session.pending.popleft()))
+                    if len(batch) == self.max_batch_size:
+                        break
+            return batch
+
+    def _run_forward(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                self._postprocess_queue.put(None)
+                return
+            jobs = [job for _, job in batch]
+            try:
+                results = self.forward(jobs)
+            except Exception as e:
+                self.on_error("forward", jobs, e)
+                results = [None] * len(jobs)
+            for (session, job), result in zip(batch, results):
+                self._postprocess_queue.put((session, job, result))
+
+    def _run_postprocess(self):
+        while True:
+            item = self._postprocess_queue.get()
+            if item is None:
+                self._output_queue.put(None)
+                return
+            session, job, result = item
+            processed = None
+            if not session.closed:
+                try:
+                    processed = self.postprocess(job, result)
+                except Exception as e:
+                    self.on_error("postprocess", job, e)
+            self._output_queue.put((session, job, processed))
+
+    def _run_output(self):
+        while True:
+            item = self._output_queue.get()
+            if item is None:
+                return
+            session, job, processed = item
+            if not session.closed:
+                try:
+                    self.output(job, processed)
+                except Exception as e:
+                    self.on_error("output", job, e)
+            with self._cond:
+                if not session.closed:
+                    session.outstanding -= 1
+                self._cond.notify_all()
@@ -0,0 +1,106 @@
+"""In-process vocal separation for offline Audio2Expression runs.
+
+Mounted next to ``infer.py`` (``engines/separation.py``). Separators are
+registered in ``SEPARATORS`` and built once per ``Audio2ExpressionInfer``
+(``cfg.vocal_separator``, default ``SpleeterSeparator``); they take and return
+in-memory mono arrays instead of round-tripping files through a CLI.
+
+:func:`speech_check` is the cheap pre-check that lets already clean speech
+(TTS output, studio voice-over) bypass separation entirely.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from utils.registry import Registry
+
+from .streaming import StreamResampler
+
+SEPARATORS = Registry("separator")
+
+
+class SpeechCheck(NamedTuple):
+    pause_ratio: float     # fraction of audible frames more than pause_db below the loud frames
+    floor_flatness: float  # median spectral flatness of the quietest audible frames
+    clean: bool
+
+
+def speech_check(audio: np.ndarray,
+                 sample_rate: int,
+                 pause_db: float = 30.0,
+                 min_pause_ratio: float = 0.1,
+                 min_floor_flatness: float = 0.3,
+                 silence_db: float = -70.0,
+                 frame_seconds: float = 0.032) -> SpeechCheck:
+    """Decides whether ``audio`` is speech without accompaniment.
+
+    Speech alone has pauses: frames far below the level of the voiced ones.
+    With music underneath, those gaps are filled, and what fills them is
+    tonal (low spectral flatness) rather than broadband room noise. Both must
+    hold for the clip to count as clean.
+
+    Leading and trailing quiet (an intro or outro) is trimmed first, and
+    digitally silent frames (below ``silence_db`` dBFS) are left out of both
+    statistics: they say nothing about what plays under the voice, and a
+    silent frame's spectrum is undefined rather than flat.
+    """
+    frame = max(int(sample_rate * frame_seconds), 64)
+    num_frames = audio.shape[0] // frame
+    if num_frames < 8:
+        return SpeechCheck(0.0, 0.0, False)
+    frames = audio[:num_frames * frame].reshape(num_frames, frame).astype(np.float32)
+
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    loud = np.percentile(energy_db, 90)
+    audible = np.flatnonzero(energy_db >= loud - pause_db)
+    if audible.shape[0] == 0:
+        return SpeechCheck(0.0, 0.0, False)
+    keep = slice(audible[0], audible[-1] + 1)
+    frames, energy_db = frames[keep], energy_db[keep]
+    audible = energy_db > silence_db
+    frames, energy_db = frames[audible], energy_db[audible]
+    if frames.shape[0] < 8:
+        return SpeechCheck(0.0, 0.0, False)
+
+    loud = np.percentile(energy_db, 90)
+    pause_ratio = float(np.mean(energy_db < loud - pause_db))
+
+    quiet = frames[energy_db <= np.percentile(energy_db, 20)]
+    power = np.abs(np.fft.rfft(quiet * np.hanning(frame), axis=1)) ** 2
+    power = np.maximum(power, np.mean(power, axis=1, keepdims=True) * 1e-12)
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    floor_flatness = float(np.median(flatness))
+
+    clean = pause_ratio >= min_pause_ratio and floor_flatness >= min_floor_flatness
+    return SpeechCheck(pause_ratio, floor_flatness, clean)
+
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """One-shot resample of a whole array, flushing the resampler's filter delay."""
+    resampler = StreamResampler(orig_sr, target_sr)
+    return np.concatenate([resampler(audio), resampler.flush()])
+
+
+@SEPARATORS.register_module()
+class SpleeterSeparator:
+    """Spleeter 2-stem separation, with the TensorFlow graph loaded once and reused."""
+
+    sample_rate = 44100
+
+    def __init__(self, model: str = "spleeter:2stems"):
+        from spleeter.separator import Separator
+
+        self.separator = Separator(model, multiprocess=False)
+
+    def __call__(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        waveform = audio if sample_rate == self.sample_rate else resample(audio, sample_rate, self.sample_rate)
+        stems = self.separator.separate(np.stack([waveform, waveform], axis=1))
+        vocals = stems["vocals"].mean(axis=1).astype(np.float32)
+        if sample_rate != self.sample_rate:
+            vocals = resample(vocals, self.sample_rate, sample_rate)
+        # the resampling round trip can be a sample off; keep the length of the input
+        out = np.zeros(audio.shape[0], dtype=np.float32)
+        n = min(out.shape[0], vocals.shape[0])
+        out[:n] = vocals[:n]
+        return out
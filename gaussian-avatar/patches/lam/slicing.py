@@ -0,0 +1,109 @@
+"""Adaptive input slicing for HandlerAvatarLAM.
+
+Mounted next to the handler (``handlers/avatar/lam/slicing.py``). Drop-in for
+the fixed-size ``engine_utils.general_slicer`` slice context: the first slice
+of every speech is short so motion starts quickly, later slices grow along a
+schedule for throughput. numpy only.
+"""
+
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# slices are kept on a 0.1 s grid: a whole number of 30 fps expression frames,
+# and of wav2vec2 frames (20 ms) after resampling to 16 kHz
+SLICE_GRID_SECONDS = 0.1
+
+
+class AdaptiveSliceContext:
+    """Cuts a speech's audio stream into slices of growing size.
+
+    ``schedule`` lists slice durations in seconds; after the last entry the
+    last size repeats. The schedule restarts after :meth:`flush` (end of a
+    speech) or :meth:`reset`. A schedule of ``[1.0]`` reproduces the fixed
+    one-second slicing.
+
+    Incoming audio is copied once, straight into a ring of ``ring_slices``
+    preallocated float32 slice buffers, and every slice handed out is a view
+    of its buffer: nothing is allocated or copied per slice. A buffer is
+    written again ``ring_slices - 1`` slices later, so the ring must cover
+    every slice still in use (in flight in the executor, or in a bundle not
+    yet consumed downstream).
+    """
+
+    def __init__(self, sample_rate: int, schedule: Sequence[float] = (1.0,), ring_slices: int = 8):
+        if not schedule:
+            raise ValueError("slice schedule must not be empty")
+        self.sample_rate = sample_rate
+        grid = sample_rate * SLICE_GRID_SECONDS
+        self.sizes: List[int] = [int(round(max(round(s / SLICE_GRID_SECONDS), 1) * grid)) for s in schedule]
+        self.ring = np.zeros((max(ring_slices, 2), max(self.sizes)), dtype=np.float32)
+        self._slot = 0
+        self._filled = 0
+        self._index = 0
+
+    @property
+    def next_size(self) -> int:
+        return self.sizes[min(self._index, len(self.sizes) - 1)]
+
+    def reset(self):
+        self._filled = 0
+        self._index = 0
+
+    def _take(self, size: int) -> np.ndarray:
+        view = self.ring[self._slot, :size]
+        self._slot = (self._slot + 1) % self.ring.shape[0]
+        self._filled = 0
+        return view
+
+    def slice(self, audio: np.ndarray) -> Iterator[np.ndarray]:
+        """Buffers ``audio`` and yields every slice that is complete.
+
+        Slices are float32 views of the ring, so the handler can pass them to the model and
+        the DataBundle without conversion or copy. ``audio`` is read while the iterator
+        advances, so iterate to the end before reusing it.
+        """
+        audio = np.asarray(audio)
+        offset = 0
+        while offset < audio.shape[0]:
+            size = self.next_size
+            count = min(size - self._filled, audio.shape[0] - offset)
+            self.ring[self._slot, self._filled:self._filled + count] = audio[offset:offset + count]
+            self._filled += count
+            offset += count
+            if self._filled == size:
+                self._index += 1
+                yield self._take(size)
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Returns the incomplete remainder (or None) and restarts the schedule."""
+        remainder = self._take(self._filled) if self._filled else None
+        self.reset()
+        return remainder
+
+    def slice_speech(self, audio: np.ndarray, speech_end: bool,
+                     end_marker_samples: int = 50) -> Iterator[Tuple[np.ndarray, bool]]:
+        """Yields ``(slice, last)`` for ``audio``; ``last`` marks the final slice of a speech.
+
+        On ``speech_end`` the remainder is flushed as the last slice, or a short silent
+        marker if nothing is left, so the speech is always closed by one slice. Slices are
+        yielded as soon as they are cut, holding back one only to tell if it is the last.
+        """
+        if not speech_end:
+            for audio_slice in self.slice(audio):
+                yield audio_slice, False
+            return
+        held = None
+        for audio_slice in self.slice(audio):
+            if held is not None:
+                yield held, False
+            held = audio_slice
+        remainder = self.flush()
+        if remainder is not None:
+            if held is not None:
+                yield held, False
+            held = remainder
+        if held is None:
+            self.ring[self._slot, :end_marker_samples] = 0
+            held = self._take(end_marker_samples)
+        yield held, True
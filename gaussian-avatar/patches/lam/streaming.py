@@ -0,0 +1,583 @@
+"""Streaming state helpers for LAM Audio2Expression.
+
+Mounted next to ``infer.py`` (``engines/streaming.py``) and kept free of
+torch / upstream imports so it can be benchmarked on its own.
+"""
+
+import os
+import struct
+from functools import lru_cache
+from math import gcd
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+from scipy.signal import firwin, savgol_coeffs
+
+# Frames of expression context the streaming model sees per forward pass
+MAX_FRAME_LENGTH = 64
+EXPRESSION_FPS = 30
+NUM_BLENDSHAPES = 52
+# Processed frames carried into the next chunk's post-processing: the whole
+# expression history, which mouth smoothing and frame blending read
+POSTPROCESS_CONTEXT_FRAMES = MAX_FRAME_LENGTH
+# eyeBlinkLeft / eyeBlinkRight in ARKitBlendShape order
+BLINK_CHANNELS = (8, 9)
+
+SNAPSHOT_MAGIC = b"LAMS"
+SNAPSHOT_VERSION = 2
+_SNAPSHOT_INITIAL = 1
+_SNAPSHOT_AUDIO = 2
+# magic, version, flags, audio_sr, max_frame_length, num_channels,
+# resampler (orig_sr, consumed, next), volume meter sample rate, next blink, audio scale,
+# then the used lengths of the fixed-size sections that follow, in this order:
+# audio window (int16 PCM), expression tail (frames), volume tail, resampler history,
+# meter remainder, pending blink (float16, zero-padded to their capacity)
+_SNAPSHOT_HEADER = struct.Struct("<4sBBIHHIqqIif6I")
+
+
+class MirroredRing:
+    """Fixed-capacity ring buffer whose newest items are always contiguous.
+
+    Every item is written twice (at ``i`` and ``i + capacity``), so the last
+    ``k`` items can be returned as a plain slice of the backing array without
+    copying or re-allocating. Views returned by :meth:`last` alias the buffer
+    and are only valid until the next :meth:`extend`.
+    """
+
+    def __init__(self, capacity: int, width: Optional[int] = None, dtype=np.float32):
+        shape = (2 * capacity,) if width is None else (2 * capacity, width)
+        self.capacity = capacity
+        self._buf = np.zeros(shape, dtype=dtype)
+        self._pos = 0
+        self.size = 0
+
+    def clear(self):
+        self._buf.fill(0)
+        self._pos = 0
+        self.size = 0
+
+    def extend(self, values: np.ndarray):
+        cap = self.capacity
+        n = values.shape[0]
+        if n >= cap:
+            values = values[n - cap:]
+            n = cap
+        first = min(n, cap - self._pos)
+        head, tail = values[:first], values[first:]
+        self._buf[self._pos:self._pos + first] = head
+        self._buf[self._pos + cap:self._pos + cap + first] = head
+        if tail.shape[0]:
+            self._buf[:tail.shape[0]] = tail
+            self._buf[cap:cap + tail.shape[0]] = tail
+        self._pos = (self._pos + n) % cap
+        self.size = min(self.size + n, cap)
+
+    def last(self, k: Optional[int] = None) -> np.ndarray:
+        """Returns a view of the newest ``k`` items (defaults to all stored)."""
+        k = self.size if k is None else min(k, self.capacity)
+        end = self._pos + self.capacity
+        return self._buf[end - k:end]
+
+    def window(self) -> np.ndarray:
+        """Returns the full ``capacity`` window, zero-padded on the left."""
+        return self.last(self.capacity)
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(orig_sr: int, target_sr: int, taps_per_phase: int = 32) -> Tuple[int, int, np.ndarray]:
+    """Designs the anti-aliasing filter for ``orig_sr -> target_sr`` once.
+
+    Returns ``(up, down, h)`` with ``h`` the upsampled-domain FIR filter
+    (odd length, so its group delay is a whole sample).
+    """
+    g = gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // g, int(orig_sr) // g
+    num_taps = up * taps_per_phase - 1
+    h = firwin(num_taps, 0.95 / max(up, down), window=("kaiser", 8.0)) * up
+    return up, down, h.astype(np.float32)
+
+
+class StreamResampler:
+    """Stateful polyphase resampler for one audio stream.
+
+    The filter comes from :func:`polyphase_filter` (designed once per rate
+    pair). Only the output samples a chunk completes are computed, from an
+    input buffer reused across calls, so the returned array is the only
+    sizeable per-chunk allocation. Outputs ``up`` apart share a phase and
+    read input windows a fixed ``down`` samples apart. With few phases
+    (24 / 48 / 8 kHz input) each phase is one einsum over a strided view of
+    the buffer; with many (44.1 / 22.05 kHz) a round of ``up`` consecutive
+    outputs is one banded [input, phase] matrix (see :meth:`_band`), and all
+    rounds of a chunk are a single matmul with it. Either way only the wanted
+    outputs are computed. Chunked output matches resampling the concatenated
+    stream in one go (exactly on the einsum path, to float32 rounding on the
+    matmul path, whose summation order depends on the chunking). Output is
+    aligned to the input (the filter delay is compensated), which means the
+    newest few output samples of a chunk are emitted with the next chunk, or
+    by :meth:`flush`.
+    """
+
+    max_einsum_phases = 16
+
+    def __init__(self, orig_sr: int, target_sr: int, taps_per_phase: int = 32):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up, self.down, self.h = polyphase_filter(orig_sr, target_sr, taps_per_phase)
+        self.delay = (self.h.shape[0] - 1) // 2
+        self.taps = -(-self.h.shape[0] // self.up)
+        padded = np.zeros(self.up * self.taps, dtype=np.float32)
+        padded[:self.h.shape[0]] = self.h
+        # row p, dotted with input [n - taps + 1, n], is the output at upsampled index n * up + p
+        self._phases = np.ascontiguousarray(padded.reshape(self.taps, self.up).T[:, ::-1])
+        self._buf = np.zeros(0, dtype=np.float32)
+        self._band_cache: Optional[Tuple[int, np.ndarray]] = None  # many-phase path, see _band
+        self.reset()
+
+    def reset(self):
+        # zeros standing in for the input before the stream starts
+        self._history = np.zeros(self.taps, dtype=np.float32)
+        self._consumed = 0  # input samples seen so far
+        self._next = 0  # index of the next output sample
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        history = self._history.shape[0]
+        size = history + x.shape[0]
+        if self._buf.shape[0] < size:
+            buf = np.empty(max(size, 2 * self._buf.shape[0]), dtype=np.float32)
+            buf[:history] = self._history
+            self._buf = buf
+        else:
+            self._buf[:history] = self._history  # may overlap its old place in the buffer
+        buf = self._buf
+        buf[history:size] = x
+        buf_start = self._consumed - history  # input index of buf[0]
+        self._consumed += x.shape[0]
+
+        # output k needs input up to index (k * down + delay) // up
+        last = (self._consumed * self.up - 1 - self.delay) // self.down
+        count = max(last + 1 - self._next, 0)
+        if count and self.up > self.max_einsum_phases:
+            out = self._banded(buf[:size], buf_start, count)
+        else:
+            out = np.empty(count, dtype=np.float32)
+            windows = sliding_window_view(buf[:size], self.taps) if count else None
+            for r in range(min(self.up, count)):
+                m = (self._next + r) * self.down + self.delay
+                start = m // self.up - self.taps + 1 - buf_start
+                n = len(range(r, count, self.up))
+                # einsum keeps the contiguous tap axis vectorised where matmul falls back to a scalar loop
+                np.einsum("ij,j->i", windows[start:start + (n - 1) * self.down + 1:self.down],
+                          self._phases[m % self.up], out=out[r::self.up])
+        self._next += count
+
+        first = (self._next * self.down + self.delay) // self.up - self.taps + 1
+        self._history = buf[first - buf_start:size]
+        return out
+
+    def _band(self, alignment: int) -> np.ndarray:
+        """[input offset, phase row] matrix of one round of ``up`` outputs starting at ``_next``.
+
+        Depends only on ``_next % up``, so it is kept for the last alignment seen (fixed
+        for chunks of a whole number of seconds).
+        """
+        if self._band_cache is not None and self._band_cache[0] == alignment:
+            return self._band_cache[1]
+        m = (alignment + np.arange(self.up)) * self.down + self.delay
+        offsets = m // self.up - m[0] // self.up
+        band = np.zeros((offsets[-1] + self.taps, self.up), dtype=np.float32)
+        band[offsets[:, None] + np.arange(self.taps), np.arange(self.up)[:, None]] = self._phases[m % self.up]
+        self._band_cache = (alignment, band)
+        return band
+
+    def _banded(self, buf: np.ndarray, buf_start: int, count: int) -> np.ndarray:
+        """Outputs ``_next .. _next + count`` for many phases, computing only those."""
+        band = self._band(self._next % self.up)
+        start = (self._next * self.down + self.delay) // self.up - self.taps + 1 - buf_start
+        out = np.empty(count, dtype=np.float32)
+        rounds, rest = divmod(count, self.up)
+        if rounds:
+            # round j reads the same band of input, down * j samples later: one matmul for all rounds
+            step = buf.strides[0]
+            rows = as_strided(buf[start:], shape=(rounds, band.shape[0]), strides=(step * self.down, step),
+                              writeable=False)
+            np.matmul(rows, band, out=out[:rounds * self.up].reshape(rounds, self.up))
+        if rest:
+            used = band[:, :rest].any(axis=1).nonzero()[0][-1] + 1
+            base = start + rounds * self.down
+            np.matmul(buf[base:base + used], band[:used, :rest], out=out[rounds * self.up:])
+        return out
+
+    def flush(self) -> np.ndarray:
+        """Returns the outputs still held back by the filter delay and resets the stream.
+
+        Afterwards the stream has produced ``ceil(consumed * target_sr / orig_sr)``
+        samples in total, as a one-shot resample of the whole input would.
+        """
+        total = -(-self._consumed * self.up // self.down)
+        remaining = total - self._next
+        consumed = self._consumed
+        out = self(np.zeros(self.taps, dtype=np.float32))[:max(remaining, 0)]
+        self._consumed = consumed
+        self.reset()
+        return out
+
+
+class VolumeMeter:
+    """Stateful 30 fps RMS meter.
+
+    Frames are non-overlapping ``sample_rate // 30`` sample blocks on the
+    stream's own timeline; samples that do not fill a frame are carried into
+    the next chunk. :meth:`__call__` returns exactly ``num_frames`` values so
+    the volume lines up with the expression frames produced for the chunk:
+    a trailing partial frame is measured on the samples available, and
+    complete frames beyond ``num_frames`` are kept for the next call.
+    """
+
+    def __init__(self, sample_rate: int, fps: int = EXPRESSION_FPS):
+        self.sample_rate = sample_rate
+        self.hop = int(sample_rate / fps)
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def reset(self):
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def __call__(self, audio: np.ndarray, num_frames: int) -> np.ndarray:
+        if self._pending.shape[0]:
+            audio = np.concatenate([self._pending, audio.astype(np.float32, copy=False)])
+        complete = min(audio.shape[0] // self.hop, num_frames)
+        used = complete * self.hop
+        volume = np.empty(num_frames, dtype=np.float32)
+        if complete:
+            blocks = audio[:used].reshape(complete, self.hop).astype(np.float32, copy=False)
+            volume[:complete] = np.sqrt(np.einsum("ij,ij->i", blocks, blocks) / self.hop)
+        remainder = audio[used:]
+        if complete < num_frames:
+            # trailing partial frame: measured now, its samples still open the next frame
+            level = np.sqrt(np.mean(np.square(remainder))) if remainder.shape[0] else 0.0
+            volume[complete:] = level
+        self._pending = remainder.astype(np.float32, copy=True)
+        return volume
+
+
+class SavgolKernel:
+    """Vectorized Savitzky-Golay smoothing along the frame axis.
+
+    Matches ``scipy.signal.savgol_filter(..., axis=0, mode='interp')`` over
+    the whole input but only evaluates rows from ``start`` onwards, so a
+    streaming caller can pass ``window_length // 2`` frames of history plus
+    the new frames and pay for the new frames only.
+    """
+
+    def __init__(self, window_length: int = 5, polyorder: int = 2, dtype=np.float32):
+        self.window_length = window_length
+        self.half = window_length // 2
+        # coefficient rows for every position inside the window; the centre row is the interior filter
+        self.coeffs = np.stack([
+            savgol_coeffs(window_length, polyorder, pos=pos, use="dot") for pos in range(window_length)
+        ]).astype(dtype)
+
+    def __call__(self, x: np.ndarray, start: int = 0) -> np.ndarray:
+        n, w, half = x.shape[0], self.window_length, self.half
+        if n < w:
+            return x[start:].copy()
+        out = np.empty((n - start,) + x.shape[1:], dtype=self.coeffs.dtype)
+        # interior rows [max(start, half), n - half)
+        lo = max(start, half)
+        if lo < n - half:
+            windows = sliding_window_view(x[lo - half:], w, axis=0)  # [rows, ..., w]
+            out[lo - start:n - half - start] = windows @ self.coeffs[half]
+        # edge rows are evaluated from the polynomial fitted to the first / last window
+        for row in range(start, min(half, n)):
+            out[row - start] = self.coeffs[row] @ x[:w]
+        for row in range(max(start, n - half), n):
+            out[row - start] = self.coeffs[row - (n - w)] @ x[n - w:]
+        return out
+
+
+class BlinkScheduler:
+    """Stateful random eye-blink injection for streamed expression frames.
+
+    Keeps the countdown to the next blink and any blink that straddles a
+    chunk boundary, so blinks are spaced naturally across chunks without
+    re-scanning the expression history.
+    """
+
+    def __init__(self,
+                 channels: Sequence[int] = BLINK_CHANNELS,
+                 interval: Tuple[int, int] = (60, 150),
+                 duration: Tuple[int, int] = (6, 10),
+                 intensity: Tuple[float, float] = (0.8, 1.0),
+                 seed: Optional[int] = None):
+        self.channels = list(channels)
+        self.interval = interval
+        self.duration = duration
+        self.intensity = intensity
+        self._rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        self._next_blink = int(self._rng.integers(*self.interval))
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def _new_blink(self) -> np.ndarray:
+        length = int(self._rng.integers(*self.duration))
+        scale = self._rng.uniform(*self.intensity)
+        return (np.sin(np.linspace(0, np.pi, length + 2)[1:-1]) * scale).astype(np.float32)
+
+    def __call__(self, expression: np.ndarray) -> np.ndarray:
+        """Adds blinks to ``expression`` [frames, channels] in place and returns it."""
+        n = expression.shape[0]
+        profile = np.zeros(n, dtype=np.float32)
+        carried = min(self._pending.shape[0], n)
+        profile[:carried] = self._pending[:carried]
+        self._pending = self._pending[carried:]
+        pos = self._next_blink
+        while pos < n:
+            blink = self._new_blink()
+            end = min(pos + blink.shape[0], n)
+            profile[pos:end] = blink[:end - pos]
+            self._pending = blink[end - pos:]
+            pos += blink.shape[0] + int(self._rng.integers(*self.interval))
+        self._next_blink = pos - n
+        blink_channels = expression[:, self.channels]
+        expression[:, self.channels] = np.maximum(blink_channels, profile[:, np.newaxis])
+        return expression
+
+
+class StreamingStep(NamedTuple):
+    """One prepared streaming chunk, between the input and the output stage."""
+
+    context: "StreamingContext"
+    window: np.ndarray  # model input window (view into context.audio)
+    start_frame: int  # first window frame belonging to this chunk
+    volume: np.ndarray  # volume per new frame
+    key: Optional[bytes] = None  # expression cache key (expression_cache.py), None when caching is off
+    cached: Optional[np.ndarray] = None  # cached post-processed frames; the forward pass is skipped
+
+
+class StreamingContext:
+    """Per-session streaming state for ``infer_streaming_audio``.
+
+    Replaces the ``DEFAULT_CONTEXT`` dict: the audio window, expression
+    history and volume history live in preallocated ring buffers that are
+    updated in place on every chunk.
+    """
+
+    def __init__(self,
+                 audio_sr: int = 16000,
+                 max_frame_length: int = MAX_FRAME_LENGTH,
+                 num_channels: int = NUM_BLENDSHAPES,
+                 blink_channels: Sequence[int] = BLINK_CHANNELS):
+        self.audio_sr = audio_sr
+        self.max_frame_length = max_frame_length
+        self.window_samples = audio_sr * max_frame_length // EXPRESSION_FPS
+        self.audio = MirroredRing(self.window_samples)
+        self.expression = MirroredRing(max_frame_length, num_channels)
+        self.volume = MirroredRing(max_frame_length)
+        self.is_initial_input = True
+        self.blinks = BlinkScheduler(blink_channels)
+        self.resampler: Optional[StreamResampler] = None
+        self.volume_meter: Optional[VolumeMeter] = None
+        # encoder features of the last window and samples pushed since (engines/feature_cache.py)
+        self.feature_cache = None
+        self.feature_shift = 0
+        # expression cache key of the last slice since the speech start (expression_cache.chain_key)
+        self.cache_chain = b""
+
+    def reset(self):
+        self.audio.clear()
+        self.expression.clear()
+        self.volume.clear()
+        self.is_initial_input = True
+        self.blinks.reset()
+        if self.resampler is not None:
+            self.resampler.reset()
+        if self.volume_meter is not None:
+            self.volume_meter.reset()
+        self.feature_cache = None
+        self.feature_shift = 0
+        self.cache_chain = b""
+
+    def resample(self, audio: np.ndarray, orig_sr: int, final: bool = False) -> np.ndarray:
+        """Resamples a chunk to ``audio_sr`` with the session's stateful resampler.
+
+        On the ``final`` chunk of a speech the samples held back by the filter delay are flushed too.
+        """
+        if self.resampler is None or self.resampler.orig_sr != orig_sr:
+            self.resampler = StreamResampler(orig_sr, self.audio_sr)
+        elif self.is_initial_input:
+            self.resampler.reset()
+        out = self.resampler(audio)
+        if final:
+            out = np.concatenate([out, self.resampler.flush()])
+        return out
+
+    def measure_volume(self, audio: np.ndarray, sample_rate: int, num_frames: int) -> np.ndarray:
+        """Returns one RMS value per expression frame of this chunk, measured at its native rate."""
+        if self.volume_meter is None or self.volume_meter.sample_rate != sample_rate:
+            self.volume_meter = VolumeMeter(sample_rate)
+        elif self.is_initial_input:
+            self.volume_meter.reset()
+        return self.volume_meter(audio, num_frames)
+
+    def push_audio(self, in_audio: np.ndarray) -> np.ndarray:
+        """Appends resampled audio and returns the model input window.
+
+        On the initial input the window is the new audio left-padded with
+        silence; afterwards it is the tail of the previous window followed by
+        the new audio. The input side (resampler, volume meter, audio window)
+        leaves the initial state here, so the next chunk can be prepared
+        before this one's expression has been pushed.
+        """
+        if self.is_initial_input:
+            self.audio.clear()
+            self.feature_cache = None
+            self.feature_shift = 0
+        self.audio.extend(in_audio)
+        self.feature_shift += in_audio.shape[0]
+        self.is_initial_input = False
+        return self.audio.window()
+
+    def push_expression(self, expression: np.ndarray, volume: np.ndarray):
+        self.expression.extend(expression)
+        self.volume.extend(volume)
+
+    @property
+    def previous_expression(self) -> Optional[np.ndarray]:
+        return self.expression.last() if self.expression.size else None
+
+    @property
+    def previous_volume(self) -> Optional[np.ndarray]:
+        return self.volume.last() if self.volume.size else None
+
+    def postprocess_tail(self, max_frames: int = POSTPROCESS_CONTEXT_FRAMES):
+        """Returns the newest processed expression and volume frames (equal length) for post-processing."""
+        k = min(max_frames, self.expression.size, self.volume.size)
+        return self.expression.last(k), self.volume.last(k)
+
+    def _snapshot_capacities(self, resampler_sr: int, meter_sr: int) -> Tuple[int, ...]:
+        """Section sizes of a snapshot; fixed for a given configuration and input sample rate."""
+        history = StreamResampler(resampler_sr, self.audio_sr).taps if resampler_sr else 0
+        pending = VolumeMeter(meter_sr).hop if meter_sr else 0
+        return (self.window_samples, POSTPROCESS_CONTEXT_FRAMES, POSTPROCESS_CONTEXT_FRAMES,
+                history, pending, self.blinks.duration[1])
+
+    def to_bytes(self, compact: bool = False) -> bytes:
+        """Serialises the session state: a header followed by fixed-size sections.
+
+        Keeps what the next chunk reads: the model's audio window as int16
+        PCM (scaled to its peak), the post-processing tail, the resampler /
+        volume meter carry-over and the blink countdown as float16. Every
+        section is zero-padded to its capacity, so the size only depends on
+        the configuration and the input sample rate. The wav2vec2 feature
+        cache is dropped (the next window is re-encoded in full).
+
+        The default snapshot continues the session up to int16 / float16
+        rounding and is dominated by the audio window (about 75 KiB at 16 kHz
+        and 64 frames). ``compact=True`` leaves the window out (about 8 KiB at
+        24 kHz input) and is lossy; :meth:`load_bytes` refuses it unless asked
+        to accept that.
+
+        Raises:
+            ValueError: If the volume meter carries a whole frame (it is measured between chunks)
+        """
+        resampler, meter, blinks = self.resampler, self.volume_meter, self.blinks
+        resampler_sr = resampler.orig_sr if resampler is not None else 0
+        meter_sr = meter.sample_rate if meter is not None else 0
+        capacities = self._snapshot_capacities(resampler_sr, meter_sr)
+        expression, volume = self.postprocess_tail()
+        audio = np.zeros(0, dtype=np.float32) if compact else self.audio.last()
+        peak = float(np.abs(audio).max()) if audio.shape[0] else 0.0
+        scale = peak / 32767 if peak > 0 else 1.0
+        arrays = [
+            expression,
+            volume,
+            resampler._history if resampler is not None else np.zeros(0, dtype=np.float32),
+            meter._pending if meter is not None else np.zeros(0, dtype=np.float32),
+            blinks._pending,
+        ]
+        if arrays[3].shape[0] > capacities[4]:
+            raise ValueError("volume meter carries a whole frame, snapshot between chunks")
+        flags = (_SNAPSHOT_INITIAL if self.is_initial_input else 0) | (0 if compact else _SNAPSHOT_AUDIO)
+        header = _SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, self.audio_sr, self.max_frame_length, self.expression._buf.shape[1],
+            resampler_sr,
+            resampler._consumed if resampler is not None else 0,
+            resampler._next if resampler is not None else 0,
+            meter_sr,
+            blinks._next_blink,
+            scale,
+            audio.shape[0], *(array.shape[0] for array in arrays))
+        pcm = np.zeros(0 if compact else capacities[0], dtype="<i2")
+        if audio.shape[0]:
+            pcm[-audio.shape[0]:] = np.rint(audio / scale)
+        num_channels = self.expression._buf.shape[1]
+        values = np.zeros(sum(capacities[1:]) + capacities[1] * (num_channels - 1), dtype="<f2")
+        offset = 0
+        for array, capacity in zip(arrays, capacities[1:]):
+            size = capacity * (num_channels if array.ndim == 2 else 1)
+            values[offset:offset + array.size] = array.ravel()
+            offset += size
+        return header + pcm.tobytes() + values.tobytes()
+
+    def load_bytes(self, data: bytes, allow_lossy: bool = False):
+        """Restores state written by :meth:`to_bytes` into this (freshly constructed) context.
+
+        Args:
+            data: The snapshot
+            allow_lossy: Accept a compact snapshot. It has no audio window, so the next window
+                is silence-padded as at the start of a speech and that chunk's expression
+                differs from an uninterrupted session; only the blending into the previous
+                frames stays continuous
+
+        Raises:
+            ValueError: If the snapshot is malformed, was taken with a different sample rate,
+                window length or channel count, or is compact and ``allow_lossy`` is not set
+        """
+        if len(data) < _SNAPSHOT_HEADER.size:
+            raise ValueError("LAM context snapshot is truncated")
+        (magic, version, flags, audio_sr, max_frame_length, num_channels, resampler_sr, consumed, next_output,
+         meter_sr, next_blink, scale, *lengths) = _SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"not a LAM context snapshot (version {version})")
+        if (audio_sr, max_frame_length, num_channels) != (self.audio_sr, self.max_frame_length,
+                                                           self.expression._buf.shape[1]):
+            raise ValueError(f"LAM context snapshot is for {audio_sr} Hz / {max_frame_length} frames / "
+                             f"{num_channels} channels")
+        exact = bool(flags & _SNAPSHOT_AUDIO)
+        if not exact and not allow_lossy:
+            raise ValueError("LAM context snapshot is compact (no audio window); restoring it changes "
+                             "the next window's expression, pass allow_lossy=True to accept that")
+        capacities = list(self._snapshot_capacities(resampler_sr, meter_sr))
+        if not exact:
+            capacities[0] = 0
+        if any(used > capacity for used, capacity in zip(lengths, capacities)):
+            raise ValueError("LAM context snapshot is malformed")
+        capacities[1] *= num_channels
+        if len(data) != _SNAPSHOT_HEADER.size + 2 * sum(capacities):
+            raise ValueError("LAM context snapshot is truncated")
+        pcm = np.frombuffer(data, dtype="<i2", count=capacities[0], offset=_SNAPSHOT_HEADER.size)
+        values = np.frombuffer(data, dtype="<f2", offset=_SNAPSHOT_HEADER.size + 2 * capacities[0])
+        expression, volume, history, pending, blink = [
+            section[:used].astype(np.float32) for section, used in zip(
+                np.split(values, np.cumsum(capacities[1:])[:-1]),
+                [lengths[1] * num_channels] + lengths[2:])]
+        self.reset()
+        if lengths[0]:
+            self.audio.extend(pcm[-lengths[0]:].astype(np.float32) * np.float32(scale))
+        self.expression.extend(expression.reshape(-1, num_channels))
+        self.volume.extend(volume)
+        self.is_initial_input = bool(flags & _SNAPSHOT_INITIAL)
+        if resampler_sr:
+            self.resampler = StreamResampler(resampler_sr, self.audio_sr)
+            self.resampler._history = history
+            self.resampler._consumed = consumed
+            self.resampler._next = next_output
+        if meter_sr:
+            self.volume_meter = VolumeMeter(meter_sr)
+            self.volume_meter._pending = pending
+        self.blinks._next_blink = next_blink
+        self.blinks._pending = blink
+        # the history before the snapshot is unknown here, so restored slices must not share cache keys
+        self.cache_chain = b"" if self.is_initial_input else os.urandom(16)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""CPU inference of the LAM audio encoder: real-time factor and sessions per core count.
+
+Runs the streaming model input (a 64-frame, 2.13 s window at 16 kHz) through
+a randomly initialised wav2vec2-base, which is the bulk of LAM
+Audio2Expression's compute, in float32 and with the int8 dynamic
+quantization the CPU backend applies (patches/lam/device.py). Per thread
+count it reports:
+
+  window     forward time of one session's window (batch 1)
+  RTF        window time per second of audio at the handler's slice length
+             (one window per slice; below 1 keeps up with real time)
+  sessions   concurrent sessions one process with that many threads sustains,
+             using the best batch size (sessions share batched passes)
+  max err    int8 vs float32 encoder output, relative to its scale
+
+Needs torch + transformers.
+
+Usage:
+  python scripts/bench_lam_cpu.py
+  python scripts/bench_lam_cpu.py --threads 1 2 4 8 --batch-sizes 1 2 4 8 --slice-seconds 1.0
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "patches"))
+
+WINDOW_SAMPLES = 16000 * 64 // 30
+
+
+def _time(model, batch, repeat):
+    import torch
+    with torch.no_grad():
+        model(batch)  # untimed, first call allocates
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            model(batch)
+            timings.append(time.perf_counter() - t0)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="default: powers of two up to nproc")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--slice-seconds", type=float, default=1.0, help="handler slice length (one window each)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import torch
+    from transformers import Wav2Vec2Config, Wav2Vec2Model
+    from lam.device import configure_threads, quantize_dynamic_int8
+
+    cores = os.cpu_count() or 1
+    threads = args.threads or [t for t in (1, 2, 4, 8, 16, 32) if t <= cores]
+    torch.manual_seed(0)
+    fp32 = Wav2Vec2Model(Wav2Vec2Config()).eval()
+    int8 = quantize_dynamic_int8(copy.deepcopy(fp32))
+    windows = torch.from_numpy(np.random.default_rng(0).standard_normal(
+        (max(args.batch_sizes), WINDOW_SAMPLES)).astype(np.float32) * 0.1)
+
+    with torch.no_grad():
+        reference = fp32(windows[:1]).last_hidden_state
+        error = (int8(windows[:1]).last_hidden_state - reference).abs().max() / reference.abs().max()
+    print(f"wav2vec2-base, {WINDOW_SAMPLES / 16000:.2f} s window per {args.slice_seconds} s slice, "
+          f"{cores} cores; int8 max err {float(error):.3f}")
+    for n in threads:
+        configure_threads(n)
+        for name, model in (("float32", fp32), ("int8", int8)):
+            per_batch = {b: _time(model, windows[:b], args.repeat) for b in args.batch_sizes}
+            # each session needs one window per slice
+            sessions = max(int(b / t * args.slice_seconds) for b, t in per_batch.items())
+            t1 = per_batch[min(per_batch)]
+            print(f"  threads {n:2d} {name:<8} window {t1 * 1000:7.1f} ms  RTF {t1 / args.slice_seconds:5.2f}  "
+                  f"sessions {sessions:3d}  ("
+                  + ", ".join(f"b{b} {t * 1000:.0f} ms" for b, t in per_batch.items()) + ")")
+
+
+if __name__ == "__main__":
+    main()
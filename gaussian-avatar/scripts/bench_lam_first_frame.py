@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Time-to-first-``arkit_face`` frame of HandlerAvatarLAM for different slice schedules.
+
+Replays TTS replies arriving in chunks through the handler's slicing
+(patches/lam/slicing.py) on a virtual clock. Each slice costs one model call
+(the LAM window is a fixed 64 frames, so the cost does not depend on the
+slice length). Reported per schedule:
+
+  first frame   delay from the first TTS audio to the first motion bundle
+  stall         playback time lost waiting for later bundles, once started
+  slices        model calls per reply
+  frames        expression frames produced vs. audio duration * 30
+
+Usage:
+  python scripts/bench_lam_first_frame.py
+  python scripts/bench_lam_first_frame.py --schedules 1.0 0.3,0.6,1.0 0.2,0.5,1.0 --infer-ms 40
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "patches"))
+
+from lam.slicing import AdaptiveSliceContext  # noqa: E402
+
+MODEL_SR = 16000
+MAX_FRAME_LENGTH = 64
+
+
+def frames_for(num_samples, sample_rate):
+    # same frame count as Audio2ExpressionInfer.infer_streaming_audio
+    n16 = round(num_samples * MODEL_SR / sample_rate)
+    start_frame = int(MAX_FRAME_LENGTH - n16 / MODEL_SR * 30)
+    return MAX_FRAME_LENGTH - start_frame
+
+
+def simulate(schedule, args):
+    sr = args.sample_rate
+    chunk = int(sr * args.tts_chunk_ms / 1000)
+    total = int(sr * args.reply_seconds)
+    slicer = AdaptiveSliceContext(sr, schedule)
+
+    busy_until = 0.0
+    outputs = []  # (time submitted, seconds of audio)
+    frames = 0
+    t_first_audio = min(chunk, total) / sr * args.tts_rtf
+    for start in range(0, total, chunk):
+        piece = np.zeros(min(chunk, total - start), dtype=np.float32)
+        # a chunk arrives once TTS has generated it, tts_rtf seconds per second of audio
+        t_arrival = (start + piece.shape[0]) / sr * args.tts_rtf
+        speech_end = start + chunk >= total
+        segments = list(slicer.slice(piece))
+        if speech_end:
+            remainder = slicer.flush()
+            if remainder is not None:
+                segments.append(remainder)
+        for segment in segments:
+            busy_until = max(busy_until, t_arrival) + args.infer_ms / 1000
+            outputs.append((busy_until, segment.shape[0] / sr))
+            frames += frames_for(segment.shape[0], sr)
+
+    first = outputs[0][0] - t_first_audio
+    # playback starts with the first bundle; each later one must arrive before its audio is due
+    play_clock, stall = outputs[0][0], 0.0
+    for t_ready, seconds in outputs:
+        if t_ready > play_clock:
+            stall += t_ready - play_clock
+            play_clock = t_ready
+        play_clock += seconds
+    return first, stall, len(outputs), frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schedules", nargs="+", default=["1.0", "0.3,0.6,1.0", "0.2,0.4,1.0"],
+                        help="comma-separated slice seconds; the first is the baseline")
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--reply-seconds", type=float, default=4.0)
+    parser.add_argument("--tts-chunk-ms", type=float, default=100.0)
+    parser.add_argument("--tts-rtf", type=float, default=0.3, help="TTS generation time per second of audio")
+    parser.add_argument("--infer-ms", type=float, default=25.0, help="model + post-processing per slice")
+    args = parser.parse_args()
+
+    print(f"{args.reply_seconds:.1f} s reply in {args.tts_chunk_ms:.0f} ms TTS chunks (TTS RTF {args.tts_rtf}), "
+          f"{args.infer_ms:.0f} ms per slice")
+    baseline = None
+    for spec in args.schedules:
+        schedule = [float(s) for s in spec.split(",")]
+        first, stall, slices, frames = simulate(schedule, args)
+        baseline = first if baseline is None else baseline
+        print(f"  [{spec:<14}] first frame {first * 1000:7.1f} ms ({(first - baseline) * 1000:+7.1f})  "
+              f"stall {stall * 1000:6.1f} ms  slices {slices:3d}  "
+              f"frames {frames} / {args.reply_seconds * 30:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Cold-start time and per-process memory of LAM checkpoint loading.
+
+Starts N worker processes at once for each loading path and reports, per
+process, the time to a loaded model and its RSS / PSS / private memory
+(from /proc/<pid>/smaps_rollup, Linux only). PSS splits shared pages between
+the processes mapping them, so it shows what memory-mapping saves.
+
+  legacy  torch.load of the .tar + key-by-key OrderedDict prefix rewrite (old build_model)
+  mmap    patches/lam/checkpoint.py: memory-mapped safetensors, lazy prefix view
+
+The model is a CPU stand-in with the checkpoint's parameter names and shapes,
+so this runs on the host with just torch + safetensors.
+
+Usage:
+  python scripts/bench_lam_startup.py --weight models/LAM_audio2exp/pretrained_models/lam_audio2exp_streaming.tar
+  python scripts/bench_lam_startup.py --synthetic-mb 400 --processes 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "patches"))
+
+MODES = ("legacy", "mmap")
+
+
+def _stand_in(torch, shapes):
+    """Module tree with the checkpoint's parameter names, randomly initialised like build_model."""
+    root = torch.nn.Module()
+    for name, shape in shapes.items():
+        *path, leaf = name.split(".")
+        module = root
+        for part in path:
+            if not hasattr(module, part):
+                module.add_module(part, torch.nn.Module())
+            module = getattr(module, part)
+        module.register_parameter(leaf, torch.nn.Parameter(torch.empty(shape), requires_grad=False))
+    return root
+
+
+def worker(args):
+    t0 = time.perf_counter()
+    import torch
+    from lam.checkpoint import load_state_dict
+    t_import = time.perf_counter() - t0
+
+    with open(args.shapes) as f:
+        model = _stand_in(torch, json.load(f))
+    t1 = time.perf_counter()
+    if args.worker == "legacy":
+        checkpoint = torch.load(args.weight, weights_only=False)
+        weight = OrderedDict()
+        for key, value in checkpoint["state_dict"].items():
+            if key.startswith("module."):
+                key = key[7:]
+            weight[key] = value
+        model.load_state_dict(weight, strict=True)
+        del checkpoint, weight
+    else:
+        weight, _ = load_state_dict(args.weight, ddp=False, autoconvert=False)
+        model.load_state_dict(weight, strict=True, assign=True)
+        del weight
+    t_load = time.perf_counter() - t1
+    # touch every weight, as inference would
+    checksum = sum(float(p.sum()) for p in model.parameters())
+    print(json.dumps({"import": t_import, "load": t_load, "checksum": checksum}), flush=True)
+    sys.stdin.readline()  # stay alive until the parent has sampled everyone
+
+
+def _sample(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return fields["Rss"], fields["Pss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def run_mode(mode, weight, shapes, processes):
+    procs = [subprocess.Popen([sys.executable, __file__, "--worker", mode, "--weight", weight, "--shapes", shapes],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+             for _ in range(processes)]
+    reports = [json.loads(p.stdout.readline()) for p in procs]
+    # sampled once all are loaded, so shared pages are split between them
+    memory = [_sample(p.pid) for p in procs]
+    for p in procs:
+        p.communicate("\n")
+    load = [r["load"] for r in reports]
+    rss, pss, private = (sum(m[i] for m in memory) / len(memory) for i in range(3))
+    print(f"  {mode:<7} import {sum(r['import'] for r in reports) / processes:5.2f} s  "
+          f"load {sum(load) / processes:5.2f} s (max {max(load):5.2f})  "
+          f"RSS {rss:7.1f} MiB  PSS {pss:7.1f} MiB  private {private:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weight", help="LAM .tar checkpoint (a synthetic one is generated if omitted)")
+    parser.add_argument("--synthetic-mb", type=int, default=400)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--shapes", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+        return
+
+    import torch
+    from lam.checkpoint import _load_torch_state, convert_checkpoint, fast_weight_path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        weight = args.weight
+        if weight is None:
+            weight = os.path.join(tmp, "synthetic.tar")
+            n = max(args.synthetic_mb // 4, 1)
+            state = {f"module.backbone.layer{i}.weight": torch.randn(1024, 1024) for i in range(n)}
+            torch.save({"state_dict": state, "epoch": 0}, weight)
+            del state
+        fast = fast_weight_path(weight)
+        if not os.path.exists(fast) or os.path.getmtime(fast) < os.path.getmtime(weight):
+            fast = os.path.join(tmp, "converted.safetensors")
+            t0 = time.perf_counter()
+            convert_checkpoint(weight, fast)
+            print(f"one-time conversion to safetensors: {time.perf_counter() - t0:.2f} s")
+        shapes = os.path.join(tmp, "shapes.json")
+        with open(shapes, "w") as f:
+            json.dump({k[7:] if k.startswith("module.") else k: list(v.shape)
+                       for k, v in _load_torch_state(weight).items()}, f)
+
+        size = os.path.getsize(weight) / 2 ** 20
+        print(f"{os.path.basename(weight)} ({size:.0f} MiB), {args.processes} concurrent processes, means per process")
+        for mode in args.modes:
+            run_mode(mode, weight if mode == "legacy" else fast, shapes, args.processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,913 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the LAM streaming helpers in patches/lam/.
+
+Runs on the host without the model or a GPU (numpy only, except where noted).
+
+Usage:
+  python scripts/bench_lam_streaming.py context [--chunks 500]
+  python scripts/bench_lam_streaming.py snapshot [--chunks 5]
+  python scripts/bench_lam_streaming.py batching [--sessions 8]
+  python scripts/bench_lam_streaming.py pipeline [--sessions 8]
+  python scripts/bench_lam_streaming.py output [--slices 2000]        # needs loguru
+  python scripts/bench_lam_streaming.py metrics [--slices 20000]
+  python scripts/bench_lam_streaming.py model-server [--sessions 8]
+  python scripts/bench_lam_streaming.py motion [--seconds 60]
+  python scripts/bench_lam_streaming.py expression-cache [--phrases 50]
+  python scripts/bench_lam_streaming.py feature-cache [--tol 0.05]   # needs torch + transformers
+  python scripts/bench_lam_streaming.py postprocess [--chunks 200]
+  python scripts/bench_lam_streaming.py resample [--orig-sr 24000]   # compares with librosa if installed
+  python scripts/bench_lam_streaming.py volume [--chunks 200]         # needs librosa for the baseline
+  python scripts/bench_lam_streaming.py offline [--minutes 1 60]      # windowed offline memory, needs soundfile
+"""
+
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "patches"))
+
+from lam.batching import MicroBatcher  # noqa: E402
+from lam.expression_cache import ExpressionCache, chain_key  # noqa: E402
+from lam.metrics import MetricsRegistry  # noqa: E402
+from lam.model_server import ModelClient, ModelServer  # noqa: E402
+from lam.motion_codec import MotionDecoder, MotionEncoder  # noqa: E402
+from lam.offline import BlendshapeJSONWriter  # noqa: E402
+from lam.pipeline import InferenceExecutor  # noqa: E402
+from lam.slicing import AdaptiveSliceContext  # noqa: E402
+from lam.streaming import (  # noqa: E402
+    BlinkScheduler, SavgolKernel, StreamingContext, StreamResampler, VolumeMeter, BLINK_CHANNELS, MAX_FRAME_LENGTH,
+    NUM_BLENDSHAPES,
+)
+
+AUDIO_SR = 16000
+# Channel order of LAM's output (models.utils.ARKitBlendShape), imported from the LAM_Audio2Expression
+# checkout when it is importable (inside the container, or LAM_A2E_DIR); this fallback copies that order
+LAM_A2E_DIR = os.environ.get("LAM_A2E_DIR", "/app/src/handlers/avatar/lam/LAM_Audio2Expression")
+_LAM_ARKIT_NAMES = [
+    "browDownLeft", "browDownRight", "browInnerUp", "browOuterUpLeft", "browOuterUpRight", "cheekPuff",
+    "cheekSquintLeft", "cheekSquintRight", "eyeBlinkLeft", "eyeBlinkRight", "eyeLookDownLeft", "eyeLookDownRight",
+    "eyeLookInLeft", "eyeLookInRight", "eyeLookOutLeft", "eyeLookOutRight", "eyeLookUpLeft", "eyeLookUpRight",
+    "eyeSquintLeft", "eyeSquintRight", "eyeWideLeft", "eyeWideRight", "jawForward", "jawLeft", "jawOpen",
+    "jawRight", "mouthClose", "mouthDimpleLeft", "mouthDimpleRight", "mouthFrownLeft", "mouthFrownRight",
+    "mouthFunnel", "mouthLeft", "mouthLowerDownLeft", "mouthLowerDownRight", "mouthPressLeft", "mouthPressRight",
+    "mouthPucker", "mouthRight", "mouthRollLower", "mouthRollUpper", "mouthShrugLower", "mouthShrugUpper",
+    "mouthSmileLeft", "mouthSmileRight", "mouthStretchLeft", "mouthStretchRight", "mouthUpperUpLeft",
+    "mouthUpperUpRight", "noseSneerLeft", "noseSneerRight", "tongueOut",
+]
+
+
+def _arkit_names():
+    if os.path.isdir(LAM_A2E_DIR) and LAM_A2E_DIR not in sys.path:
+        sys.path.append(LAM_A2E_DIR)
+    try:
+        from models.utils import ARKitBlendShape
+    except ImportError:
+        return list(_LAM_ARKIT_NAMES)
+    return list(ARKitBlendShape)
+
+
+ARKIT_NAMES = _arkit_names()
+assert len(ARKIT_NAMES) == NUM_BLENDSHAPES and tuple(
+    ARKIT_NAMES.index(name) for name in ("eyeBlinkLeft", "eyeBlinkRight")) == BLINK_CHANNELS
+
+
+def _report(name, timings, allocated):
+    timings = np.asarray(timings) * 1e6
+    print(f"  {name:<12} mean {timings.mean():8.1f} us  p99 {np.percentile(timings, 99):8.1f} us  "
+          f"allocated/chunk {allocated / 1024:8.1f} KiB")
+
+
+def _measure(step, chunks):
+    """Returns per-chunk wall times and the mean bytes allocated per chunk."""
+    # one untimed step so lazily created state is not counted
+    step(chunks[0])
+    timings = []
+    for chunk in chunks:
+        t0 = time.perf_counter()
+        step(chunk)
+        timings.append(time.perf_counter() - t0)
+    # allocation pass kept separate, tracemalloc distorts timings
+    allocated = 0
+    tracemalloc.start()
+    for chunk in chunks:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        step(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - base
+    tracemalloc.stop()
+    return timings, allocated / len(chunks)
+
+
+def bench_context(args):
+    """History bookkeeping only: dict + np.concatenate vs StreamingContext."""
+    rng = np.random.default_rng(0)
+    chunk = AUDIO_SR  # 1 s slices, as produced by the handler
+    frames = chunk * 30 // AUDIO_SR
+    window = AUDIO_SR * MAX_FRAME_LENGTH // 30
+    chunks = [(rng.standard_normal(chunk).astype(np.float32),
+               rng.random((frames, NUM_BLENDSHAPES), dtype=np.float32),
+               rng.random(frames, dtype=np.float32)) for _ in range(args.chunks)]
+
+    legacy = {"previous_audio": None, "previous_expression": None, "previous_volume": None}
+
+    def legacy_step(item):
+        audio, exp, vol = item
+        if legacy["previous_audio"] is None:
+            input_audio = np.concatenate([np.zeros(window - audio.shape[0], dtype=np.float32), audio])
+        else:
+            input_audio = np.concatenate([legacy["previous_audio"][-(window - audio.shape[0]):], audio])
+        legacy["previous_audio"] = input_audio
+        if legacy["previous_expression"] is None:
+            legacy["previous_expression"] = exp.copy()
+            legacy["previous_volume"] = vol.copy()
+        else:
+            legacy["previous_expression"] = np.concatenate(
+                [legacy["previous_expression"], exp], axis=0)[-MAX_FRAME_LENGTH:]
+            legacy["previous_volume"] = np.concatenate([legacy["previous_volume"], vol])[-MAX_FRAME_LENGTH:]
+
+    context = StreamingContext(audio_sr=AUDIO_SR)
+
+    def ring_step(item):
+        audio, exp, vol = item
+        context.push_audio(audio)
+        context.push_expression(exp, vol)
+
+    print(f"history update, {args.chunks} x {chunk / AUDIO_SR:.1f} s chunks")
+    _report("dict/concat", *_measure(legacy_step, chunks))
+    _report("ring", *_measure(ring_step, chunks))
+
+
+def bench_snapshot(args):
+    """Session snapshot size, snapshot / restore time, and how closely a
+    restored context continues the stream (model input window and volume of
+    the next chunk, stateful blinks excluded). The default snapshot is exact
+    up to int16 / float16 rounding; the compact one is lossy by design
+    (silence-padded next window) and only restores with allow_lossy."""
+    sr = 24000
+    rng = np.random.default_rng(0)
+    chunk = sr // 2
+
+    def speech(samples):
+        return np.clip(rng.standard_normal(samples) * 0.2, -1, 1).astype(np.float32)
+
+    def step(context, audio):
+        in_audio = context.resample(audio, sr)
+        frames = int(MAX_FRAME_LENGTH - in_audio.shape[0] / AUDIO_SR * 30)
+        volume = context.measure_volume(audio, sr, MAX_FRAME_LENGTH - frames)
+        window = context.push_audio(in_audio).copy()
+        context.push_expression(rng.random((volume.shape[0], NUM_BLENDSHAPES), dtype=np.float32), volume)
+        return window, volume
+
+    context = StreamingContext(audio_sr=AUDIO_SR)
+    sizes = set()
+    for _ in range(args.chunks):
+        step(context, speech(chunk + 7))
+        sizes.add(len(context.to_bytes()))
+    following = speech(chunk)
+    compact = context.to_bytes(compact=True)
+    try:
+        StreamingContext(audio_sr=AUDIO_SR).load_bytes(compact)
+        print("compact snapshot restored without allow_lossy")
+        sys.exit(1)
+    except ValueError:
+        pass
+
+    print(f"context after {args.chunks} x {chunk / sr:.2f} s chunks at {sr} Hz, "
+          f"snapshot sizes seen {sorted(sizes)} bytes")
+    for lossy in (False, True):
+        data = context.to_bytes(compact=lossy)
+        timings = {"snapshot": [], "restore": []}
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            context.to_bytes(compact=lossy)
+            t1 = time.perf_counter()
+            StreamingContext(audio_sr=AUDIO_SR).load_bytes(data, allow_lossy=lossy)
+            timings["snapshot"].append(t1 - t0)
+            timings["restore"].append(time.perf_counter() - t1)
+        restored = StreamingContext(audio_sr=AUDIO_SR)
+        restored.load_bytes(data, allow_lossy=lossy)
+        # the untouched original continues in a copy, so both see the same next chunk
+        window_a, volume_a = step(copy.deepcopy(context), following)
+        window_b, volume_b = step(restored, following)
+        new = following.shape[0] * AUDIO_SR // sr - 16  # newest samples still within the resampler delay
+        print(f"  {'compact' if lossy else 'exact':<7} {len(data) / 1024:6.1f} KiB  "
+              f"snapshot {np.median(timings['snapshot']) * 1e6:6.1f} us  "
+              f"restore {np.median(timings['restore']) * 1e6:6.1f} us  "
+              f"next window max err {np.abs(window_a - window_b).max():.2e} "
+              f"(new audio {np.abs(window_a - window_b)[-new:].max():.2e})  "
+              f"volume max err {np.abs(volume_a - volume_b).max():.2e}")
+
+
+def bench_batching(args):
+    """Concurrent sessions against a stand-in model with fixed + per-row cost."""
+    window = np.zeros(AUDIO_SR * MAX_FRAME_LENGTH // 30, dtype=np.float32)
+    calls = []
+
+    def fake_forward(windows, keys):
+        calls.append(windows.shape[0])
+        time.sleep((args.base_ms + args.row_ms * windows.shape[0]) / 1000.0)
+        return np.zeros((windows.shape[0], MAX_FRAME_LENGTH, NUM_BLENDSHAPES), dtype=np.float32)
+
+    def run(submit):
+        calls.clear()
+
+        def session():
+            for _ in range(args.chunks):
+                submit(window)
+
+        threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        return elapsed, len(calls), np.mean(calls)
+
+    lock = threading.Lock()
+
+    def serial_submit(w):
+        with lock:
+            return fake_forward(w[np.newaxis], [0])[0]
+
+    batcher = MicroBatcher(fake_forward, max_batch_size=args.batch, max_wait_ms=args.wait_ms)
+    print(f"{args.sessions} sessions x {args.chunks} chunks, model cost {args.base_ms} ms + {args.row_ms} ms/row")
+    for name, submit in (("serial", serial_submit), ("batched", batcher.submit)):
+        elapsed, n_calls, mean_batch = run(submit)
+        print(f"  {name:<8} {elapsed:6.2f} s  forward calls {n_calls:5d}  mean batch {mean_batch:4.1f}  "
+              f"model time/chunk {elapsed * 1000 / (args.sessions * args.chunks):6.2f} ms")
+    batcher.close()
+
+
+def bench_pipeline(args):
+    """Handler-thread inference vs the pipelined executor, with stand-in stage costs.
+
+    Each session's handler thread pushes a slice every --interval-ms (0: the
+    whole reply at once), starting at a random offset within the interval;
+    inline, every slice runs forward (GPU, serialised), post-processing and
+    output on that thread in turn.
+    """
+    gpu = threading.Lock()
+    batch_sizes = []
+    offsets = np.random.default_rng(0).uniform(0, args.interval_ms / 1000.0, args.sessions)
+
+    def forward(jobs):
+        batch_sizes.append(len(jobs))
+        with gpu:
+            time.sleep((args.base_ms + args.row_ms * len(jobs)) / 1000.0)
+        return jobs
+
+    def postprocess(job, result):
+        time.sleep(args.post_ms / 1000.0)
+        return result
+
+    outputs = {}
+
+    def output(job, processed):
+        time.sleep(args.output_ms / 1000.0)
+        outputs.setdefault(job[0], []).append(job[1])
+
+    def run(handle):
+        outputs.clear()
+        threads = [threading.Thread(target=handle, args=(s,)) for s in range(args.sessions)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return t0
+
+    def paced(session):
+        start = time.perf_counter() + offsets[session]
+        for i in range(args.chunks):
+            delay = start + i * args.interval_ms / 1000.0 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield (session, i)
+
+    def inline(session):
+        for job in paced(session):
+            output(job, postprocess(job, forward([job])[0]))
+
+    executor = InferenceExecutor(forward, postprocess, output, max_batch_size=args.batch,
+                                 max_wait_ms=args.wait_ms, queue_size=args.queue)
+    max_depth = [0]
+
+    def pipelined(session):
+        for job in paced(session):
+            executor.submit(session, job)
+            max_depth[0] = max(max_depth[0], executor.depth(session))
+
+    print(f"{args.sessions} sessions x {args.chunks} slices every {args.interval_ms} ms, forward {args.base_ms} ms "
+          f"+ {args.row_ms} ms/row, post-processing {args.post_ms} ms, output {args.output_ms} ms, "
+          f"batch wait {args.wait_ms} ms")
+    t0 = run(inline)
+    print(f"  {'inline':<9} {time.perf_counter() - t0:6.2f} s")
+    batch_sizes.clear()
+    t0 = run(pipelined)
+    while sum(len(v) for v in outputs.values()) < args.sessions * args.chunks:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - t0
+    in_order = all(v == list(range(args.chunks)) for v in outputs.values())
+    print(f"  {'pipelined':<9} {elapsed:6.2f} s  outputs in order per session: {in_order}  "
+          f"max session depth {max_depth[0]} (queue size {args.queue})  "
+          f"{len(batch_sizes)} forward passes, mean batch {np.mean(batch_sizes):.1f}")
+    executor.close()
+
+
+class _StandInBundle:
+    """Stores entries like DataBundle; str() summarises them the way a log line would."""
+
+    def __init__(self):
+        self.data, self.meta = {}, {}
+
+    def set_main_data(self, value):
+        self.data["arkit_face"] = value
+
+    def set_data(self, key, value):
+        self.data[key] = value
+
+    def add_meta(self, key, value):
+        self.meta[key] = value
+
+    def __str__(self):
+        entries = ", ".join(f"{k}: {v.dtype}{list(v.shape)} {np.array2string(v.ravel()[:8], precision=3)}"
+                            for k, v in self.data.items())
+        return f"DataBundle({entries}, meta={self.meta})"
+
+
+def bench_output(args):
+    """Handler path of one slice from incoming audio to the submitted bundle,
+    model and post-processing excluded: the previous copying slicer + astype
+    + eager f-string log vs ring slices + float32 pass-through + lazy loguru
+    formatting, with the log sink at INFO and at WARNING. "lazy log" keeps
+    the copies and changes only the logging, to separate the two gains."""
+    from loguru import logger
+
+    sr = 24000
+    # a 1 s slice arriving as five 0.2 s TTS chunks
+    chunks = [np.zeros(sr // 5, dtype=np.float32) for _ in range(5)]
+    # previous post-processing could hand over float64; the new stage returns float32
+    legacy_frames = np.random.default_rng(0).random((30, NUM_BLENDSHAPES))
+    frames = legacy_frames.astype(np.float32)
+    dur = 0.0123
+
+    def legacy_slices():
+        # the previous AdaptiveSliceContext: copy in, concatenate, copy each slice out
+        pending = []
+        for chunk in chunks:
+            pending.append(np.array(chunk, dtype=np.float32))
+        buffer = np.concatenate(pending)
+        return [buffer[:sr].copy()]
+
+    def submit(audio, main, lazy):
+        output = _StandInBundle()
+        output.set_main_data(main)
+        output.set_data("avatar_audio", audio[np.newaxis, ...])
+        output.add_meta("speech_id", "s")
+        if lazy:
+            logger.opt(lazy=True).info(
+                "Inference on {:.2f} second audio finished in {:.1f} milliseconds. Got output: {}",
+                lambda: audio.shape[-1] / sr, lambda: dur * 1000, lambda: str(output))
+        else:
+            logger.info(f"Inference on {audio.shape[-1] / sr:.2f} second audio "
+                        f"finished in {dur * 1000} milliseconds. Got output: {str(output)}")
+
+    def legacy(_):
+        for audio in legacy_slices():
+            submit(audio, legacy_frames.astype(np.float32), lazy=False)
+
+    def copies_lazy_log(_):
+        for audio in legacy_slices():
+            submit(audio, legacy_frames.astype(np.float32), lazy=True)
+
+    slicer = AdaptiveSliceContext(sr, [1.0])
+
+    def ring(_):
+        for chunk in chunks:
+            for audio in slicer.slice(chunk):
+                submit(audio, np.ascontiguousarray(frames, dtype=np.float32), lazy=True)
+
+    slices = list(range(args.slices))
+    for level in ("INFO", "WARNING"):
+        logger.remove()
+        logger.add(lambda message: None, level=level)
+        print(f"incoming audio to bundle, 1 s slice, log level {level}")
+        _report("legacy", *_measure(legacy, slices))
+        _report("lazy log", *_measure(copies_lazy_log, slices))
+        _report("ring", *_measure(ring, slices))
+
+
+def bench_metrics(args):
+    """Cost of the per-slice instrumentation (the handler records four stage
+    timings, one session update and one queue depth per slice) and of a scrape."""
+    import json
+    import urllib.request
+
+    registry = MetricsRegistry()
+    rng = np.random.default_rng(0)
+    durations = rng.lognormal(np.log(0.005), 0.5, size=args.slices)
+
+    def per_slice(i):
+        d = durations[i]
+        with registry.timer("resample"):
+            pass
+        registry.observe("forward", d)
+        registry.observe("postprocess", d / 4)
+        registry.observe("submit", d / 50)
+        registry.record_slice(i % args.sessions, 1.0, d * 1.3)
+        registry.set_queue_depth(i % args.sessions, i % 4)
+
+    print(f"{args.slices} slices over {args.sessions} sessions")
+    _report("per slice", *_measure(per_slice, list(range(args.slices))))
+    registry.enabled = False
+    _report("disabled", *_measure(per_slice, list(range(args.slices))))
+    registry.enabled = True
+
+    server = registry.serve(0, host="127.0.0.1")
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    t0 = time.perf_counter()
+    text = urllib.request.urlopen(f"{url}/metrics").read().decode()
+    t_scrape = time.perf_counter() - t0
+    snapshot = json.loads(urllib.request.urlopen(f"{url}/metrics.json").read())
+    registry.stop()
+    forward = snapshot["stages"]["forward"]
+    print(f"  scrape {t_scrape * 1000:.2f} ms, {len(text.splitlines())} lines; forward p50 "
+          f"{forward['p50'] * 1000:.1f} ms (true {np.median(durations) * 1000:.1f}) p99 {forward['p99'] * 1000:.1f} ms "
+          f"(true {np.percentile(durations, 99) * 1000:.1f}); session 0 RTF {snapshot['sessions']['0']['rtf']:.4f}")
+
+
+class _StandInInfer:
+    """infer_streaming_audio with a fixed cost and the real output shape."""
+
+    def __init__(self, infer_ms):
+        self.infer_ms = infer_ms
+
+    def infer_streaming_audio(self, audio, ssr, context, speech_end=False):
+        time.sleep(self.infer_ms / 1000.0)
+        frames = int(round(audio.shape[0] / ssr * 30))
+        return {"expression": np.zeros((frames, NUM_BLENDSHAPES), dtype=np.float32)}, (context or 0) + 1
+
+
+def bench_model_server(args):
+    """Per-slice cost of going through the shared model server's Unix socket
+    instead of calling the model in-process, for concurrent sessions."""
+    sr = 24000
+    infer = _StandInInfer(args.infer_ms)
+    slices = [np.random.default_rng(i).standard_normal(int(sr * args.slice_seconds)).astype(np.float32)
+              for i in range(args.chunks)]
+
+    def run(make_call):
+        timings = []
+        lock = threading.Lock()
+
+        def session():
+            call, done = make_call()
+            local = []
+            for i, audio in enumerate(slices):
+                t0 = time.perf_counter()
+                expression = call(audio, i == len(slices) - 1)
+                local.append(time.perf_counter() - t0)
+                assert expression.shape == (int(args.slice_seconds * 30), NUM_BLENDSHAPES)
+            done()
+            with lock:
+                timings.extend(local)
+
+        threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return np.asarray(timings) * 1000
+
+    def in_process():
+        state = [None]
+
+        def call(audio, end):
+            result, state[0] = infer.infer_streaming_audio(audio, sr, state[0])
+            return result["expression"]
+        return call, lambda: None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = ModelServer(infer, os.path.join(tmp, "lam.sock"))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def remote():
+            client = ModelClient(server.path)
+            return (lambda audio, end: client.infer(audio, sr, speech_end=end)), client.close
+
+        print(f"{args.sessions} sessions x {args.chunks} slices of {args.slice_seconds} s, "
+              f"model {args.infer_ms} ms per slice")
+        for name, make_call in (("in-process", in_process), ("server", remote)):
+            timings = run(make_call)
+            overhead = timings - args.infer_ms
+            print(f"  {name:<10} per slice mean {timings.mean():6.2f} ms  p99 {np.percentile(timings, 99):6.2f} ms  "
+                  f"(overhead mean {overhead.mean():5.2f} ms)")
+        server.close()
+
+
+def _motion_frames(seconds, seed=0):
+    """Smooth LAM-like weights: symmetrized Left/Right pairs, a few channels idle at zero."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * 30)
+    walk = np.cumsum(rng.normal(0, 0.03, (n, len(ARKIT_NAMES))), axis=0)
+    frames = (0.3 + 0.25 * np.sin(walk)).astype(np.float32)
+    for i, name in enumerate(ARKIT_NAMES):
+        if name.endswith("Right") and name[:-5] + "Left" in ARKIT_NAMES:
+            frames[:, i] = frames[:, ARKIT_NAMES.index(name[:-5] + "Left")]
+    for name in ("tongueOut", "cheekPuff", "jawForward", "jawLeft", "jawRight", "mouthLeft", "mouthRight"):
+        frames[:, ARKIT_NAMES.index(name)] = 0.0
+    return frames
+
+
+def bench_motion(args):
+    """Bytes per second per session and encode / decode cost of the compact
+    motion format vs the raw float32 arkit_face entry and the export JSON."""
+    frames = _motion_frames(args.seconds)
+    packets = [frames[i:i + 30] for i in range(0, frames.shape[0], 30)]  # one packet per 1 s slice
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.json")
+        with BlendshapeJSONWriter(path, ARKIT_NAMES) as writer:
+            writer.write(frames)
+        json_rate = os.path.getsize(path) / args.seconds
+    print(f"{args.seconds} s of motion, {len(ARKIT_NAMES)} channels at 30 fps, one packet per second")
+    print(f"  {'float32':<11} {frames.nbytes / args.seconds:8.0f} B/s")
+    print(f"  {'json':<11} {json_rate:8.0f} B/s")
+    for bits in (8, 16):
+        encoder, decoder = MotionEncoder(ARKIT_NAMES, bits), MotionDecoder(ARKIT_NAMES)
+        encoded = [encoder.encode(p) for p in packets]
+        decoded = np.concatenate([decoder.decode(p) for p in encoded])
+        t_encode, _ = _measure(lambda p: encoder.encode(p), packets)
+        # the timing passes replay packets, so each one is made a keyframe
+        t_decode, _ = _measure(lambda p: decoder.decode(p), [encoder.encode(p, keyframe=True) for p in packets])
+        print(f"  {f'lamm {bits}-bit':<11} {sum(map(len, encoded)) / args.seconds:8.0f} B/s  "
+              f"encode {np.mean(t_encode) * 1e6:6.1f} us  decode {np.mean(t_decode) * 1e6:6.1f} us per packet  "
+              f"max err {np.abs(decoded - frames).max():.1e}")
+
+
+def bench_expression_cache(args):
+    """Hit rate and per-slice overhead of the repeated-slice expression cache
+    for replies drawn from a Zipf-distributed phrase pool (a few fillers and
+    greetings dominate) mixed with unique replies."""
+    sr = 24000
+    rng = np.random.default_rng(0)
+    phrases = [rng.standard_normal(int(sr * rng.uniform(0.8, 3.0))).astype(np.float32) for _ in range(args.phrases)]
+    weights = 1.0 / np.arange(1, args.phrases + 1) ** args.zipf
+    weights /= weights.sum()
+    cache = ExpressionCache(int(args.max_mb * 2 ** 20))
+    frames = np.zeros((30, NUM_BLENDSHAPES), dtype=np.float32)
+    key_time, lookups = [], 0
+    for _ in range(args.replies):
+        if rng.random() < args.unique:
+            audio = rng.standard_normal(int(sr * rng.uniform(1.0, 6.0))).astype(np.float32)
+        else:
+            audio = phrases[rng.choice(args.phrases, p=weights)]
+        chain = b""
+        for start in range(0, audio.shape[0], sr):
+            piece = audio[start:start + sr]
+            t0 = time.perf_counter()
+            chain = chain_key(chain, piece, sr, 0)
+            hit = cache.get(chain)
+            key_time.append(time.perf_counter() - t0)
+            lookups += 1
+            if hit is None:
+                cache.put(chain, frames[:int(piece.shape[0] / sr * 30)])
+    stats = cache.stats()
+    print(f"{args.replies} replies, {args.phrases} stock phrases (zipf {args.zipf}), {args.unique:.0%} unique, "
+          f"{args.max_mb} MiB cache")
+    print(f"  hit rate {stats['hit_rate']:.1%} of {lookups} slices  entries {stats['entries']}  "
+          f"{stats['bytes'] / 1024:.0f} KiB  evictions {stats['evictions']}  "
+          f"key + lookup {np.mean(key_time) * 1e6:.1f} us per 1 s slice")
+
+
+def bench_feature_cache(args):
+    """Incremental vs full wav2vec2 conv features on a randomly initialised
+    wav2vec2, and the expression error they cause through its transformer and
+    a stand-in 52-channel sigmoid head (the LAM weights are not loaded here);
+    exits non-zero if the feature error exceeds --tol, the expression error
+    exceeds --expression-tol, or the prefix is reused on fewer than
+    --min-reuse of the chunks."""
+    import torch
+    from transformers import Wav2Vec2Config, Wav2Vec2Model
+    from lam.feature_cache import CacheRow, IncrementalFeatureEncoder
+
+    torch.manual_seed(0)
+    wav2vec2 = Wav2Vec2Model(Wav2Vec2Config()).eval()
+    head = torch.nn.Linear(wav2vec2.config.hidden_size, NUM_BLENDSHAPES).eval()
+    encoder = wav2vec2.feature_extractor
+
+    def expression(features):
+        hidden, _ = wav2vec2.feature_projection(features.transpose(1, 2))
+        return torch.sigmoid(head(wav2vec2.encoder(hidden).last_hidden_state))
+    incremental = IncrementalFeatureEncoder(encoder, max_drift=args.max_drift, reanchor_every=args.reanchor_every)
+    context = StreamingContext(audio_sr=AUDIO_SR)
+    rng = np.random.default_rng(0)
+    # speech-like input: band-limited noise with a slow amplitude envelope
+    t = np.arange(args.chunks * AUDIO_SR) / AUDIO_SR
+    envelope = 0.3 * (1 + args.envelope * np.sin(2 * np.pi * 0.7 * t))
+    signal = (rng.standard_normal(t.shape[0]) * envelope).astype(np.float32)
+
+    worst = worst_expression = 0.0
+    reused = 0
+    full_time = reused_time = 0.0
+    with torch.no_grad():
+        for i in range(args.chunks):
+            window = torch.from_numpy(context.push_audio(signal[i * AUDIO_SR:(i + 1) * AUDIO_SR]))[None]
+            t0 = time.perf_counter()
+            full = encoder(window)
+            full_time += time.perf_counter() - t0
+
+            row = CacheRow(context.feature_cache, context.feature_shift)
+            incremental.rows = [row]
+            t0 = time.perf_counter()
+            cached = incremental(window)
+            elapsed = time.perf_counter() - t0
+            incremental.rows = None
+            hit = row.cache.age > 0
+            if hit:
+                reused += 1
+                reused_time += elapsed
+            context.feature_cache, context.feature_shift = row.cache, 0
+
+            error = ((cached - full).norm() / full.norm()).item()
+            expression_error = (expression(cached) - expression(full)).abs().max().item()
+            worst = max(worst, error)
+            worst_expression = max(worst_expression, expression_error)
+            print(f"  chunk {i:3d}  {'reused' if hit else 'full  '}  relative error {error:.2e}  "
+                  f"expression max abs error {expression_error:.2e}")
+    print(f"prefix reused on {reused}/{args.chunks} chunks")
+    if reused:
+        print(f"conv encoder time: full {full_time * 1000 / args.chunks:.1f} ms/chunk, "
+              f"reused prefix {reused_time * 1000 / reused:.1f} ms/chunk")
+    print(f"worst relative feature error {worst:.2e} (tolerance {args.tol:.0e})")
+    print(f"worst expression error {worst_expression:.2e} blendshape units (tolerance {args.expression_tol:.0e})")
+    if worst > args.tol or worst_expression > args.expression_tol or reused < args.min_reuse * args.chunks:
+        sys.exit(1)
+
+
+def bench_postprocess(args):
+    """Savitzky-Golay stage: batch path over history + new frames vs the
+    streaming kernel over a short tail; plus blink scheduling cost."""
+    from scipy.signal import savgol_filter
+
+    rng = np.random.default_rng(0)
+    frames = 30
+    kernel = SavgolKernel(window_length=5)
+    history = rng.random((MAX_FRAME_LENGTH, NUM_BLENDSHAPES), dtype=np.float32)
+    chunks = [rng.random((frames, NUM_BLENDSHAPES), dtype=np.float32) for _ in range(args.chunks)]
+
+    def batch_step(new):
+        x = np.concatenate([history, new], axis=0)
+        # one savgol_filter call per channel, as the batch helper does
+        out = np.stack([savgol_filter(x[:, c], 5, 2, mode="interp") for c in range(x.shape[1])], axis=1)
+        return out[MAX_FRAME_LENGTH:]
+
+    def stream_step(new):
+        x = np.concatenate([history[-kernel.half:], new], axis=0)
+        return kernel(x, start=kernel.half)
+
+    worst = max(np.abs(batch_step(c) - stream_step(c)).max() for c in chunks[:20])
+    print(f"savgol, {frames} new frames per chunk after {MAX_FRAME_LENGTH} frames of history")
+    _report("batch", *_measure(batch_step, chunks))
+    _report("streaming", *_measure(stream_step, chunks))
+    print(f"  max abs difference {worst:.2e}")
+
+    blinks = BlinkScheduler(seed=0)
+    _report("blinks", *_measure(lambda new: blinks(new.copy()), chunks))
+
+    # mouth smoothing / frame blending (upstream models.utils) must see the
+    # same history as on the full-window path: the whole expression ring
+    context = StreamingContext(audio_sr=AUDIO_SR)
+    mismatched = 0
+    for size in rng.integers(1, MAX_FRAME_LENGTH, args.chunks):
+        new = rng.random((size, NUM_BLENDSHAPES), dtype=np.float32)
+        tail_expression, tail_volume = context.postprocess_tail()
+        if context.previous_expression is not None:
+            mismatched += not (np.array_equal(tail_expression, context.previous_expression)
+                               and np.array_equal(tail_volume, context.previous_volume))
+        context.push_expression(new, new[:, 0])
+    print(f"  stage history matches the full-window path: {args.chunks - mismatched}/{args.chunks} chunks")
+    if mismatched:
+        sys.exit(1)
+
+
+def bench_resample(args):
+    """Per-chunk stateless resampling vs the per-session StreamResampler.
+
+    Boundary error is measured against resampling the whole stream at once
+    with the same method.
+    """
+    try:
+        import librosa
+
+        def stateless(x):
+            return librosa.resample(x, orig_sr=args.orig_sr, target_sr=AUDIO_SR)
+        name = "librosa"
+    except ImportError:
+        from scipy.signal import resample_poly
+        from math import gcd
+        g = gcd(args.orig_sr, AUDIO_SR)
+
+        def stateless(x):
+            return resample_poly(x, AUDIO_SR // g, args.orig_sr // g).astype(np.float32)
+        name = "resample_poly"
+
+    rng = np.random.default_rng(0)
+    t = np.arange(args.chunks * args.orig_sr) / args.orig_sr
+    signal = (0.5 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(t.shape[0])).astype(np.float32)
+    chunks = np.split(signal, args.chunks)
+
+    resampler = StreamResampler(args.orig_sr, AUDIO_SR)
+    print(f"{args.orig_sr} -> {AUDIO_SR} Hz, {args.chunks} x 1 s chunks")
+    _report(name, *_measure(stateless, chunks))
+    resampler.reset()
+    _report("stream", *_measure(resampler, chunks))
+
+    # boundary error: chunked output vs one-shot output of the same method
+    chunked = np.concatenate([stateless(c) for c in chunks])
+    whole = stateless(signal)
+    n = min(chunked.shape[0], whole.shape[0])
+    print(f"  {name:<12} max |chunked - one-shot| {np.abs(chunked[:n] - whole[:n]).max():.2e}")
+    resampler.reset()
+    chunked = np.concatenate([resampler(c) for c in chunks])
+    whole = StreamResampler(args.orig_sr, AUDIO_SR)(signal)
+    n = min(chunked.shape[0], whole.shape[0])
+    print(f"  {'stream':<12} max |chunked - one-shot| {np.abs(chunked[:n] - whole[:n]).max():.2e}")
+
+
+def bench_volume(args):
+    """librosa.feature.rms per chunk vs the carried VolumeMeter, on 1 s chunks
+    followed by the 50-sample end-of-speech flush."""
+    import librosa
+
+    sr = args.sample_rate
+    hop = int(sr / 30)
+    rng = np.random.default_rng(0)
+    chunks = [rng.standard_normal(sr).astype(np.float32) for _ in range(args.chunks)]
+
+    def rms_step(chunk):
+        frames = int(np.ceil(chunk.shape[0] / sr * 30))
+        return librosa.feature.rms(y=chunk, frame_length=min(hop, len(chunk)), hop_length=hop)[0][:frames]
+
+    meter = VolumeMeter(sr)
+
+    def meter_step(chunk):
+        return meter(chunk, int(np.ceil(chunk.shape[0] / sr * 30)))
+
+    print(f"volume at {sr} Hz, {args.chunks} x 1 s chunks")
+    _report("librosa", *_measure(rms_step, chunks))
+    _report("meter", *_measure(meter_step, chunks))
+
+    flush = np.full(50, 0.5, dtype=np.float32)
+    print(f"  50-sample flush of a 0.5 constant: librosa {rms_step(flush)}  meter {meter_step(flush)}")
+
+
+def bench_offline(args):
+    """Peak traced memory of the windowed offline path (decode, resample, stitch,
+    smooth, JSON) with a stand-in model, for synthetic files of each length."""
+    import soundfile as sf
+    from lam.offline import BlendshapeJSONWriter, StreamingSavgol, WindowStitcher, iter_audio_windows
+
+    sr = args.orig_sr
+    window_frames = args.window_seconds * 30
+    overlap_frames = args.overlap_seconds * 30
+    names = [f"bs{i}" for i in range(NUM_BLENDSHAPES)]
+    rng = np.random.default_rng(0)
+
+    def fake_model(window):
+        frames = int(np.ceil(window.shape[0] / AUDIO_SR * 30))
+        return rng.random((frames, NUM_BLENDSHAPES), dtype=np.float32)
+
+    print(f"offline windowed, {args.window_seconds} s windows, {args.overlap_seconds} s overlap, {sr} Hz input")
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in args.minutes:
+            wav = os.path.join(tmp, f"{minutes}min.wav")
+            with sf.SoundFile(wav, "w", samplerate=sr, channels=1, subtype="PCM_16") as f:
+                for _ in range(minutes * 6):
+                    f.write(0.1 * rng.standard_normal(sr * 10).astype(np.float32))
+
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            stitcher, smoother = WindowStitcher(overlap_frames), StreamingSavgol(5)
+            with BlendshapeJSONWriter(os.path.join(tmp, "out.json"), names) as writer:
+                for window in iter_audio_windows(wav, AUDIO_SR, args.window_seconds * AUDIO_SR,
+                                                 (window_frames - overlap_frames) // 30 * AUDIO_SR):
+                    writer.write(smoother.push(stitcher.push(fake_model(window))))
+                writer.write(smoother.push(stitcher.finish()))
+                writer.write(smoother.finish())
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {minutes:>4} min  frames {writer.frame_count:>7}  peak {peak / 2 ** 20:7.1f} MiB  "
+                  f"time {elapsed:6.1f} s")
+            os.remove(wav)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("context", help="streaming history bookkeeping")
+    p.add_argument("--chunks", type=int, default=500)
+    p.set_defaults(func=bench_context)
+
+    p = sub.add_parser("snapshot", help="session context snapshot / restore")
+    p.add_argument("--chunks", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_snapshot)
+
+    p = sub.add_parser("batching", help="cross-session micro-batching with a stand-in model")
+    p.add_argument("--sessions", type=int, default=8)
+    p.add_argument("--chunks", type=int, default=20)
+    p.add_argument("--batch", type=int, default=8)
+    p.add_argument("--wait-ms", type=float, default=5.0)
+    p.add_argument("--base-ms", type=float, default=12.0)
+    p.add_argument("--row-ms", type=float, default=1.5)
+    p.set_defaults(func=bench_batching)
+
+    p = sub.add_parser("pipeline", help="pipelined inference executor with stand-in stages")
+    p.add_argument("--sessions", type=int, default=8)
+    p.add_argument("--chunks", type=int, default=20)
+    p.add_argument("--batch", type=int, default=8)
+    p.add_argument("--queue", type=int, default=4)
+    p.add_argument("--wait-ms", type=float, default=5.0)
+    p.add_argument("--interval-ms", type=float, default=0.0, help="time between a session's slices")
+    p.add_argument("--base-ms", type=float, default=12.0)
+    p.add_argument("--row-ms", type=float, default=1.5)
+    p.add_argument("--post-ms", type=float, default=3.0)
+    p.add_argument("--output-ms", type=float, default=1.0)
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("output", help="handler output stage overhead per slice")
+    p.add_argument("--slices", type=int, default=2000)
+    p.set_defaults(func=bench_output)
+
+    p = sub.add_parser("metrics", help="per-slice instrumentation and scrape cost")
+    p.add_argument("--slices", type=int, default=20000)
+    p.add_argument("--sessions", type=int, default=8)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser("model-server", help="shared model server round trip vs in-process calls")
+    p.add_argument("--sessions", type=int, default=8)
+    p.add_argument("--chunks", type=int, default=50)
+    p.add_argument("--slice-seconds", type=float, default=1.0)
+    p.add_argument("--infer-ms", type=float, default=2.0)
+    p.set_defaults(func=bench_model_server)
+
+    p = sub.add_parser("motion", help="compact blendshape motion format size and cost")
+    p.add_argument("--seconds", type=int, default=60)
+    p.set_defaults(func=bench_motion)
+
+    p = sub.add_parser("expression-cache", help="repeated-slice expression cache hit rate and overhead")
+    p.add_argument("--phrases", type=int, default=50)
+    p.add_argument("--replies", type=int, default=2000)
+    p.add_argument("--zipf", type=float, default=1.1)
+    p.add_argument("--unique", type=float, default=0.5, help="share of replies that are never repeated")
+    p.add_argument("--max-mb", type=float, default=8.0)
+    p.set_defaults(func=bench_expression_cache)
+
+    p = sub.add_parser("feature-cache", help="incremental wav2vec2 conv features: feature / expression parity and speed")
+    p.add_argument("--chunks", type=int, default=20)
+    p.add_argument("--tol", type=float, default=0.05)
+    p.add_argument("--expression-tol", type=float, default=0.02, help="max abs error of the stand-in expression")
+    p.add_argument("--min-reuse", type=float, default=0.4, help="share of chunks that must reuse the prefix")
+    p.add_argument("--max-drift", type=float, default=0.03)
+    p.add_argument("--reanchor-every", type=int, default=8)
+    p.add_argument("--envelope", type=float, default=0.1, help="relative amplitude modulation of the test signal")
+    p.set_defaults(func=bench_feature_cache)
+
+    p = sub.add_parser("postprocess", help="streaming post-processing kernels")
+    p.add_argument("--chunks", type=int, default=200)
+    p.set_defaults(func=bench_postprocess)
+
+    p = sub.add_parser("resample", help="per-session streaming resampler")
+    p.add_argument("--orig-sr", type=int, default=24000)
+    p.add_argument("--chunks", type=int, default=50)
+    p.set_defaults(func=bench_resample)
+
+    p = sub.add_parser("volume", help="streaming RMS volume meter")
+    p.add_argument("--sample-rate", type=int, default=24000)
+    p.add_argument("--chunks", type=int, default=200)
+    p.set_defaults(func=bench_volume)
+
+    p = sub.add_parser("offline", help="windowed offline inference memory with a stand-in model")
+    p.add_argument("--minutes", type=int, nargs="+", default=[1, 60])
+    p.add_argument("--orig-sr", type=int, default=24000)
+    p.add_argument("--window-seconds", type=int, default=30)
+    p.add_argument("--overlap-seconds", type=int, default=2)
+    p.set_defaults(func=bench_offline)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
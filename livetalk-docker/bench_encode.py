@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Wall time and peak RSS of the LiveTalk server's output stage, per job.
+
+Compares, on a synthetic pipeline output (float [1, T, 3, H, W] in [0, 1]):
+
+  legacy    full uint8 copy of the video, imageio.mimsave to a temp MP4,
+            a second ffmpeg pass to mux the audio, then `cp` to the volume
+  pipe      encoder.VideoEncoder: chunks piped to one ffmpeg process that
+            muxes the audio and writes the final file, then copy_file
+
+Each run happens in a fresh subprocess; peak RSS is that process's maximum,
+including the synthetic video tensor, which is identical in both modes
+(ffmpeg's own memory is not counted).
+
+Needs torch, ffmpeg on PATH, and imageio + imageio-ffmpeg for the legacy mode.
+
+Usage:
+  python bench_encode.py
+  python bench_encode.py --duration 14 --size 512 896 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+ENCODE_CHUNK_FRAMES = 16
+
+
+def _write_audio(path, seconds, sample_rate=16000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (np.sin(2 * np.pi * 220 * t) * 0.3 * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+def _legacy(video, fps, audio_path, workdir):
+    import imageio
+
+    video_np = (video.squeeze(0).permute(0, 2, 3, 1).cpu().float().numpy() * 255).astype(np.uint8)
+    tmp_path = os.path.join(workdir, "job_tmp.mp4")
+    output_path = os.path.join(workdir, "job.mp4")
+    imageio.mimsave(tmp_path, video_np, fps=fps, codec="libx264", macro_block_size=None,
+                    ffmpeg_params=["-crf", "18", "-preset", "veryfast", "-pix_fmt", "yuv420p"])
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", tmp_path, "-i", audio_path,
+                    "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", "-c:a", "aac", "-ar", "48000",
+                    "-ac", "1", "-b:a", "96k", "-movflags", "+faststart", "-shortest", output_path],
+                   check=True)
+    os.remove(tmp_path)
+    subprocess.run(["cp", output_path, os.path.join(workdir, "volume.mp4")], check=True)
+    return output_path
+
+
+def _to_uint8(frames):
+    # same as server._to_uint8
+    import torch
+    return (frames.permute(0, 2, 3, 1).float() * 255).clamp_(0, 255).to(torch.uint8).cpu().numpy()
+
+
+def _pipe(video, fps, audio_path, workdir):
+    import torch
+    from encoder import VideoEncoder, copy_file
+
+    output_path = os.path.join(workdir, "job.mp4")
+    frames = video[0]
+    _, _, height, width = frames.shape
+    with VideoEncoder(output_path, width, height, fps, audio_path) as encoder:
+        for start in range(0, frames.shape[0], ENCODE_CHUNK_FRAMES):
+            chunk = frames[start:start + ENCODE_CHUNK_FRAMES]
+            encoder.write(_to_uint8(chunk))
+    copy_file(output_path, os.path.join(workdir, "volume.mp4"))
+    return output_path
+
+
+def _child(mode, duration, fps, height, width):
+    import torch
+
+    with tempfile.TemporaryDirectory() as workdir:
+        audio_path = os.path.join(workdir, "input.wav")
+        _write_audio(audio_path, duration)
+        latent_frames = (duration * fps + 4) // 4
+        # smooth random motion (real avatar frames compress far better than per-pixel
+        # noise), upsampled chunk by chunk so the peak RSS baseline is the video itself
+        video = torch.empty(1, (latent_frames - 1) * 4 + 1, 3, height, width)
+        for start in range(0, video.shape[1], ENCODE_CHUNK_FRAMES):
+            coarse = torch.rand(video[0, start:start + ENCODE_CHUNK_FRAMES].shape[0], 3, height // 16, width // 16)
+            video[0, start:start + ENCODE_CHUNK_FRAMES] = torch.nn.functional.interpolate(
+                coarse, size=(height, width), mode="bilinear")
+        base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        output_path = (_legacy if mode == "legacy" else _pipe)(video, fps, audio_path, workdir)
+        elapsed = time.perf_counter() - start
+        print(json.dumps({
+            "seconds": elapsed,
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "base_rss_mb": base_rss / 1024,
+            "bytes": os.path.getsize(output_path),
+        }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=5, help="seconds of video")
+    parser.add_argument("--fps", type=int, default=16)
+    parser.add_argument("--size", type=int, nargs=2, default=[480, 832], metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "pipe"], choices=["legacy", "pipe"])
+    parser.add_argument("--child", choices=["legacy", "pipe"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    height, width = args.size
+
+    if args.child:
+        _child(args.child, args.duration, args.fps, height, width)
+        return
+
+    print(f"{args.duration} s at {args.fps} fps, {width}x{height}")
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                  "--duration", str(args.duration), "--fps", str(args.fps),
+                                  "--size", str(height), str(width)],
+                                 check=True, capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        best = min(runs, key=lambda r: r["seconds"])
+        print(f"  {mode:<7} {best['seconds']:6.2f} s  peak RSS {best['rss_mb']:7.0f} MB "
+              f"(+{best['rss_mb'] - best['base_rss_mb']:.0f} over the decoded video)  "
+              f"{best['bytes'] / 1e6:.2f} MB out")
+
+
+if __name__ == "__main__":
+    main()
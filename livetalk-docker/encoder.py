@@ -0,0 +1,196 @@
+"""Single-pass MP4 encoding for the LiveTalk server.
+
+Raw RGB frames are piped in chunks to one ffmpeg process that also reads the
+job's audio and writes the final file, so the video is encoded once, muxed
+in the same pass and never held in memory as a whole. A writer thread feeds
+the pipe, so converting the next chunk overlaps with encoding this one.
+
+:class:`HLSEncoder` writes the same stream as an HLS event playlist of
+fragmented-MP4 segments, which players can start while frames still arrive.
+"""
+
+import functools
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+HLS_PLAYLIST = "index.m3u8"
+
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_has_option(name):
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-h", "long"], capture_output=True, text=True)
+    return f"-{name} " in result.stdout
+
+
+class VideoEncoder:
+    """ffmpeg process fed with uint8 [frames, height, width, 3] chunks via :meth:`write`."""
+
+    def __init__(self, output_path, width, height, fps, audio_path=None, crf=18, preset="veryfast",
+                 max_pending=2):
+        self.output_path = output_path
+        self.frames = 0
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+            "-framerate", str(fps), "-i", "pipe:0",
+        ]
+        if audio_path:
+            cmd += [
+                "-i", audio_path, "-map", "0:v:0", "-map", "1:a:0",
+                "-c:a", "aac", "-ar", "48000", "-ac", "1", "-b:a", "96k", "-shortest",
+            ]
+            if _ffmpeg_has_option("shortest_buf_duration"):
+                # ffmpeg >= 6.1 holds back 10 s of output for -shortest by default,
+                # which would delay the first HLS segment
+                cmd += ["-shortest_buf_duration", "1"]
+        cmd += ["-c:v", "libx264", "-crf", str(crf), "-preset", preset, "-pix_fmt", "yuv420p"]
+        cmd += self._output_args(fps)
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._writer = threading.Thread(target=self._drain, name="ffmpeg-writer", daemon=True)
+        self._writer.start()
+
+    def _output_args(self, fps):
+        return ["-movflags", "+faststart", self.output_path]
+
+    def _drain(self):
+        while True:
+            chunk = self._pending.get()
+            if chunk is None:
+                return
+            try:
+                self._proc.stdin.write(chunk.data)
+            except (BrokenPipeError, ValueError):
+                pass  # ffmpeg exited early; keep draining, close() raises with its message
+
+    def write(self, frames):
+        """Queues a chunk; blocks while ``max_pending`` chunks wait for ffmpeg."""
+        self._pending.put(np.ascontiguousarray(frames, dtype=np.uint8))
+        self.frames += len(frames)
+
+    def close(self):
+        self._pending.put(None)
+        self._writer.join()
+        _, err = self._proc.communicate()
+        if self._proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {err.decode(errors='replace').strip()}")
+
+    def abort(self):
+        if self._proc.returncode is None:
+            self._proc.kill()
+            self._pending.put(None)
+            self._writer.join()
+            self._proc.communicate()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class HLSEncoder(VideoEncoder):
+    """Writes ``stream_dir/index.m3u8`` plus ``init.mp4`` and ``seg_*.m4s`` segments.
+
+    Keyframes are forced every ``segment_seconds`` so segments are cut on
+    time, and x264 runs without lookahead or B-frames (``zerolatency``) so a
+    segment is written as soon as its frames arrive. ``first_segment_at`` (time.monotonic()) is set once the playlist
+    lists its first segment.
+    """
+
+    def __init__(self, stream_dir, width, height, fps, audio_path=None, segment_seconds=1.0, **kwargs):
+        os.makedirs(stream_dir, exist_ok=True)
+        self.stream_dir = stream_dir
+        self.segment_seconds = segment_seconds
+        self.first_segment_at = None
+        super().__init__(os.path.join(stream_dir, HLS_PLAYLIST), width, height, fps, audio_path, **kwargs)
+        self._watcher = threading.Thread(target=self._watch, name="hls-watcher", daemon=True)
+        self._watcher.start()
+
+    def _output_args(self, fps):
+        gop = str(max(1, round(fps * self.segment_seconds)))
+        return [
+            "-g", gop, "-keyint_min", gop, "-sc_threshold", "0", "-tune", "zerolatency",
+            "-f", "hls", "-hls_time", str(self.segment_seconds), "-hls_list_size", "0",
+            "-hls_playlist_type", "event", "-hls_segment_type", "fmp4",
+            "-hls_flags", "temp_file+independent_segments",
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", os.path.join(self.stream_dir, "seg_%05d.m4s"),
+            self.output_path,
+        ]
+
+    def _watch(self):
+        while self.first_segment_at is None:
+            if self.ready():
+                self.first_segment_at = time.monotonic()
+            elif self._proc.poll() is not None:
+                return
+            else:
+                time.sleep(0.05)
+
+    def ready(self):
+        """True once the playlist lists at least one segment."""
+        try:
+            with open(self.output_path, "r") as f:
+                return "#EXTINF" in f.read()
+        except FileNotFoundError:
+            return False
+
+    def abort(self):
+        if self._proc.returncode is None:
+            self._proc.kill()
+            self._pending.put(None)
+            self._writer.join()
+            self._proc.communicate()
+        shutil.rmtree(self.stream_dir, ignore_errors=True)
+
+
+def remux_hls(stream_dir, output_path):
+    """Copies a finished HLS stream into one MP4 (no re-encode)."""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error", "-i", os.path.join(stream_dir, HLS_PLAYLIST),
+            "-c", "copy", "-movflags", "+faststart", output_path,
+        ],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+
+def link_or_copy(src, dst):
+    """Makes ``dst`` a hard link to ``src``, or a copy when they are on different filesystems.
+
+    The copy goes through shutil.copyfile, which uses the kernel's sendfile on
+    Linux. ``dst`` is replaced atomically, so readers never see a partial file.
+    """
+    tmp = f"{dst}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def copy_file(src, dst):
+    """Copies ``src`` to ``dst`` (sendfile on Linux), replacing ``dst`` atomically.
+
+    For destinations outside a size-budgeted directory: a hard link there
+    would keep the blocks allocated after the budget deletes ``src``.
+    """
+    tmp = f"{dst}.tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
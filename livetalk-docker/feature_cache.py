@@ -0,0 +1,368 @@
+"""Content-addressed cache of conditioning features across LiveTalk jobs.
+
+The pipeline re-encodes the reference image, the text prompt and the audio
+on every job, even when a persona image or prompt is reused for dozens of
+jobs. :func:`install` memoizes the encoder modules it finds (text encoder
+forward, VAE encode, wav2vec forward) on a hash of their actual inputs, so
+it needs no knowledge of how the pipeline calls them; decode paths are
+never wrapped. The key is a blake2b digest of the inputs' bytes; GPU
+inputs are copied to the host for it, which costs far less than the
+encoder pass a hit saves (prompt tokens, one reference image, an audio
+clip).
+
+Entries live in host memory, LRU-evicted by a byte budget, and are moved
+back to the caller's device on a hit. Evicted entries can spill to disk
+(``torch.save`` of plain containers, loaded with ``weights_only=True``) and
+are promoted back to memory when hit again.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import torch
+
+# (namespace, class-name substring, methods to memoize)
+TARGETS = (
+    ("prompt", "TextEncoder", ("forward",)),
+    ("audio", "Wav2Vec", ("forward",)),
+    ("image", "VAE", ("encode", "encode_to_latent")),
+)
+
+
+class Uncacheable(Exception):
+    pass
+
+
+def _hash_into(digest, obj):
+    if isinstance(obj, torch.Tensor):
+        tensor = obj.detach().to("cpu").contiguous()
+        digest.update(f"T{tensor.dtype}{tuple(tensor.shape)}".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy().data)
+    elif isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        digest.update(f"A{array.dtype}{array.shape}".encode())
+        digest.update(array.data)
+    elif obj is None or isinstance(obj, (str, bytes, int, float, bool)):
+        digest.update(f"{type(obj).__name__}:{obj!r}".encode())
+    elif isinstance(obj, (list, tuple)):
+        digest.update(f"L{len(obj)}".encode())
+        for item in obj:
+            _hash_into(digest, item)
+    elif isinstance(obj, dict):
+        digest.update(f"D{len(obj)}".encode())
+        for key in sorted(obj, key=str):
+            _hash_into(digest, key)
+            _hash_into(digest, obj[key])
+    else:
+        raise Uncacheable(type(obj).__name__)
+
+
+def _map_tensors(obj, fn):
+    """Applies ``fn`` to every tensor in a (nested) tuple/list/dict/ModelOutput."""
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    if isinstance(obj, tuple) and hasattr(obj, "_fields"):
+        return type(obj)(*(_map_tensors(item, fn) for item in obj))
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_map_tensors(item, fn) for item in obj)
+    if isinstance(obj, dict):
+        mapped = {key: _map_tensors(value, fn) for key, value in obj.items()}
+        return mapped if type(obj) is dict else type(obj)(**mapped)
+    return obj
+
+
+def _pack(obj, types):
+    """Plain tuples/lists/dicts of tensors for ``torch.load(weights_only=True)``.
+
+    Named tuples and dict subclasses (e.g. transformers' ModelOutput) become
+    ``("__typed__", name, payload)``; ``types`` maps the names back to classes.
+    """
+    if isinstance(obj, tuple) and hasattr(obj, "_fields") or isinstance(obj, dict) and type(obj) is not dict:
+        name = f"{type(obj).__module__}.{type(obj).__qualname__}"
+        types[name] = type(obj)
+        payload = [_pack(item, types) for item in obj] if isinstance(obj, tuple) else \
+            {key: _pack(value, types) for key, value in obj.items()}
+        return ("__typed__", name, payload)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_pack(item, types) for item in obj)
+    if isinstance(obj, dict):
+        return {key: _pack(value, types) for key, value in obj.items()}
+    return obj
+
+
+def _unpack(obj, types):
+    """Inverse of :func:`_pack`; raises KeyError for a class this process has not packed."""
+    if isinstance(obj, tuple) and len(obj) == 3 and obj[0] == "__typed__":
+        cls = types[obj[1]]
+        payload = obj[2]
+        if isinstance(payload, list):
+            return cls(*(_unpack(item, types) for item in payload))
+        return cls(**{key: _unpack(value, types) for key, value in payload.items()})
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_unpack(item, types) for item in obj)
+    if isinstance(obj, dict):
+        return {key: _unpack(value, types) for key, value in obj.items()}
+    return obj
+
+
+def _to_host(tensor):
+    tensor = tensor.detach()
+    if tensor.device.type == "cpu":
+        return tensor.clone()
+    host = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+    return host.copy_(tensor, non_blocking=True)
+
+
+def _nbytes(obj):
+    total = 0
+
+    def count(tensor):
+        nonlocal total
+        total += tensor.numel() * tensor.element_size()
+        return tensor
+
+    _map_tensors(obj, count)
+    return total
+
+
+def _device_of(obj):
+    found = []
+    _map_tensors(obj, lambda t: found.append(str(t.device)) or t)
+    return found[0] if found else "cpu"
+
+
+class FeatureCache:
+    """Thread-safe LRU of encoder outputs with optional disk spill."""
+
+    def __init__(self, max_bytes=1 << 30, spill_dir=None, max_spill_bytes=4 << 30):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir if max_spill_bytes > 0 else None
+        self.max_spill_bytes = max_spill_bytes
+        # (namespace, key) -> ((value on cpu, device of the original, copy-done CUDA event or None), nbytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self._stats = {}
+        # classes of spilled structured values; spill files only hold plain containers
+        self._types = {}
+        # (namespace, start, end) CUDA events of misses whose time is not yet known
+        self._timings = deque()
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def _ns(self, namespace):
+        return self._stats.setdefault(namespace, {
+            "hits": 0, "disk_hits": 0, "misses": 0, "uncacheable": 0,
+            "miss_seconds": 0.0, "saved_seconds": 0.0,
+        })
+
+    # -- storage ------------------------------------------------------------
+
+    def _spill_path(self, namespace, key):
+        return os.path.join(self.spill_dir, f"{namespace}-{key}.pt")
+
+    def _lookup(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None:
+                self._entries.move_to_end((namespace, key))
+                return entry[0], False
+        if self.spill_dir:
+            path = self._spill_path(namespace, key)
+            try:
+                value = (*_unpack(torch.load(path, map_location="cpu", weights_only=True), self._types), None)
+            except (FileNotFoundError, EOFError, RuntimeError, pickle.UnpicklingError, KeyError):
+                # missing, truncated, not plain tensors, or a class packed by an earlier process
+                return None, False
+            os.utime(path)  # spill eviction is by last use
+            self._store(namespace, key, value)
+            return value, True
+        return None, False
+
+    def _store(self, namespace, key, value):
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            old = self._entries.pop((namespace, key), None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[(namespace, key)] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                evicted_key, (evicted_value, evicted_bytes) = self._entries.popitem(last=False)
+                self.bytes -= evicted_bytes
+                evicted.append((evicted_key, evicted_value))
+        for (evicted_ns, evicted_key), evicted_value in evicted:
+            self._spill(evicted_ns, evicted_key, evicted_value)
+
+    def _spill(self, namespace, key, value):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(namespace, key)
+        if not os.path.exists(path):
+            host, device, ready = value
+            if ready is not None:
+                ready.synchronize()
+            torch.save(_pack((host, device), self._types), f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        self._trim_spill()
+
+    def _trim_spill(self):
+        files = []
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_spill_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    # -- memoization ----------------------------------------------------------
+
+    def call(self, namespace, fn, args, kwargs):
+        """Returns ``fn(*args, **kwargs)``, cached on the content of the arguments."""
+        digest = hashlib.blake2b(namespace.encode(), digest_size=16)
+        try:
+            _hash_into(digest, (args, kwargs))
+        except Uncacheable:
+            with self._lock:
+                self._ns(namespace)["uncacheable"] += 1
+            return fn(*args, **kwargs)
+        key = digest.hexdigest()
+
+        entry, from_disk = self._lookup(namespace, key)
+        if entry is not None:
+            value, device, ready = entry
+            if ready is not None:
+                ready.synchronize()
+            with self._lock:
+                self._collect_timings()
+                stats = self._ns(namespace)
+                stats["hits"] += 1
+                stats["disk_hits"] += from_disk
+                misses = stats["misses"]
+                stats["saved_seconds"] += stats["miss_seconds"] / misses if misses else 0.0
+            # always a copy: callers may modify their inputs in place
+            return _map_tensors(value, lambda t: t.to(device, copy=True))
+
+        # on CUDA the encoder is timed with events and its result copied to pinned host memory
+        # without waiting; the entry is synchronized on first use (hit or spill)
+        cuda = torch.cuda.is_available()
+        if cuda:
+            start = torch.cuda.Event(enable_timing=True)
+            start.record()
+        else:
+            start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        host = _map_tensors(result, _to_host)
+        if cuda:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+        with self._lock:
+            stats = self._ns(namespace)
+            stats["misses"] += 1
+            if cuda:
+                self._timings.append((namespace, start, end))
+            else:
+                stats["miss_seconds"] += time.perf_counter() - start
+        self._store(namespace, key, (host, _device_of(result), end if cuda else None))
+        return result
+
+    def _collect_timings(self):
+        """Adds the GPU time of finished misses; called with the lock held."""
+        while self._timings and self._timings[0][2].query():
+            namespace, start, end = self._timings.popleft()
+            self._ns(namespace)["miss_seconds"] += start.elapsed_time(end) / 1000
+
+    def stats(self):
+        with self._lock:
+            self._collect_timings()
+            namespaces = {}
+            for namespace, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                namespaces[namespace] = {
+                    **stats,
+                    "miss_seconds": round(stats["miss_seconds"], 3),
+                    "saved_seconds": round(stats["saved_seconds"], 3),
+                    "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+                }
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "spill_bytes": self.spill_bytes(),
+                "saved_seconds": round(sum(s["saved_seconds"] for s in self._stats.values()), 3),
+                "namespaces": namespaces,
+            }
+
+    def spill_bytes(self):
+        if not self.spill_dir:
+            return 0
+        total = 0
+        for entry in os.scandir(self.spill_dir):
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:  # evicted meanwhile
+                pass
+        return total
+
+    def saved_seconds(self):
+        with self._lock:
+            return sum(s["saved_seconds"] for s in self._stats.values())
+
+
+def _memoize(cache, namespace, module, method):
+    fn = getattr(module, method)
+
+    def cached(*args, **kwargs):
+        return cache.call(namespace, fn, args, kwargs)
+
+    setattr(module, method, cached)  # instance attribute shadows the class method
+
+
+def install(cache, *roots):
+    """Memoizes the encoder methods of every module reachable from ``roots``.
+
+    Roots may be modules, objects holding modules as attributes, or Python
+    modules (e.g. one keeping models in globals). Returns the wrapped
+    "namespace: ClassName.method" descriptions.
+    """
+    candidates = []
+    for root in roots:
+        if isinstance(root, torch.nn.Module):
+            candidates.append(root)
+        else:
+            candidates.extend(v for v in vars(root).values() if isinstance(v, torch.nn.Module))
+
+    wrapped = []
+    seen = set()
+    for candidate in candidates:
+        skip_prefixes = []
+        for name, module in candidate.named_modules():
+            if id(module) in seen or any(name.startswith(prefix) for prefix in skip_prefixes):
+                continue
+            seen.add(id(module))
+            cls = type(module).__name__
+            for namespace, pattern, methods in TARGETS:
+                if pattern not in cls:
+                    continue
+                for method in methods:
+                    if callable(getattr(module, method, None)):
+                        _memoize(cache, namespace, module, method)
+                        wrapped.append(f"{namespace}: {cls}.{method}")
+                skip_prefixes.append(f"{name}." if name else "")  # submodules are covered
+                break
+    return wrapped
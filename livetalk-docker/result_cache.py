@@ -0,0 +1,160 @@
+"""Content-addressed cache of finished LiveTalk videos and size budget of the jobs directory.
+
+A deterministic job (fixed seed) is keyed on the content of its image and
+audio, the prompt, the duration, the seed and the server settings; its MP4
+is hard-linked into ``<jobs dir>/results/<key>.mp4`` so an identical request
+can be answered without touching the GPU.
+
+:meth:`ResultCache.enforce_budget` keeps the whole jobs directory (job
+inputs, outputs, HLS segments and cached results) under a byte budget by
+deleting the least recently used units: a job (``<id>/`` plus ``<id>.mp4``)
+or a cached result. Hard-linked files count ``size / links`` per link, so
+a result shared by a job and the cache is not counted twice.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from encoder import link_or_copy
+
+RESULTS_DIRNAME = "results"
+
+
+def file_digest(source):
+    """sha256 of a path or a binary file object (rewound afterwards)."""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def result_key(image_digest, audio_digest, prompt, duration, seed, settings):
+    payload = json.dumps(
+        {"image": image_digest, "audio": audio_digest, "prompt": prompt, "duration": duration,
+         "seed": seed, "settings": settings},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def derived_seed(key):
+    """Seed for deterministic requests that do not give one."""
+    return int(key[:8], 16)
+
+
+def _files(path):
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                yield os.path.join(root, name)
+    else:
+        yield path
+
+
+class ResultCache:
+    def __init__(self, jobs_dir, max_bytes, exclude=()):
+        self.jobs_dir = str(jobs_dir)
+        self.results_dir = os.path.join(self.jobs_dir, RESULTS_DIRNAME)
+        self.max_bytes = max_bytes
+        # top-level entries with their own budget (e.g. the feature cache spill)
+        self.exclude = set(exclude)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        self.bytes = 0
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.results_dir, f"{key}.mp4")
+
+    def lookup(self, key):
+        """Path of the cached result for ``key`` (marked as recently used), or None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def store(self, key, video_path):
+        link_or_copy(video_path, self._path(key))
+        with self._lock:
+            self.stored += 1
+
+    def _units(self):
+        """unit name -> [size, last use, paths]; a job's directory and MP4 form one unit."""
+        units = {}
+        for name in os.listdir(self.jobs_dir):
+            if name in self.exclude:
+                continue
+            path = os.path.join(self.jobs_dir, name)
+            if name == RESULTS_DIRNAME:
+                entries = [(f"{RESULTS_DIRNAME}/{result}", os.path.join(path, result)) for result in os.listdir(path)]
+            else:
+                entries = [(name.split(".", 1)[0], path)]
+            for unit, unit_path in entries:
+                entry = units.setdefault(unit, [0.0, 0.0, []])
+                entry[2].append(unit_path)
+                for file_path in _files(unit_path):
+                    try:
+                        stat = os.stat(file_path)
+                    except FileNotFoundError:
+                        continue
+                    entry[0] += stat.st_size / max(stat.st_nlink, 1)
+                    entry[1] = max(entry[1], stat.st_mtime)
+        return units
+
+    def enforce_budget(self, busy=()):
+        """Deletes least recently used units until the directory fits; returns the evicted job ids.
+
+        ``busy`` names jobs that must stay (queued or running).
+        """
+        with self._lock:
+            units = self._units()
+            total = sum(size for size, _, _ in units.values())
+            evicted = []
+            for unit, (size, _, paths) in sorted(units.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                if unit in busy:
+                    continue
+                for path in paths:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                total -= size
+                self.evicted += 1
+                if not unit.startswith(f"{RESULTS_DIRNAME}/"):
+                    evicted.append(unit)
+            self.bytes = int(total)
+            return evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stored": self.stored,
+                "evicted": self.evicted,
+                "results": len(os.listdir(self.results_dir)),
+                "jobs_dir_bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
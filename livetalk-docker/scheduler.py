@@ -0,0 +1,166 @@
+"""Job scheduler for the LiveTalk server: one GPU worker draining a bounded priority queue.
+
+Standard library only, so it runs without LiveTalk or a GPU (the server's
+``LIVETALK_FAKE_PIPELINE=1`` mode uses it with a CPU stand-in pipeline).
+
+Jobs are any objects with ``id``, ``duration`` (seconds of video) and
+``status``/``progress`` attributes. Higher ``priority`` runs first, equal
+priorities in submission order. ETAs scale with the requested video length,
+using a moving average of the measured generation seconds per video second.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import traceback
+
+
+class QueueFull(Exception):
+    """Raised by :meth:`JobScheduler.submit` when the queue is at capacity."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"queue full, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    def __init__(self, run, max_queued=8, seconds_per_video_second=30.0, smoothing=0.3):
+        self.max_queued = max_queued
+        self.seconds_per_video_second = seconds_per_video_second
+        self._run = run
+        self._smoothing = smoothing
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = None
+        self._started = 0.0
+        self._stopped = False
+        self._thread = None
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, name="gpu-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops after the running job; queued jobs stay queued."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                job.status = "running"
+                self._running = job
+                self._started = time.monotonic()
+            try:
+                self._run(job)
+            except Exception as exc:  # the worker outlives any job
+                traceback.print_exc()
+                job.status = "error"
+                job.error = str(exc)
+                job.progress = f"Error: {exc}"
+            elapsed = time.monotonic() - self._started
+            with self._cond:
+                self._running = None
+                if job.status == "done":
+                    self.completed += 1
+                    if job.duration > 0:
+                        rate = elapsed / job.duration
+                        self.seconds_per_video_second += self._smoothing * (rate - self.seconds_per_video_second)
+                else:
+                    self.failed += 1
+
+    # -- admission ----------------------------------------------------------
+
+    def submit(self, job, priority=0):
+        """Queues ``job``; raises :class:`QueueFull` with a retry hint when at capacity."""
+        with self._cond:
+            if len(self._heap) >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+            job.status = "queued"
+            job.progress = "Queued..."
+            heapq.heappush(self._heap, (-priority, next(self._seq), job))
+            self._cond.notify()
+
+    def check_capacity(self):
+        """Raises :class:`QueueFull` (counted as a rejection) if :meth:`submit` would."""
+        with self._cond:
+            if len(self._heap) >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+
+    def _retry_after(self):
+        # a slot frees when the running job finishes and the next one starts
+        return max(1, math.ceil(self._remaining()))
+
+    def cancel(self, job):
+        """Removes a queued job; returns False if it already started or finished."""
+        with self._cond:
+            for i, entry in enumerate(self._heap):
+                if entry[2] is job:
+                    self._heap[i] = self._heap[-1]
+                    self._heap.pop()
+                    heapq.heapify(self._heap)
+                    job.status = "cancelled"
+                    job.progress = "Cancelled"
+                    self.cancelled += 1
+                    return True
+            return False
+
+    # -- estimates ----------------------------------------------------------
+
+    def _cost(self, job):
+        return self.seconds_per_video_second * job.duration
+
+    def _remaining(self):
+        if self._running is None:
+            return 0.0
+        # a job that overruns its estimate is assumed to be nearly done
+        elapsed = time.monotonic() - self._started
+        return max(self._cost(self._running) - elapsed, 0.1 * self._cost(self._running))
+
+    def position(self, job):
+        """(jobs ahead, estimated seconds until ``job`` finishes), or None if it is not queued."""
+        with self._cond:
+            order = sorted(self._heap)
+            for ahead, entry in enumerate(order):
+                if entry[2] is job:
+                    wait = self._remaining() + sum(self._cost(e[2]) for e in order[:ahead])
+                    return ahead, wait + self._cost(job)
+            if job is self._running:
+                return 0, self._remaining()
+            return None
+
+    @property
+    def running(self):
+        return self._running
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._heap),
+                "max_queued": self.max_queued,
+                "running": self._running.id if self._running is not None else None,
+                "seconds_per_video_second": round(self.seconds_per_video_second, 2),
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
@@ -3,25 +3,38 @@
 import os
 import sys
 
-# Must be set before any LiveTalk imports (parse_args runs at module level)
-os.chdir("/app")
-sys.path.insert(0, "/app")
-sys.path.append("/app/OmniAvatar")
-sys.argv = ["server", "--config", os.environ.get("CONFIG", "configs/causal_inference.yaml")]
+# LIVETALK_FAKE_PIPELINE=1 replaces the model with a CPU stand-in that sleeps
+# and returns noise frames, for exercising the scheduler and encoding without
+# a GPU or the LiveTalk checkout.
+FAKE_PIPELINE = os.environ.get("LIVETALK_FAKE_PIPELINE") == "1"
+
+if not FAKE_PIPELINE:
+    # Must be set before any LiveTalk imports (parse_args runs at module level)
+    os.chdir("/app")
+    sys.path.insert(0, "/app")
+    sys.path.append("/app/OmniAvatar")
+    sys.argv = ["server", "--config", os.environ.get("CONFIG", "configs/causal_inference.yaml")]
 
-import torch
 import numpy as np
-import imageio
-import subprocess
+import torch
+import shutil
 import uuid
-import threading
 import time
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
-from flask import Flask, request, render_template_string, send_file, jsonify
+from types import SimpleNamespace
+from flask import Flask, request, render_template_string, send_file, send_from_directory, jsonify, redirect
+
+import feature_cache as _feature_cache
+import result_cache as _result_cache
+from encoder import HLS_PLAYLIST, HLSEncoder, VideoEncoder, copy_file, link_or_copy, remux_hls
+from scheduler import JobScheduler, QueueFull
 
-# LiveTalk imports (triggers module-level parse_args)
-from scripts.inference_example import CausalInferencePipeline, load_models
-import scripts.inference_example as _infer_mod
+if not FAKE_PIPELINE:
+    # LiveTalk imports (triggers module-level parse_args)
+    from scripts.inference_example import CausalInferencePipeline, load_models
+    import scripts.inference_example as _infer_mod
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100MB upload limit
@@ -32,14 +45,46 @@ app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100MB upload limit
 pipeline = None
 args = None
 jobs = {}
-gpu_lock = threading.Lock()
+# (module, method) of the VAE decode calls hooked per job to encode each block as it is decoded
+decode_targets = []
+# Time to first playable HLS segment of recent streamed jobs
+first_segment_times = deque(maxlen=100)
+DEVICE = torch.device("cpu" if FAKE_PIPELINE else "cuda:0")
 
 JOBS_DIR = Path("/tmp/livetalk_jobs")
 JOBS_DIR.mkdir(parents=True, exist_ok=True)
+EXAMPLE_IMAGE = "/app/examples/inference/example1.jpg"
+EXAMPLE_AUDIO = "/app/examples/inference/example1.wav"
+
+# Jobs waiting for the GPU beyond this are rejected with 429 + Retry-After
+MAX_QUEUED = int(os.environ.get("LIVETALK_MAX_QUEUED", "8"))
+# Highest priority a request may ask for; 0 runs every request in submission order
+MAX_PRIORITY = int(os.environ.get("LIVETALK_MAX_PRIORITY", "0"))
+# Initial ETA estimate; replaced by a moving average of measured jobs
+SECONDS_PER_VIDEO_SECOND = float(os.environ.get("LIVETALK_SECONDS_PER_VIDEO_SECOND", "30"))
+# Frames converted to uint8 and piped to ffmpeg at a time
+ENCODE_CHUNK_FRAMES = 16
+# Target HLS segment length for streamed jobs
+HLS_SEGMENT_SECONDS = float(os.environ.get("LIVETALK_HLS_SEGMENT_SECONDS", "1"))
+# Host-memory budget for cached prompt/image/audio encodings (0 disables the cache)
+FEATURE_CACHE_MB = int(os.environ.get("LIVETALK_FEATURE_CACHE_MB", "1024"))
+# Disk budget for entries evicted from memory, under JOBS_DIR/feature_cache (0 disables spill)
+FEATURE_CACHE_DISK_MB = int(os.environ.get("LIVETALK_FEATURE_CACHE_DISK_MB", "4096"))
+# Size budget of JOBS_DIR (inputs, outputs, streams, cached results); LRU eviction
+JOBS_DIR_MAX_MB = int(os.environ.get("LIVETALK_JOBS_DIR_MAX_MB", "10240"))
+STREAM_MIMETYPES = {".m3u8": "application/vnd.apple.mpegurl", ".m4s": "video/iso.segment", ".mp4": "video/mp4"}
+
+feature_cache = _feature_cache.FeatureCache(
+    FEATURE_CACHE_MB << 20, str(JOBS_DIR / "feature_cache"), FEATURE_CACHE_DISK_MB << 20
+)
+feature_cache_targets = []
+result_cache = _result_cache.ResultCache(JOBS_DIR, JOBS_DIR_MAX_MB << 20, exclude=("feature_cache",))
+# Everything besides the request that affects a deterministic result (set at startup)
+result_settings = {}
 
 
 class Job:
-    def __init__(self, job_id, image_path, audio_path, duration, prompt):
+    def __init__(self, job_id, image_path, audio_path, duration, prompt, stream=False):
         self.id = job_id
         self.status = "queued"
         self.progress = "Waiting..."
@@ -49,33 +94,214 @@ class Job:
         self.duration = int(duration)
         self.prompt = prompt
         self.output_path = str(JOBS_DIR / f"{job_id}.mp4")
+        self.stream = stream
+        self.stream_dir = str(JOBS_DIR / job_id / "stream")
+        self.stream_encoder = None
+        self.started_at = None
+        self.feature_cache_saved = None
+        self.seed = None
+        self.result_key = None
+
+
+class _FakeEncoder(torch.nn.Module):
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+
+    def _encode(self, *inputs):
+        time.sleep(self.seconds)
+        return torch.rand(1, 16, 64)
+
+
+class FakeTextEncoder(_FakeEncoder):
+    def forward(self, text_prompts):
+        return {"prompt_embeds": self._encode(text_prompts)}
+
+
+class FakeWav2Vec(_FakeEncoder):
+    def forward(self, input_values):
+        return self._encode(input_values)
+
+
+class FakeVAE(_FakeEncoder):
+    def encode(self, image):
+        return self._encode(image)
+
+    def decode_to_pixel(self, latent, use_cache=False, size=64):
+        # Wan VAE: 4 video frames per latent frame, 1 for the very first
+        num_frames = latent.shape[1] * 4 - (0 if use_cache else 3)
+        return torch.rand(1, num_frames, 3, size, size) * 2 - 1
+
+
+class FakePipeline:
+    """CPU stand-in for CausalInferencePipeline (LIVETALK_FAKE_PIPELINE=1).
+
+    Runs stand-in encoders on the prompt and the input files, then produces
+    latent blocks one after another and decodes each with
+    ``vae.decode_to_pixel`` as soon as it is done, the way the block-wise
+    causal pipeline does.
+    """
+
+    def __init__(self, seconds_per_frame, size=64, frames_per_block=3, encoder_seconds=0.5):
+        self.seconds_per_frame = seconds_per_frame
+        self.size = size
+        self.frames_per_block = frames_per_block
+        self.text_encoder = FakeTextEncoder(encoder_seconds)
+        self.audio_encoder = FakeWav2Vec(encoder_seconds)
+        self.vae = FakeVAE(encoder_seconds)
+
+    def __call__(self, noise, text_prompts, image_path, audio_path, initial_latent=None, return_latents=False):
+        self.text_encoder(text_prompts)
+        self.vae.encode(torch.frombuffer(bytearray(Path(image_path).read_bytes()), dtype=torch.uint8))
+        self.audio_encoder(torch.frombuffer(bytearray(Path(audio_path).read_bytes()), dtype=torch.uint8))
+        blocks = []
+        for start in range(0, noise.shape[1], self.frames_per_block):
+            latent = noise[:, start:start + self.frames_per_block]
+            time.sleep(self.seconds_per_frame * latent.shape[1] * 4)
+            blocks.append(self.vae.decode_to_pixel(latent, use_cache=start > 0, size=self.size))
+        return (torch.cat(blocks, dim=1) * 0.5 + 0.5).clamp(0, 1)
 
 
 def init_pipeline():
     """Load all models into GPU. Called once at startup."""
-    global pipeline, args
-    args = _infer_mod.args
-    device = torch.device("cuda:0")
-    load_models(args)
-    pipeline = CausalInferencePipeline.from_pretrained(args=args, device=device)
-    print(f"[server] Pipeline ready on {device}")
+    global pipeline, args, result_settings
+    if FAKE_PIPELINE:
+        args = SimpleNamespace(fps=16, dtype="bf16")
+        pipeline = FakePipeline(float(os.environ.get("LIVETALK_FAKE_SECONDS_PER_FRAME", "0.05")))
+        print("[server] Fake pipeline ready on cpu")
+    else:
+        args = _infer_mod.args
+        load_models(args)
+        pipeline = CausalInferencePipeline.from_pretrained(args=args, device=DEVICE)
+        print(f"[server] Pipeline ready on {DEVICE}")
+    config = os.environ.get("CONFIG", "configs/causal_inference.yaml")
+    result_settings = {
+        "pipeline": "fake" if FAKE_PIPELINE else "livetalk",
+        "config": _result_cache.file_digest(config) if os.path.isfile(config) else config,
+        "fps": args.fps,
+    }
+    _enforce_jobs_dir_budget()
+    # load_models() may keep models in module globals rather than on the pipeline
+    roots = [pipeline] if FAKE_PIPELINE else [pipeline, _infer_mod]
+    decode_targets[:] = _find_decoders(*roots)
+    described = ", ".join(f"{type(module).__name__}.{method}" for module, method in decode_targets)
+    print(f"[server] Per-block encoding: {described or 'off, no VAE decode found (encodes after generation)'}")
+    if FEATURE_CACHE_MB > 0:
+        feature_cache_targets.extend(_feature_cache.install(feature_cache, *roots))
+        print(f"[server] Feature cache on: {', '.join(feature_cache_targets) or 'no encoders found'}")
+
+
+def _find_decoders(*roots):
+    """``(module, method)`` of the ``decode_to_pixel`` of every VAE reachable from ``roots``.
+
+    The causal pipeline decodes each latent block with it as soon as the block
+    is denoised, to frames [B, N, 3, H, W] in [-1, 1].
+    """
+    candidates = []
+    for root in roots:
+        if isinstance(root, torch.nn.Module):
+            candidates.append(root)
+        else:
+            candidates.extend(v for v in vars(root).values() if isinstance(v, torch.nn.Module))
+    found = []
+    seen = set()
+    for candidate in candidates:
+        skip_prefixes = []
+        for name, module in candidate.named_modules():
+            if id(module) in seen or any(name.startswith(prefix) for prefix in skip_prefixes):
+                continue
+            seen.add(id(module))
+            if "VAE" in type(module).__name__ and callable(getattr(module, "decode_to_pixel", None)):
+                found.append((module, "decode_to_pixel"))
+                skip_prefixes.append(f"{name}." if name else "")  # its inner decoder is covered
+    return found
+
+
+@contextmanager
+def _hook_decoders(emit):
+    """Passes every block the VAE decodes to ``emit`` (as [1, N, 3, H, W] in [0, 1]) while active."""
+    originals = []
+    for module, method in decode_targets:
+        fn = getattr(module, method)
+
+        def hooked(*a, _fn=fn, **kw):
+            video = _fn(*a, **kw)
+            emit((video * 0.5 + 0.5).clamp(0, 1))
+            return video
+
+        originals.append((module, method, fn, method in vars(module)))
+        setattr(module, method, hooked)  # instance attribute shadows the class method
+    try:
+        yield
+    finally:
+        for module, method, fn, own in reversed(originals):
+            if own:
+                setattr(module, method, fn)
+            else:
+                delattr(module, method)
+
+
+def _to_uint8(frames):
+    """[N, 3, H, W] in [0, 1] -> host uint8 [N, H, W, 3], converted on the device
+    so only a quarter of the bytes cross to the host."""
+    return (frames.permute(0, 2, 3, 1).float() * 255).clamp_(0, 255).to(torch.uint8).cpu().numpy()
+
+
+def _frame_sums(frames):
+    """Per-frame sum of the uint8 pixels _to_uint8 makes of [N, 3, H, W] frames,
+    computed on the device in ENCODE_CHUNK_FRAMES steps; only N integers are read back."""
+    sums = [(chunk.float() * 255).clamp_(0, 255).to(torch.uint8).reshape(chunk.shape[0], -1).sum(1, dtype=torch.int64)
+            for chunk in frames.split(ENCODE_CHUNK_FRAMES)]
+    return torch.cat(sums).cpu().numpy() if sums else np.zeros(0, dtype=np.int64)
 
 
 def run_inference(job):
-    """Background worker -- one job at a time."""
-    with gpu_lock:
-        try:
-            job.status = "running"
-            device = torch.device("cuda:0")
-            dtype = torch.bfloat16 if args.dtype == "bf16" else torch.float16
-
-            num_frames = (job.duration * args.fps + 4) // 4
-            job.progress = f"Generating noise ({num_frames} latent frames)..."
-            noise = torch.randn(
-                [1, num_frames, 16, 64, 64], device=device, dtype=dtype
-            )
-
-            job.progress = "Running diffusion (this takes a few minutes)..."
+    """Runs one job; called only from the scheduler's GPU worker thread.
+
+    Frames go to ffmpeg as soon as they exist: the VAE decode of every latent
+    block is hooked for the duration of the job (see _hook_decoders). The
+    pipeline's returned video is then checked against what was encoded (the
+    per-frame sums of their uint8 pixels). If the pipeline has no such decode,
+    or the returned video differs from the decoded blocks (frame count, value
+    range, extra post-processing), the returned video is encoded instead.
+    Streamed jobs encode to HLS and are remuxed to the MP4 download at the end.
+    """
+    encoder = None
+    emitted = []  # per-frame checksums of the encoded frames
+
+    def emit(video):
+        nonlocal encoder
+        frames = video[0]
+        emitted.append(_frame_sums(frames))
+        if encoder is None:
+            _, _, height, width = frames.shape
+            if job.stream:
+                encoder = HLSEncoder(job.stream_dir, width, height, args.fps, job.audio_path,
+                                     HLS_SEGMENT_SECONDS)
+                job.stream_encoder = encoder
+            else:
+                encoder = VideoEncoder(job.output_path, width, height, args.fps, job.audio_path)
+        for start in range(0, frames.shape[0], ENCODE_CHUNK_FRAMES):
+            encoder.write(_to_uint8(frames[start:start + ENCODE_CHUNK_FRAMES]))
+
+    try:
+        job.started_at = time.monotonic()
+        saved_before = feature_cache.saved_seconds()
+        dtype = torch.bfloat16 if args.dtype == "bf16" else torch.float16
+
+        num_frames = (job.duration * args.fps + 4) // 4
+        job.progress = f"Generating noise ({num_frames} latent frames)..."
+        # seeds the noise and every sampling step inside the pipeline
+        if job.seed is not None:
+            torch.manual_seed(job.seed)
+        else:
+            torch.seed()
+        noise = torch.randn(
+            [1, num_frames, 16, 64, 64], device=DEVICE, dtype=dtype
+        )
+
+        job.progress = "Running diffusion (this takes a few minutes)..."
+        with _hook_decoders(emit):
             video = pipeline(
                 noise=noise,
                 text_prompts=job.prompt,
@@ -84,52 +310,75 @@ def run_inference(job):
                 initial_latent=None,
                 return_latents=False,
             )
-
+        if encoder is not None:
+            encoded = np.concatenate(emitted)
+            if encoded.shape[0] != video.shape[1]:
+                mismatch = f"decoded blocks hold {encoded.shape[0]} frames, the video {video.shape[1]}"
+            elif not np.array_equal(encoded, _frame_sums(video[0])):
+                mismatch = "decoded blocks differ from the returned video"
+            else:
+                mismatch = None
+            if mismatch is not None:
+                print(f"[server] Job {job.id}: {mismatch}; re-encoding the returned video")
+                encoder.abort()
+                encoder = job.stream_encoder = None
+                emitted.clear()
+        if encoder is None:
             job.progress = "Encoding video..."
-            video_np = (
-                (video.squeeze(0).permute(0, 2, 3, 1).cpu().float().numpy() * 255)
-                .astype(np.uint8)
-            )
-
-            tmp_path = str(JOBS_DIR / f"{job.id}_tmp.mp4")
-            imageio.mimsave(
-                tmp_path,
-                video_np,
-                fps=args.fps,
-                codec="libx264",
-                macro_block_size=None,
-                ffmpeg_params=["-crf", "18", "-preset", "veryfast", "-pix_fmt", "yuv420p"],
-            )
-
-            job.progress = "Merging audio..."
-            subprocess.run(
-                [
-                    "ffmpeg", "-y", "-loglevel", "error",
-                    "-i", tmp_path, "-i", job.audio_path,
-                    "-map", "0:v:0", "-map", "1:a:0",
-                    "-c:v", "copy", "-c:a", "aac", "-ar", "48000", "-ac", "1",
-                    "-b:a", "96k", "-movflags", "+faststart", "-shortest",
-                    job.output_path,
-                ],
-                check=True,
-            )
-            os.remove(tmp_path)
-
-            # Also copy to /app/output/ for the volume mount
-            vol_path = Path("/app/output") / f"{job.id}.mp4"
-            if Path("/app/output").is_dir():
-                subprocess.run(["cp", job.output_path, str(vol_path)], check=True)
-
-            job.status = "done"
-            job.progress = "Complete!"
-            del video, video_np, noise
-            torch.cuda.empty_cache()
-
-        except Exception as exc:
-            job.status = "error"
-            job.error = str(exc)
-            job.progress = f"Error: {exc}"
-            torch.cuda.empty_cache()
+            emit(video)
+
+        job.progress = "Finalizing video..."
+        encoder.close()
+        if job.stream:
+            remux_hls(job.stream_dir, job.output_path)
+            if encoder.first_segment_at is not None:
+                first_segment_times.append(encoder.first_segment_at - job.started_at)
+
+        if job.result_key is not None:
+            result_cache.store(job.result_key, job.output_path)
+
+        # Also expose in /app/output/ for the volume mount; copied, not hard-linked, so evicting
+        # the job frees its blocks and the jobs-dir budget stays accurate
+        if Path("/app/output").is_dir():
+            copy_file(job.output_path, str(Path("/app/output") / f"{job.id}.mp4"))
+
+        job.feature_cache_saved = round(feature_cache.saved_seconds() - saved_before, 3)
+        job.status = "done"
+        job.progress = "Complete!"
+        del video, noise
+        torch.cuda.empty_cache()
+
+    except Exception as exc:
+        if encoder is not None:
+            encoder.abort()
+        job.status = "error"
+        job.error = str(exc)
+        job.progress = f"Error: {exc}"
+        torch.cuda.empty_cache()
+
+    _enforce_jobs_dir_budget(keep=job.id)
+
+
+def _enforce_jobs_dir_budget(keep=None):
+    busy = {job_id for job_id, job in list(jobs.items()) if job.status in ("queued", "running")}
+    if keep is not None:
+        busy.add(keep)
+    for job_id in result_cache.enforce_budget(busy):
+        job = jobs.get(job_id)
+        if job is not None and job.status == "done":
+            job.status = "expired"
+            job.progress = "Output deleted to free disk space"
+
+
+scheduler = JobScheduler(run_inference, MAX_QUEUED, SECONDS_PER_VIDEO_SECOND)
+
+
+def _busy_response(retry_after):
+    body = {
+        "error": f"Server busy ({scheduler.max_queued} jobs queued). Retry in {retry_after} s.",
+        "retry_after": retry_after,
+    }
+    return jsonify(body), 429, {"Retry-After": str(retry_after)}
 
 
 # ---------------------------------------------------------------------------
@@ -224,6 +473,17 @@ h1{font-size:1.4rem;font-weight:700;letter-spacing:-.02em}
       <option value="17">17 s</option>
     </select>
   </div>
+  <div class="fg">
+    <label>Seed (optional, repeats are cached)</label>
+    <input type="text" name="seed" placeholder="random" inputmode="numeric">
+  </div>
+  <div class="fg">
+    <label>Delivery</label>
+    <select name="stream">
+      <option value="0" selected>Download when done</option>
+      <option value="1">Stream while generating</option>
+    </select>
+  </div>
 </div>
 
 <button type="submit" class="btn" id="btn">Generate</button>
@@ -243,6 +503,16 @@ let exMode=false;
 $('ii').onchange=function(){if(this.files[0]){$('ib').classList.add('ok');$('in').textContent=this.files[0].name;exMode=false}};
 $('ai').onchange=function(){if(this.files[0]){$('ab').classList.add('ok');$('an').textContent=this.files[0].name;exMode=false}};
 
+function playStream(url){
+  const v=$('vid');
+  v.loop=false;
+  if(v.canPlayType('application/vnd.apple.mpegurl')){v.src=url;return}
+  const sc=document.createElement('script');
+  sc.src='https://cdn.jsdelivr.net/npm/hls.js@1';
+  sc.onload=()=>{const h=new Hls();h.loadSource(url);h.attachMedia(v)};
+  document.head.appendChild(sc);
+}
+
 function useExample(){
   exMode=true;
   $('ib').classList.add('ok');$('in').textContent='example1.jpg (bundled)';
@@ -268,19 +538,27 @@ $('f').onsubmit=async function(e){
     const d=await r.json();
     if(d.error) throw new Error(d.error);
     const jid=d.job_id;
+    const streaming=fd.get('stream')==='1';
+    let playing=false;
 
     while(true){
-      await new Promise(r=>setTimeout(r,3000));
+      await new Promise(r=>setTimeout(r,streaming?1000:3000));
       const s=await fetch('/status/'+jid).then(r=>r.json());
       st.innerHTML='<span class="spin"></span> '+s.progress;
+      if(s.stream_url&&!playing){
+        playing=true;
+        res.className='res vis';
+        playStream(s.stream_url);
+      }
       if(s.status==='done'){
         st.className='st';
         res.className='res vis';
-        $('vid').src='/download/'+jid;
+        if(!playing){$('vid').loop=true;$('vid').src='/download/'+jid}
         $('dl').href='/download/'+jid;
         break;
       }
       if(s.status==='error') throw new Error(s.error||'Inference failed');
+      if(s.status==='cancelled') throw new Error('Job cancelled');
     }
   }catch(err){
     st.className='st vis err';st.textContent=err.message;
@@ -299,7 +577,25 @@ def index():
 
 @app.route("/health")
 def health():
-    return jsonify({"ok": pipeline is not None, "gpu_busy": gpu_lock.locked()})
+    jobs_run = scheduler.completed + scheduler.failed
+    return jsonify({
+        "ok": pipeline is not None,
+        "gpu_busy": scheduler.running is not None,
+        "queue": scheduler.stats(),
+        "feature_cache": {
+            **feature_cache.stats(),
+            "targets": feature_cache_targets,
+            "saved_seconds_per_job": round(feature_cache.saved_seconds() / jobs_run, 3) if jobs_run else 0.0,
+        },
+        "result_cache": result_cache.stats(),
+        "streaming": {
+            "per_block_encoding": bool(decode_targets),
+            "recent_jobs": len(first_segment_times),
+            "mean_first_segment_seconds": (
+                round(sum(first_segment_times) / len(first_segment_times), 2) if first_segment_times else None
+            ),
+        },
+    })
 
 
 @app.route("/generate", methods=["POST"])
@@ -307,24 +603,12 @@ def generate():
     if pipeline is None:
         return jsonify({"error": "Model still loading, try again shortly."}), 503
 
-    job_id = uuid.uuid4().hex[:10]
-    job_dir = JOBS_DIR / job_id
-    job_dir.mkdir(parents=True, exist_ok=True)
-
     use_example = request.form.get("use_example") == "1"
-
-    if use_example:
-        image_path = "/app/examples/inference/example1.jpg"
-        audio_path = "/app/examples/inference/example1.wav"
-    else:
+    if not use_example:
         img = request.files.get("image")
         aud = request.files.get("audio")
         if not img or not aud:
             return jsonify({"error": "Image and audio files are required."}), 400
-        image_path = str(job_dir / "input.jpg")
-        audio_path = str(job_dir / "input.wav")
-        img.save(image_path)
-        aud.save(audio_path)
 
     duration = int(request.form.get("duration", 5))
     prompt = request.form.get(
@@ -332,13 +616,100 @@ def generate():
         "A realistic video of a person speaking directly to the camera.",
     )
 
-    job = Job(job_id, image_path, audio_path, duration, prompt)
-    jobs[job_id] = job
+    # Higher runs first; equal priorities run in submission order. Clamped to
+    # 0..MAX_PRIORITY so callers cannot jump the queue beyond what the server allows
+    try:
+        priority = int(request.form.get("priority", 0))
+    except ValueError:
+        return jsonify({"error": "Priority must be an integer."}), 400
+    priority = min(max(priority, 0), MAX_PRIORITY)
+
+    # Opt-in HLS delivery under /stream/<job_id>/ while the video is generated
+    stream = request.form.get("stream") == "1"
+
+    # Deterministic mode (a seed, or deterministic=1 for one derived from the
+    # inputs): identical requests are answered from the result cache
+    seed_text = request.form.get("seed", "").strip()
+    seed = key = None
+    if seed_text or request.form.get("deterministic") == "1":
+        try:
+            seed = int(seed_text) if seed_text else None
+        except ValueError:
+            return jsonify({"error": "Seed must be an integer."}), 400
+        if seed is not None and not 0 <= seed < 2 ** 63:
+            return jsonify({"error": "Seed must be between 0 and 2^63 - 1."}), 400
+        digests = (
+            _result_cache.file_digest(EXAMPLE_IMAGE if use_example else img.stream),
+            _result_cache.file_digest(EXAMPLE_AUDIO if use_example else aud.stream),
+        )
+        if seed is None:
+            seed = _result_cache.derived_seed(
+                _result_cache.result_key(*digests, prompt, duration, None, result_settings)
+            )
+        key = _result_cache.result_key(*digests, prompt, duration, seed, result_settings)
+        cached_path = result_cache.lookup(key)
+        if cached_path is not None:
+            job_id = uuid.uuid4().hex[:10]
+            job = Job(job_id, None, None, duration, prompt)
+            job.seed = seed
+            # registered (as queued) before the link so a budget check on the worker keeps it
+            jobs[job_id] = job
+            try:
+                link_or_copy(cached_path, job.output_path)
+            except FileNotFoundError:
+                # evicted since the lookup; generate it again
+                del jobs[job_id]
+            else:
+                job.status = "done"
+                job.progress = "Complete! (cached result)"
+                return jsonify({"job_id": job_id, "seed": seed, "cached": True})
+
+    # Reject before saving uploads; submit() re-checks under the queue lock
+    try:
+        scheduler.check_capacity()
+    except QueueFull as exc:
+        return _busy_response(exc.retry_after)
 
-    t = threading.Thread(target=run_inference, args=(job,), daemon=True)
-    t.start()
+    job_id = uuid.uuid4().hex[:10]
+    job_dir = JOBS_DIR / job_id
+    if use_example:
+        image_path = EXAMPLE_IMAGE
+        audio_path = EXAMPLE_AUDIO
+    else:
+        image_path = str(job_dir / "input.jpg")
+        audio_path = str(job_dir / "input.wav")
 
-    return jsonify({"job_id": job_id})
+    job = Job(job_id, image_path, audio_path, duration, prompt, stream)
+    job.seed = seed
+    job.result_key = key
+    # registered (as queued) before anything is written, so the jobs-dir budget check on the
+    # worker thread never deletes uploads in progress; the worker may also start it right away
+    jobs[job_id] = job
+    try:
+        job_dir.mkdir(parents=True, exist_ok=True)
+        if not use_example:
+            img.save(image_path)
+            aud.save(audio_path)
+        scheduler.submit(job, priority)
+    except QueueFull as exc:
+        jobs.pop(job_id, None)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return _busy_response(exc.retry_after)
+    except Exception:
+        jobs.pop(job_id, None)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    return jsonify({"job_id": job_id, "seed": seed, "cached": False, **_queue_info(job)})
+
+
+def _queue_info(job):
+    """Queue position (0 = next to run) and ETA in seconds, while queued or running."""
+    place = scheduler.position(job)
+    if place is None:
+        return {}
+    ahead, eta = place
+    return {"queue_position": ahead, "eta_seconds": round(eta)}
 
 
 @app.route("/status/<job_id>")
@@ -346,9 +717,52 @@ def status(job_id):
     job = jobs.get(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
+    info = _queue_info(job)
+    encoder = job.stream_encoder
+    if encoder is not None and encoder.first_segment_at is not None:
+        info["stream_url"] = f"/stream/{job.id}/{HLS_PLAYLIST}"
+        info["first_segment_seconds"] = round(encoder.first_segment_at - job.started_at, 2)
+    if job.seed is not None:
+        info["seed"] = job.seed
+    if job.feature_cache_saved is not None:
+        info["feature_cache_saved_seconds"] = job.feature_cache_saved
+    progress = job.progress
+    if job.status == "queued" and info:
+        progress = f"Queued ({info['queue_position']} ahead, about {info['eta_seconds']} s to finish)..."
     return jsonify(
-        {"status": job.status, "progress": job.progress, "error": job.error}
+        {"status": job.status, "progress": progress, "error": job.error, **info}
+    )
+
+
+@app.route("/stream/<job_id>")
+def stream_playlist(job_id):
+    # segment URIs in the playlist are relative to its directory
+    return redirect(f"/stream/{job_id}/{HLS_PLAYLIST}")
+
+
+@app.route("/stream/<job_id>/<name>")
+def stream_file(job_id, name):
+    job = jobs.get(job_id)
+    if not job or not job.stream:
+        return jsonify({"error": "Stream not found"}), 404
+    if not os.path.isfile(os.path.join(job.stream_dir, name)):
+        return jsonify({"error": "Not ready"}), 404
+    response = send_from_directory(
+        job.stream_dir, name, mimetype=STREAM_MIMETYPES.get(os.path.splitext(name)[1]), max_age=0
     )
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/cancel/<job_id>", methods=["POST"])
+def cancel(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if not scheduler.cancel(job):
+        return jsonify({"error": f"Job is {job.status}; only queued jobs can be cancelled."}), 409
+    shutil.rmtree(JOBS_DIR / job_id, ignore_errors=True)
+    return jsonify({"status": job.status})
 
 
 @app.route("/download/<job_id>")
@@ -367,5 +781,6 @@ def download(job_id):
 if __name__ == "__main__":
     print("[server] Loading models (this takes a few minutes)...")
     init_pipeline()
+    scheduler.start()
     print("[server] Starting web server on http://0.0.0.0:7860")
     app.run(host="0.0.0.0", port=7860, threaded=True)